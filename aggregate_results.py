@@ -0,0 +1,66 @@
+import argparse
+import concurrent.futures
+import os
+
+import experiments.benchmarks.benchmark as benchmark
+import experiments.benchmarks.result_store as result_store
+import experiments.benchmarks.visualization as visualization
+import experiments.models.model_factory as model_factory
+
+
+def save_merged_results(store, benchmark_name):
+    testing_table = store.get_testing_table(args.run_name, benchmark_name)
+    if testing_table.empty:
+        return None
+    testing_table.sort_values(testing_table.columns[5], inplace=True)
+    result_directory = os.path.join(args.result_folder_name, benchmark_name)
+    os.makedirs(result_directory, exist_ok=True)
+    testing_table.to_csv(os.path.join(result_directory, 'merged_results.csv'), index=False)
+    return testing_table
+
+
+def get_visualization_tasks(store, benchmark_name, testing_table):
+    visualization_directory = os.path.join(args.visualization_folder_name, benchmark_name)
+    # the learning rate is not plotted, the validation loss is the first validation column
+    training_columns = [x for x in store.get_metrics(args.run_name, benchmark_name, 'training') if x != 'learning rate']
+    testing_columns = [x for x in testing_table.columns if x.startswith('test')]
+    training_values = {x: store.get_training_values(args.run_name, benchmark_name, x) for x in training_columns}
+    tasks = []
+    for _, row in testing_table.iterrows():
+        model_name = row['model']
+        tasks.append((visualization.render_model_visualization,
+                      os.path.join(visualization_directory, f'{model_name}.pdf'),
+                      f'{model_name} @ {benchmark_name}_benchmark',
+                      {x: training_values[x][model_name] for x in training_columns},
+                      {x: float(row[x]) for x in testing_columns}))
+    val_loss_column = [x for x in training_columns if x.startswith('val')][0]
+    tasks.append((visualization.render_merged_visualization,
+                  os.path.join(visualization_directory, 'merged_visualizations.pdf'),
+                  f'validation loss evolution @ {benchmark_name}_benchmark',
+                  val_loss_column,
+                  [(x, training_values[val_loss_column][x]) for x in model_factory.MODEL_ARGUMENTS if x in training_values[val_loss_column]]))
+    return tasks
+
+
+# the script is guarded because the process pool may import it again in its workers
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--result_folder_name', default='results', type=str)
+    parser.add_argument('--visualization_folder_name', default='visualizations', type=str)
+    parser.add_argument('--run_name', default='default', type=str)
+    parser.add_argument('--benchmarks', default=','.join(benchmark.BENCHMARK_NAMES), type=str)
+    parser.add_argument('--render_plots', default=False, type=bool)
+    parser.add_argument('--plot_workers', default=os.cpu_count(), type=int)
+    args = parser.parse_args()
+
+    visualization_tasks = []
+    with result_store.ResultStore(result_store.get_result_store_path(args.result_folder_name)) as store:
+        for benchmark_name in args.benchmarks.split(','):
+            merged_testing_table = save_merged_results(store, benchmark_name)
+            if merged_testing_table is not None and args.render_plots:
+                visualization_tasks += get_visualization_tasks(store, benchmark_name, merged_testing_table)
+
+    if visualization_tasks:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.plot_workers) as executor:
+            for future in [executor.submit(*x) for x in visualization_tasks]:
+                future.result()
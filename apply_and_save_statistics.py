@@ -2,15 +2,22 @@
 each invocation of run_all_benchmarks_and_models.py generates these four folders in the project directory (assuming default arguments are used): results, saved_models, tensorboard and visualizations
 place these folders in a new folder called benchmark_logs/run_{i} where i is the run index after all folders have been manually validated
 then execute this script to generate statistics based on all available runs in folder benchmark_logs/statistics
+runs are ingested into benchmark_logs/statistics/results.sqlite once, only new or changed runs are read again
 """
 
 import argparse
+import csv
 import os
 
 import numpy as np
-import pandas as pd
 
 import experiments.benchmarks.benchmark as benchmark
+import experiments.benchmarks.result_store as result_store
+
+# two sided 95% critical values of the student t distribution for 1 to 30 degrees of freedom
+T_CRITICAL_VALUES = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+                     2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+                     2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--result_folder_name', default='results', type=str)
@@ -20,39 +27,85 @@ args = parser.parse_args()
 statistics_folder_path = os.path.join('benchmark_logs', 'statistics')
 os.makedirs(statistics_folder_path, exist_ok=True)
 
-available_runs = 0
-while os.path.exists(os.path.join('benchmark_logs', f'run_{available_runs}')):
-    available_runs += 1
-
-for benchmark_name in benchmark.BENCHMARK_NAMES:
-    result_tables = []
-    header = None
-    first_columns = None
-    for run_index in range(available_runs):
-        result_table = pd.read_csv(os.path.join('benchmark_logs', f'run_{run_index}', args.result_folder_name, benchmark_name, 'merged_results.csv'))
-        result_table.sort_values(result_table.columns[0], inplace=True)
-        current_header = result_table.columns.values.astype(str)
-        assert header is None or np.all(header == current_header)
-        header = current_header
-        data = result_table.values
-        current_first_columns = data[:, :2].astype(str)
-        assert first_columns is None or np.all(first_columns == current_first_columns)
-        first_columns = current_first_columns
-        result_tables.append(data[:, 2:].astype(np.float64))
-    assert result_tables and header is not None and first_columns is not None
-    merged_results = np.stack(result_tables, -1)
-    if merged_results.shape[1] > 4:
-        loss_column = -2
+
+def get_t_critical_value(degrees_of_freedom):
+    if degrees_of_freedom <= len(T_CRITICAL_VALUES):
+        return T_CRITICAL_VALUES[degrees_of_freedom - 1]
+    return 2.000 if degrees_of_freedom <= 60 else 1.980 if degrees_of_freedom <= 120 else 1.960
+
+
+def get_testing_csv_paths(run_result_path, benchmark_name):
+    merged_results_path = os.path.join(run_result_path, benchmark_name, 'merged_results.csv')
+    if os.path.exists(merged_results_path):
+        return [merged_results_path]
+    benchmark_result_path = os.path.join(run_result_path, benchmark_name)
+    if not os.path.isdir(benchmark_result_path):
+        return []
+    return [os.path.join(benchmark_result_path, x, 'testing.csv') for x in sorted(os.listdir(benchmark_result_path))
+            if os.path.exists(os.path.join(benchmark_result_path, x, 'testing.csv'))]
+
+
+def ingest_testing_csv(store, run, benchmark_name, csv_path):
+    with open(csv_path, newline='') as csv_file:
+        for row in csv.DictReader(csv_file):
+            model_name = row.pop('model')
+            store.insert_results(run, benchmark_name, model_name, {}, {x: float(y) for x, y in row.items()})
+
+
+def ingest_run(store, run_name, run_path):
+    # runs written since the result store exists are copied from it, older runs are read from their csv files
+    run_result_path = os.path.join(run_path, args.result_folder_name)
+    database_path = os.path.join(run_result_path, result_store.RESULT_STORE_FILE_NAME)
+    if os.path.exists(database_path):
+        sources = [(database_path, lambda: store.ingest_result_store(run_name, database_path))]
     else:
-        loss_column = -1
-    means = np.mean(merged_results, -1)
-    sort_order = means[:, loss_column].argsort()
-    sorted_means = np.round(means[sort_order], decimals=args.decimal_places)
-    sorted_first_columns = first_columns[sort_order]
-    formatted_means = np.char.mod(f'%.{args.decimal_places}f', sorted_means)
-    stds = np.std(merged_results, -1, ddof=1)
-    sorted_stds = np.round(stds[sort_order], decimals=args.decimal_places)
-    formatted_stds = np.char.mod(f'%.{args.decimal_places}f', sorted_stds)
-    merged_results_string = np.char.add(np.char.add(formatted_means, ' \u00b1 '), formatted_stds)
-    result_table = pd.DataFrame(np.concatenate((sorted_first_columns, merged_results_string), -1), columns=header)
-    result_table.to_csv(os.path.join(statistics_folder_path, f'{benchmark_name}.csv'), index=False)
+        sources = [(x, lambda x=x, y=y: ingest_testing_csv(store, f'{run_name}:csv', y, x))
+                   for y in benchmark.BENCHMARK_NAMES for x in get_testing_csv_paths(run_result_path, y)]
+    for source, ingest in sources:
+        modified = os.path.getmtime(source)
+        if not store.is_ingested(source, modified):
+            ingest()
+            store.set_ingested(source, modified)
+
+
+def save_statistics(store, benchmark_name):
+    statistics = store.get_testing_statistics(benchmark_name)
+    if not statistics:
+        return
+    models = list(dict.fromkeys(x[0] for x in statistics))
+    metrics = [x[0] for x in sorted({x[1]: x[2] for x in statistics}.items(), key=lambda x: x[1])]
+    model_indices = np.array([models.index(x[0]) for x in statistics])
+    metric_indices = np.array([metrics.index(x[1]) for x in statistics])
+    counts, means, squared_deviation_sums = (np.full((len(models), len(metrics)), np.nan) for _ in range(3))
+    for target, column in ((counts, 3), (means, 4), (squared_deviation_sums, 5)):
+        target[model_indices, metric_indices] = [x[column] for x in statistics]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stds = np.sqrt(squared_deviation_sums / (counts - 1))
+        half_widths = np.vectorize(lambda x: get_t_critical_value(int(x)) if x >= 1 else np.nan)(counts - 1) * stds / np.sqrt(counts)
+    loss_column = [x.startswith('test') for x in metrics].index(True)
+    sort_order = np.argsort(means[:, loss_column])
+    formatted_means = np.char.mod(f'%.{args.decimal_places}f', np.round(means, decimals=args.decimal_places))
+    formatted_stds = np.char.mod(f'%.{args.decimal_places}f', np.round(stds, decimals=args.decimal_places))
+    with open(os.path.join(statistics_folder_path, f'{benchmark_name}.csv'), 'w', newline='') as statistics_file:
+        writer = csv.writer(statistics_file, lineterminator='\n')
+        writer.writerow(['model'] + metrics)
+        for model_index in sort_order:
+            # the parameter count does not vary between runs
+            writer.writerow([models[model_index], f'{means[model_index, 0]:.0f}'] +
+                            [f'{x} ± {y}' for x, y in zip(formatted_means[model_index, 1:], formatted_stds[model_index, 1:])])
+    with open(os.path.join(statistics_folder_path, f'{benchmark_name}_confidence_intervals.csv'), 'w', newline='') as statistics_file:
+        writer = csv.writer(statistics_file, lineterminator='\n')
+        writer.writerow(['model', 'metric', 'runs', 'mean', 'std', '95% ci lower', '95% ci upper'])
+        for model_index in sort_order:
+            for metric_index, metric in enumerate(metrics):
+                if not np.isnan(counts[model_index, metric_index]):
+                    mean, half_width = means[model_index, metric_index], half_widths[model_index, metric_index]
+                    writer.writerow([models[model_index], metric, int(counts[model_index, metric_index]), mean, stds[model_index, metric_index],
+                                     mean - half_width, mean + half_width])
+
+
+with result_store.ResultStore(os.path.join(statistics_folder_path, result_store.RESULT_STORE_FILE_NAME)) as store:
+    for run_directory in sorted(x for x in os.listdir('benchmark_logs') if x.startswith('run_')):
+        ingest_run(store, run_directory, os.path.join('benchmark_logs', run_directory))
+    for benchmark_name in benchmark.BENCHMARK_NAMES:
+        save_statistics(store, benchmark_name)
@@ -0,0 +1,70 @@
+import argparse
+import importlib
+import os
+
+import numpy as np
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--benchmarks', default='add,walker', type=str)
+parser.add_argument('--models', default='unitary_rnn,matrix_exponential_unitary_rnn', type=str)
+parser.add_argument('--batch_size', default=128, type=int)
+parser.add_argument('--warmup_runs', default=5, type=int)
+parser.add_argument('--runs', default=20, type=int)
+parser.add_argument('--result_folder_name', default='results', type=str)
+args = parser.parse_args()
+
+import pandas as pd
+import tensorflow as tf
+
+import experiments.benchmarks.inference as inference
+
+
+def get_benchmark(benchmark_name, model_name):
+    benchmark_module = importlib.import_module(f'experiments.benchmarks.{benchmark_name}_benchmark')
+    benchmark_class = [x for x in vars(benchmark_module).values() if isinstance(x, type) and x.__module__ == benchmark_module.__name__][0]
+    benchmark = benchmark_class({'model': model_name, 'batch_size': args.batch_size, 'seed': 0})
+    benchmark.prepare_data()
+    return benchmark
+
+
+def get_train_step(benchmark, model):
+    loss = tf.keras.losses.get({'class_name': benchmark.args.loss_name, 'config': benchmark.args.loss_config})
+
+    @tf.function
+    def train_step(inputs, targets):
+        with tf.GradientTape() as tape:
+            loss_value = loss(targets, model(inputs, training=True))
+        return tape.gradient(loss_value, model.trainable_variables)
+
+    return train_step
+
+
+results = []
+for benchmark_name in args.benchmarks.split(','):
+    for model_name in args.models.split(','):
+        benchmark = get_benchmark(benchmark_name, model_name)
+        inputs = inference.get_batch(benchmark.test_input_data, args.batch_size)
+        targets = inference.get_batch(benchmark.test_output_data, args.batch_size)[0]
+        models, outputs = {}, {}
+        # both modes create the same weights in the same order, so the real model gets the weights of the complex one
+        for real_arithmetic in (False, True):
+            benchmark.args.model_config = {'real_arithmetic': real_arithmetic}
+            models[real_arithmetic] = benchmark.create_model(model_name, args.batch_size)
+        models[True].set_weights(models[False].get_weights())
+        for real_arithmetic, model in models.items():
+            predict = tf.function(lambda x, model=model: model(x, training=False))
+            outputs[real_arithmetic] = predict(inputs).numpy()
+            for mode, function, arguments in (('inference', predict, (inputs,)), ('training step', get_train_step(benchmark, model), (inputs, targets))):
+                latencies = inference.measure_latencies(function, arguments, args.warmup_runs, args.runs)
+                result = inference.summarize_latencies(model_name, mode, args.batch_size, latencies)
+                result.update({'benchmark': benchmark_name, 'arithmetic': 'real' if real_arithmetic else 'complex'})
+                results.append(result)
+        max_abs_difference = float(np.max(np.abs(outputs[True] - outputs[False])))
+        for result in results[-4:]:
+            result['max abs output difference'] = max_abs_difference
+        tf.keras.backend.clear_session()
+
+os.makedirs(args.result_folder_name, exist_ok=True)
+result_table = pd.DataFrame(results)
+result_table.to_csv(os.path.join(args.result_folder_name, 'real_arithmetic_comparison.csv'), index=False)
+print(result_table.to_string())
@@ -0,0 +1,54 @@
+import argparse
+import importlib
+import os
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--benchmarks', default='walker,activity', type=str)
+parser.add_argument('--models', default='lstm,ct_gru', type=str)
+parser.add_argument('--epochs', default=16, type=int)
+parser.add_argument('--batch_size', default=128, type=int)
+parser.add_argument('--chunk_length', default=64, type=int)
+parser.add_argument('--seed', default=0, type=int)
+parser.add_argument('--result_folder_name', default='results', type=str)
+args = parser.parse_args()
+
+import pandas as pd
+
+
+def get_benchmark_class(benchmark_name):
+    benchmark_module = importlib.import_module(f'experiments.benchmarks.{benchmark_name}_benchmark')
+    return [x for x in vars(benchmark_module).values() if isinstance(x, type) and x.__module__ == benchmark_module.__name__][0]
+
+
+def get_epoch_frames_and_targets(benchmark):
+    # the windowed mode runs every step of every training window and trains the last one, the stateful mode runs every
+    # step of the streams once, including the padding of the trajectories, and trains all of them except the padding and the
+    # last steps of the held out windows
+    if benchmark.args.training_mode == 'windowed':
+        return benchmark.training_samples * benchmark.training_input_data[0].shape[1], benchmark.training_samples
+    chunk_weights = benchmark.create_stateful_data()[2]
+    return chunk_weights.size, int(chunk_weights.sum())
+
+
+results = []
+for benchmark_name in args.benchmarks.split(','):
+    for model_name in args.models.split(','):
+        for training_mode in ('windowed', 'stateful'):
+            # both modes train from scratch on the same partition and are tested on the same test windows
+            benchmark = get_benchmark_class(benchmark_name)({'model': model_name, 'training_mode': training_mode, 'epochs': args.epochs,
+                                                             'batch_size': args.batch_size, 'chunk_length': args.chunk_length, 'seed': args.seed,
+                                                             'resume_training': False, 'run_name': f'{training_mode}_training'})
+            benchmark.run()
+            testing_table = pd.read_csv(os.path.join(benchmark.result_dir, model_name, 'testing.csv'))
+            epoch_frames, epoch_targets = get_epoch_frames_and_targets(benchmark)
+            epoch_duration = testing_table['training duration per epoch'].iloc[0]
+            result = {'benchmark': benchmark_name, 'model': model_name, 'training mode': training_mode, 'epochs': testing_table['epochs'].iloc[0],
+                      'training duration per epoch': epoch_duration, 'frames per epoch': epoch_frames, 'frames/s': epoch_frames / epoch_duration,
+                      'targets per epoch': epoch_targets, 'targets/s': epoch_targets / epoch_duration}
+            result.update({x: testing_table[x].iloc[0] for x in testing_table.columns if x.startswith('test ')})
+            results.append(result)
+
+os.makedirs(args.result_folder_name, exist_ok=True)
+result_table = pd.DataFrame(results)
+result_table.to_csv(os.path.join(args.result_folder_name, 'training_mode_comparison.csv'), index=False)
+print(result_table.to_string())
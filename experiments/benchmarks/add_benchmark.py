@@ -4,13 +4,14 @@ import experiments.benchmarks.benchmark as benchmark
 
 
 class AddBenchmark(benchmark.Benchmark):
-    def __init__(self):
+    def __init__(self, config=None):
         super().__init__('add',
                          (('--sequence_length', 100, int),
                           ('--samples', 40_000, int),
                           ('--loss_name', 'MeanSquaredError', str),
                           ('--loss_config', {}, dict),
-                          ('--metric_name', '', str)))
+                          ('--metric_name', '', str)),
+                         config)
 
     def get_data_and_output_size(self):
         sequence_length = self.args.sequence_length
@@ -29,4 +30,5 @@ class AddBenchmark(benchmark.Benchmark):
         return (input_sequences, time_sequences), (output_data,), 1
 
 
-AddBenchmark()
+if __name__ == '__main__':
+    AddBenchmark().run()
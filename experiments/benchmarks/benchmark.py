@@ -1,41 +1,80 @@
 import abc
 import argparse
-import math
+import json
 import os
 import shutil
-import time
 
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
 import numpy as np
-import pandas as pd
-import tensorflow as tf
 
+import experiments.benchmarks.result_store as result_store
 import experiments.models.model_factory as model_factory
 
 BENCHMARK_NAMES = ['cell', 'activity', 'add', 'memory', 'mnist', 'walker']
+TRAINING_MODES = ['windowed', 'stateful']
 
 
 class Benchmark(abc.ABC):
-    def __init__(self, name, parser_configs):
+    def __init__(self, name, parser_configs, config=None):
         self.name = name
         assert self.name in BENCHMARK_NAMES
-        self.args = self.get_args(parser_configs)
-        self.saved_model_dir, self.tensorboard_dir, self.supplementary_data_dir, self.result_dir, self.visualization_dir = self.create_directories()
+        self.args = self.get_args(parser_configs, config)
+        assert self.args.training_mode in TRAINING_MODES
+        # benchmarks built from trajectories set these in cut_trajectories, the stateful training mode needs them
+        self.trajectories = None
+        self.window_ends = None
+        self.saved_model_dir, self.tensorboard_dir, self.supplementary_data_dir, self.result_dir, self.visualization_dir, self.export_dir, self.checkpoint_dir = self.create_directories()
+
+    def prepare_data(self):
+        # tensorflow and the benchmark helpers are imported after the arguments are parsed to keep --h and argument errors fast
+        import tensorflow as tf
+        import experiments.benchmarks.callbacks as callbacks
+        import experiments.benchmarks.distribution as distribution
+        if self.args.seed >= 0:
+            np.random.seed(self.args.seed)
+            tf.random.set_seed(self.args.seed)
+        self.strategy = distribution.create_strategy(self.args)
+        self.global_batch_size = self.args.batch_size * self.strategy.num_replicas_in_sync
+        self.model_names = self.get_model_names()
+        self.training_state = self.load_resumable_training_state(self.model_names[0])
+        if self.training_state is not None:
+            np.random.set_state(callbacks.deserialize_random_state(self.training_state['initial_random_state']))
+        self.initial_random_state = np.random.get_state()
         self.input_data, self.output_data, self.output_size = self.get_data_and_output_size()
         self.data_samples = self.shuffle_data_and_return_sample_amount()
-        self.inputs = tuple((tf.keras.Input(shape=x.shape[1:], batch_size=self.args.batch_size) for x in self.input_data))
         self.test_samples, self.validation_samples, self.training_samples = self.compute_sample_partition()
         self.test_input_data, self.validation_input_data, self.training_input_data = self.process_data(self.input_data)
         self.test_output_data, self.validation_output_data, self.training_output_data = self.process_data(self.output_data)
-        self.train_and_test()
+        self.partition_random_state = np.random.get_state()
+        self.check_directories()
+
+    def run(self):
+        self.prepare_data()
+        if self.args.mode == 'train':
+            self.train_and_test_models()
+        elif self.args.mode == 'inference':
+            import experiments.benchmarks.inference as inference
+            inference.measure_inference_latencies(self)
+        elif self.args.mode == 'export':
+            import experiments.benchmarks.export as export
+            export.export_serving_artifacts(self)
+        elif self.args.mode == 'quantize':
+            import experiments.benchmarks.quantization as quantization
+            quantization.quantize_models(self)
+        else:
+            raise NotImplementedError
 
     @staticmethod
-    def get_args(parser_configs):
+    def get_args(parser_configs, config=None):
         parser = argparse.ArgumentParser()
         parser.add_argument('--model', default=model_factory.MODEL_ARGUMENTS[0], type=str)
+        parser.add_argument('--model_config', default='{}', type=model_factory.load_model_config)
+        parser.add_argument('--models', default='', type=str)
         parser.add_argument('--epochs', default=128, type=int)
         parser.add_argument('--batch_size', default=128, type=int)
+        parser.add_argument('--dynamic_batch_size', default=False, type=bool)
+        parser.add_argument('--training_mode', default='windowed', type=str)
+        parser.add_argument('--chunk_length', default=64, type=int)
+        parser.add_argument('--remat_segment_length', default=0, type=int)
         parser.add_argument('--optimizer_name', default='adam', type=str)
         parser.add_argument('--learning_rate', default=1E-3, type=float)
         parser.add_argument('--use_saved_model', default=False, type=bool)
@@ -49,12 +88,36 @@ class Benchmark(abc.ABC):
         parser.add_argument('--tensorboard_folder_name', default='tensorboard', type=str)
         parser.add_argument('--supplementary_data_folder_name', default='supplementary_data', type=str)
         parser.add_argument('--result_folder_name', default='results', type=str)
+        parser.add_argument('--run_name', default='default', type=str)
         parser.add_argument('--visualization_folder_name', default='visualizations', type=str)
+        parser.add_argument('--export_folder_name', default='exports', type=str)
+        parser.add_argument('--checkpoint_folder_name', default='checkpoints', type=str)
         parser.add_argument('--use_time_input', default=False, type=bool)
+        parser.add_argument('--resume_training', default=True, type=bool)
+        parser.add_argument('--training_state_interval', default=1, type=int)
+        parser.add_argument('--seed', default=-1, type=int)
+        parser.add_argument('--distribution', default='none', type=str)
+        parser.add_argument('--replicas', default=2, type=int)
+        parser.add_argument('--worker_addresses', default='', type=str)
+        parser.add_argument('--worker_index', default=0, type=int)
+        parser.add_argument('--mode', default='train', type=str)
+        parser.add_argument('--inference_max_batch_size', default=1024, type=int)
+        parser.add_argument('--inference_warmup_runs', default=10, type=int)
+        parser.add_argument('--inference_runs', default=100, type=int)
+        parser.add_argument('--export_batch_size', default=1, type=int)
+        parser.add_argument('--calibration_samples', default=256, type=int)
+        parser.add_argument('--quantization_samples', default=1024, type=int)
         for parser_config in parser_configs:
             argument_name, default, cls = parser_config
             parser.add_argument(argument_name, default=default, type=cls)
-        return parser.parse_args()
+        if config is None:
+            return parser.parse_args()
+        # a config dict replaces the command line, string values are converted like command line values
+        unknown_keys = sorted(set(config) - set(vars(parser.parse_args([]))))
+        if unknown_keys:
+            raise ValueError(f'unknown config keys {unknown_keys}')
+        parser.set_defaults(**config)
+        return parser.parse_args([])
 
     def create_directories(self):
         project_directory = os.getcwd()
@@ -63,16 +126,65 @@ class Benchmark(abc.ABC):
         supplementary_data_directory = os.path.join(project_directory, self.args.supplementary_data_folder_name, self.name)
         result_directory = os.path.join(project_directory, self.args.result_folder_name, self.name)
         visualization_directory = os.path.join(project_directory, self.args.visualization_folder_name, self.name)
-        return saved_model_directory, tensorboard_directory, supplementary_data_directory, result_directory, visualization_directory
+        export_directory = os.path.join(project_directory, self.args.export_folder_name, self.name)
+        checkpoint_directory = os.path.join(project_directory, self.args.checkpoint_folder_name, self.name)
+        return saved_model_directory, tensorboard_directory, supplementary_data_directory, result_directory, visualization_directory, export_directory, checkpoint_directory
+
+    def get_training_state_dir(self, model_name):
+        import experiments.benchmarks.distribution as distribution
+        return os.path.join(distribution.get_worker_directory(self.strategy, os.path.join(self.checkpoint_dir, model_name)), 'training_state')
+
+    def get_model_names(self):
+        model_names = self.args.models.split(',') if self.args.models != '' else [self.args.model]
+        for model_name in model_names:
+            assert model_name in model_factory.MODEL_ARGUMENTS
+        # a model config only fits the model it was written for
+        assert len(model_names) == 1 or not self.args.model_config
+        return model_names
+
+    def load_resumable_training_state(self, model_name):
+        if self.args.mode != 'train' or not self.args.resume_training or self.args.use_saved_model:
+            return None
+        import experiments.benchmarks.callbacks as callbacks
+        training_state = callbacks.load_training_state(self.get_training_state_dir(model_name))
+        if training_state is None or training_state['stopped'] or training_state['epoch'] >= self.args.epochs:
+            return None
+        if hasattr(self, 'initial_random_state') and training_state['initial_random_state'] != callbacks.serialize_random_state(self.initial_random_state):
+            print(f'training state of {model_name} was created with a different data partition, training starts from scratch')
+            return None
+        return training_state
 
     @abc.abstractmethod
     def get_data_and_output_size(self):
         raise NotImplementedError
 
+    def cut_trajectories(self, trajectories, sequence_length, sample_distance, max_samples):
+        """Cut trajectories of (inputs, outputs) tuples of per step arrays into windows of sequence_length steps every
+        sample_distance steps, the output of a window is the output of its last step. The trajectories are kept up to the
+        last step of the last of the first max_samples windows.
+        """
+        windows, window_ends = [], []
+        for trajectory_index, (inputs, outputs) in enumerate(trajectories):
+            for start_index in range(0, len(outputs[0]) - sequence_length + 1, sample_distance):
+                end_index = start_index + sequence_length
+                windows.append(tuple(x[start_index:end_index] for x in inputs) + tuple(x[end_index - 1] for x in outputs))
+                window_ends.append((trajectory_index, end_index - 1))
+        windows, self.window_ends = windows[:max_samples], np.array(window_ends[:max_samples])
+        trajectory_lengths = {}
+        for trajectory_index, end_index in self.window_ends:
+            trajectory_lengths[trajectory_index] = end_index + 1
+        self.trajectories = [tuple(tuple(x[:length] for x in data) for data in trajectories[trajectory_index])
+                             for trajectory_index, length in trajectory_lengths.items()]
+        self.window_ends[:, 0] = np.searchsorted(list(trajectory_lengths), self.window_ends[:, 0])
+        window_data = [np.stack(x) for x in zip(*windows)]
+        input_amount = len(trajectories[0][0])
+        return tuple(window_data[:input_amount]), tuple(window_data[input_amount:])
+
     def shuffle_data_and_return_sample_amount(self):
         data_samples = None
         random_integer = np.random.randint(2 ** 30)
-        for dataset in self.input_data + self.output_data:
+        # the window ends are shuffled like the windows
+        for dataset in self.input_data + self.output_data + (() if self.window_ends is None else (self.window_ends,)):
             np.random.default_rng(random_integer).shuffle(dataset)
             data_samples = len(dataset)
         for dataset in self.input_data + self.output_data:
@@ -80,12 +192,14 @@ class Benchmark(abc.ABC):
         return data_samples
 
     def compute_sample_partition(self):
+        # models with a fixed batch size only get full batches, models with a dynamic batch size get all samples
+        remainder_batch_size = 1 if self.args.dynamic_batch_size else self.global_batch_size
         test_samples = int(self.data_samples * self.args.test_data_percentage)
-        test_samples -= test_samples % self.args.batch_size
+        test_samples -= test_samples % remainder_batch_size
         validation_samples = int(self.data_samples * self.args.validation_data_percentage)
-        validation_samples -= validation_samples % self.args.batch_size
+        validation_samples -= validation_samples % remainder_batch_size
         training_samples = self.data_samples - test_samples - validation_samples
-        training_samples -= training_samples % self.args.batch_size
+        training_samples -= training_samples % remainder_batch_size
         assert test_samples > 0 and validation_samples > 0 and training_samples > 0
         return test_samples, validation_samples, training_samples
 
@@ -96,10 +210,10 @@ class Benchmark(abc.ABC):
         return test_data, validation_data, training_data
 
     def check_directories(self):
-        shutil.rmtree(os.path.join(self.tensorboard_dir, self.args.model), ignore_errors=True)
         for model_name in model_factory.MODEL_ARGUMENTS:
             os.makedirs(os.path.join(self.saved_model_dir, model_name), exist_ok=True)
             os.makedirs(os.path.join(self.tensorboard_dir, model_name), exist_ok=True)
+            os.makedirs(os.path.join(self.checkpoint_dir, model_name), exist_ok=True)
             os.makedirs(os.path.join(self.result_dir, model_name), exist_ok=True)
             os.makedirs(os.path.join(self.visualization_dir), exist_ok=True)
 
@@ -117,12 +231,14 @@ class Benchmark(abc.ABC):
             corrected_names.append(name.replace('loss', loss_name).replace('lr', lr_name).replace('_', ' '))
         return corrected_names
 
-    def create_and_save_tables(self, model, fit_result, evaluate_result, training_duration):
-        fit_results = list(fit_result.history.items())
+    def create_and_save_tables(self, model, history, evaluate_result, training_duration):
+        import pandas as pd
+        fit_results = list(history.items())
         fit_header = self.correct_names([x[0] for x in fit_results], train=True, model=model)
         fit_data = np.array([x[1] for x in fit_results])
         fit_table = pd.DataFrame(data=fit_data.T, columns=fit_header)
         fit_table.to_csv(os.path.join(self.result_dir, self.args.model, 'training.csv'), index=False)
+        training_results = {x: fit_table[x].tolist() for x in fit_table.columns}
         fit_table.drop(fit_table.columns[-1], axis=1, inplace=True)
         evaluate_results = list(evaluate_result.items())
         evaluate_header = self.correct_names([x[0] for x in evaluate_results], train=False, model=model)
@@ -134,125 +250,248 @@ class Benchmark(abc.ABC):
         evaluate_table.insert(3, 'training duration per epoch', training_duration / fit_table.shape[0])
         evaluate_table.insert(4, 'epochs', fit_table.shape[0])
         evaluate_table.to_csv(os.path.join(self.result_dir, self.args.model, 'testing.csv'), index=False)
+        with result_store.ResultStore(result_store.get_result_store_path(self.args.result_folder_name)) as store:
+            store.insert_results(self.args.run_name, self.name, self.args.model, training_results,
+                                 {x: evaluate_table[x].iloc[0] for x in evaluate_table.columns[1:]})
         evaluate_table.drop(evaluate_table.columns[:5], axis=1, inplace=True)
         return fit_table, evaluate_table
 
-    def create_visualization(self, fit_table, evaluate_table):
-        x_data = np.array(range(1, fit_table.shape[0] + 1))
-        figure, first_axis = plt.subplots()
-        first_axis.set_xlabel('epochs')
-        first_axis.set_ylabel(' '.join(evaluate_table.columns[0].split()[1:]))
-        first_axis.xaxis.set_major_locator(ticker.MaxNLocator(integer=True))
-        first_axis.yaxis.set_major_locator(ticker.AutoLocator())
-        first_axis.set_title(f'{self.args.model} @ {self.name}_benchmark')
-        first_axis.set_prop_cycle(color=['red', 'green'])
+    def get_model_batch_size(self, batch_size):
+        return None if self.args.dynamic_batch_size else batch_size
+
+    def get_model_config(self, model_name):
+        model_config = self.args.model_config
+        # the configs of models without a recurrent layer that rematerialises segments reject the key
+        if self.args.remat_segment_length and model_factory.has_config_field(model_name, 'remat_segment_length'):
+            model_config = {**model_config, 'remat_segment_length': self.args.remat_segment_length}
+        return model_config
+
+    def save_model_config(self, model_name, model_save_location):
+        # the inference, export and quantize modes rebuild the saved model with the config it was trained with
+        with open(os.path.join(model_save_location, 'model_config.json'), 'w') as config_file:
+            json.dump(self.get_model_config(model_name), config_file)
+
+    def load_saved_model_config(self, model_name):
+        config_path = os.path.join(self.saved_model_dir, model_name, 'model_config.json')
+        if not os.path.isfile(config_path):
+            # models saved without their config are rebuilt with the current one
+            return self.get_model_config(model_name)
+        return model_factory.load_model_config(config_path)
+
+    def create_model(self, model_name, batch_size, model_config=None):
+        import tensorflow as tf
+        inputs = tuple((tf.keras.Input(shape=x.shape[1:], batch_size=batch_size) for x in self.input_data))
+        inputs_slice = slice(None) if self.args.use_time_input or len(inputs) == 1 else slice(-1)
+        if model_config is None:
+            if self.args.remat_segment_length and not model_factory.has_config_field(model_name, 'remat_segment_length'):
+                print(f'--remat_segment_length is ignored for {model_name}, it does not run in a RecurrentLayer')
+            model_config = self.get_model_config(model_name)
+        return tf.keras.Model(inputs=inputs,
+                              outputs=model_factory.get_model_output_by_name(model_name, self.output_size, inputs[inputs_slice], model_config),
+                              name=model_name)
+
+    def train_and_test_models(self):
+        import tensorflow as tf
+        for index, model_name in enumerate(self.model_names):
+            self.args.model = model_name
+            if index > 0:
+                tf.keras.backend.clear_session()
+                if self.args.seed >= 0:
+                    tf.random.set_seed(self.args.seed)
+                self.training_state = self.load_resumable_training_state(model_name)
+            # every model starts from the random state a separate process would have after partitioning the data
+            np.random.set_state(self.partition_random_state)
+            self.train_and_test()
+
+    def get_model_locations(self, model_name):
+        import experiments.benchmarks.distribution as distribution
+        model_save_location = distribution.get_worker_directory(self.strategy, os.path.join(self.saved_model_dir, model_name))
+        best_weights_location = os.path.join(distribution.get_worker_directory(self.strategy, os.path.join(self.checkpoint_dir, model_name)), 'best_weights.npz')
+        tensorboard_save_location = distribution.get_worker_directory(self.strategy, os.path.join(self.tensorboard_dir, model_name))
+        return model_save_location, best_weights_location, tensorboard_save_location
+
+    def compile_model(self, model):
+        import tensorflow as tf
+        import experiments.models.recurrent_layer as recurrent_layer
+        optimizer = tf.keras.optimizers.get({'class_name': self.args.optimizer_name,
+                                             'config': {'learning_rate': self.args.learning_rate}})
+        loss = tf.keras.losses.get({'class_name': self.args.loss_name,
+                                    'config': self.args.loss_config})
         if self.args.metric_name == '':
-            axes = [first_axis]
+            metric = None
         else:
-            second_axis = first_axis.twinx()
-            second_axis.set_prop_cycle(color=['blue', 'orange'])
-            second_axis.yaxis.set_major_locator(ticker.AutoLocator())
-            second_axis.set_ylabel(' '.join(evaluate_table.columns[1].split()[1:]))
-            axes = [first_axis, second_axis]
-        hline_colors = ['black', 'grey']
-        legend_positions = ['center left', 'center right']
-        for index, column in enumerate(fit_table.columns):
-            axes[index % len(axes)].plot(x_data, fit_table[column].tolist(), label=column)
-        for index, column in enumerate(evaluate_table.columns):
-            axes[index % len(axes)].hlines(evaluate_table[column].tolist(), x_data[0], x_data[-1], label=column, linestyles='dashed', colors=hline_colors[index % len(hline_colors)])
-        for index, axis in enumerate(axes):
-            legend = axis.legend(loc=legend_positions[index % len(legend_positions)], prop={'size': 6})
-            legend.remove()
-            axes[-1].add_artist(legend)
-        plt.tight_layout()
-        plt.savefig(os.path.join(self.visualization_dir, f'{self.args.model}.pdf'))
-        plt.close()
-
-    def accumulate_data(self):
-        testing_data = []
-        for model_name in model_factory.MODEL_ARGUMENTS:
-            test_results_path = os.path.join(self.result_dir, model_name, 'testing.csv')
-            if os.path.exists(test_results_path):
-                testing_table = pd.read_csv(test_results_path)
-                testing_data.append(testing_table)
-        merged_testing_table = pd.concat(testing_data)
-        merged_testing_table.sort_values(merged_testing_table.columns[5], inplace=True)
-        merged_testing_table.to_csv(os.path.join(self.result_dir, 'merged_results.csv'), index=False)
-        val_loss_data = []
-        val_loss_column = ''
-        for model_name in model_factory.MODEL_ARGUMENTS:
-            training_results_path = os.path.join(self.result_dir, model_name, 'training.csv')
-            if os.path.exists(training_results_path):
-                training_table = pd.read_csv(training_results_path)
-                val_loss_column = training_table.columns[1] if self.args.metric_name == '' else training_table.columns[2]
-                val_loss_data.append((model_name, training_table[val_loss_column].tolist()))
-        max_len = max([len(x[1]) for x in val_loss_data])
-        x_data = np.array(range(1, max_len + 1))
-        fig, axis = plt.subplots()
-        axis.set_title(f'validation loss evolution @ {self.name}_benchmark')
-        axis.set_xlabel('epochs')
-        axis.set_ylabel(' '.join(val_loss_column.split()[1:]))
-        axis.xaxis.set_major_locator(ticker.MaxNLocator(integer=True))
-        color_cycle = plt.rcParams['axes.prop_cycle'].by_key()['color']
-        axis.set_prop_cycle(color=color_cycle * 2, linestyle=['solid'] * len(color_cycle) + ['dashed'] * len(color_cycle))
-        axis.set_yscale('log')
-        axis.yaxis.set_major_locator(ticker.LogLocator(subs=(1, 2, 5)))
-        axis.yaxis.set_major_formatter(ticker.LogFormatterSciNotation(minor_thresholds=(math.inf, math.inf)))
-        for model_name, val_losses in val_loss_data:
-            axis.plot(x_data[:len(val_losses)], val_losses, label=model_name)
-        axis.legend(loc='upper right', prop={'size': 6})
-        plt.tight_layout()
-        plt.savefig(os.path.join(self.visualization_dir, 'merged_visualizations.pdf'))
-        plt.close()
+            metric = tf.keras.metrics.get(self.args.metric_name)
+        model.compile(optimizer=optimizer, loss=loss, metrics=metric, run_eagerly=self.args.debug,
+                      jit_compile=recurrent_layer.requires_jit_compile(model) and not self.args.debug)
 
-    def train_and_test(self):
-        self.check_directories()
+    def build_model(self):
+        import tensorflow as tf
         model_name = self.args.model
         assert model_name in model_factory.MODEL_ARGUMENTS
-        model_save_location = os.path.join(self.saved_model_dir, model_name)
-        tensorboard_save_location = os.path.join(self.tensorboard_dir, model_name)
-        if self.args.use_saved_model:
-            model = tf.keras.models.load_model(model_save_location)
-        else:
-            inputs_slice = slice(None) if self.args.use_time_input or len(self.inputs) == 1 else slice(-1)
-            model = tf.keras.Model(inputs=self.inputs,
-                                   outputs=model_factory.get_model_output_by_name(self.args.model, self.output_size, self.inputs[inputs_slice]),
-                                   name=model_name)
-            optimizer = tf.keras.optimizers.get({'class_name': self.args.optimizer_name,
-                                                 'config': {'learning_rate': self.args.learning_rate}})
-            loss = tf.keras.losses.get({'class_name': self.args.loss_name,
-                                        'config': self.args.loss_config})
-            if self.args.metric_name == '':
-                metric = None
+        with self.strategy.scope():
+            if self.args.use_saved_model:
+                model_factory.import_model_modules(model_name)
+                model = tf.keras.models.load_model(os.path.join(self.saved_model_dir, model_name))
             else:
-                metric = tf.keras.metrics.get(self.args.metric_name)
-            model.compile(optimizer=optimizer, loss=loss, metrics=metric, run_eagerly=self.args.debug)
+                model = self.create_model(model_name, self.get_model_batch_size(self.args.batch_size))
+                self.compile_model(model)
         model.summary()
         if self.args.debug:
             sample_output = model.predict(tuple((x[:self.args.batch_size] for x in self.training_input_data)))
             sample_loss = model.loss(tuple((x[:self.args.batch_size] for x in self.training_output_data)), sample_output).numpy()
             assert not tf.math.is_nan(sample_loss)
-        training_start = time.time()
-        fit_result = model.fit(
-            x=self.training_input_data,
-            y=self.training_output_data,
-            batch_size=self.args.batch_size,
+        return model
+
+    def fit(self, model):
+        if self.training_state is None:
+            shutil.rmtree(os.path.join(self.tensorboard_dir, self.args.model), ignore_errors=True)
+        if self.args.training_mode == 'stateful':
+            return self.fit_stateful(model)
+        return self.fit_windowed(model)
+
+    def fit_windowed(self, model):
+        import tensorflow as tf
+        import experiments.benchmarks.callbacks as callbacks
+        import experiments.benchmarks.distribution as distribution
+        model_save_location, best_weights_location, tensorboard_save_location = self.get_model_locations(self.args.model)
+        drop_remainder = not self.args.dynamic_batch_size
+        training_dataset = distribution.create_dataset(self.training_input_data, self.training_output_data, self.global_batch_size, np.random.randint(2 ** 30), drop_remainder)
+        validation_dataset = distribution.create_dataset(self.validation_input_data, self.validation_output_data, self.global_batch_size, drop_remainder=drop_remainder)
+        best_weights_checkpoint = callbacks.BestWeightsCheckpoint(best_weights_location)
+        early_stopping = tf.keras.callbacks.EarlyStopping(patience=self.args.no_improvement_abort_patience, min_delta=self.args.min_delta)
+        reduce_lr_on_plateau = tf.keras.callbacks.ReduceLROnPlateau(patience=self.args.no_improvement_lr_patience, min_delta=self.args.min_delta)
+        training_state_checkpoint = callbacks.TrainingStateCheckpoint(self.get_training_state_dir(self.args.model), self.initial_random_state,
+                                                                      (best_weights_checkpoint, early_stopping, reduce_lr_on_plateau),
+                                                                      self.training_state, self.args.training_state_interval)
+        model.fit(
+            training_dataset,
             epochs=self.args.epochs,
-            validation_data=(self.validation_input_data, self.validation_output_data),
-            callbacks=(tf.keras.callbacks.ModelCheckpoint(model_save_location, save_best_only=True),
-                       tf.keras.callbacks.EarlyStopping(patience=self.args.no_improvement_abort_patience, min_delta=self.args.min_delta),
+            initial_epoch=0 if self.training_state is None else self.training_state['epoch'],
+            validation_data=validation_dataset,
+            callbacks=(best_weights_checkpoint,
+                       early_stopping,
                        tf.keras.callbacks.TerminateOnNaN(),
-                       tf.keras.callbacks.ReduceLROnPlateau(patience=self.args.no_improvement_lr_patience, min_delta=self.args.min_delta),
-                       tf.keras.callbacks.TensorBoard(log_dir=tensorboard_save_location)))
-        training_end = time.time()
-        training_duration = training_end - training_start
-        model = tf.keras.models.load_model(model_save_location)
-        evaluate_result = model.evaluate(
-            x=self.test_input_data,
-            y=self.test_output_data,
+                       reduce_lr_on_plateau,
+                       tf.keras.callbacks.TensorBoard(log_dir=tensorboard_save_location),
+                       training_state_checkpoint))
+        model.save(model_save_location)
+        self.save_model_config(self.args.model, model_save_location)
+        return training_state_checkpoint.history, training_state_checkpoint.training_duration
+
+    def create_stateful_model(self, model):
+        """Copy of the model whose recurrent layers keep their states between batches of batch_size chunks of
+        chunk_length steps and return the outputs of all steps.
+        """
+        import tensorflow as tf
+        import experiments.models.streaming as streaming
+        rnn_layer_names = [x.name for x in model.layers if isinstance(x, tf.keras.layers.RNN)]
+        if not rnn_layer_names or len(rnn_layer_names) != len(streaming.get_recurrent_layers(model)):
+            raise ValueError(f'stateful training requires recurrent layers at the top level of the model, {model.name} has none or nested ones')
+        # keras casts the states of stateful layers to floats
+        for layer in model.layers:
+            if layer.name in rnn_layer_names and any(x.dtype.is_complex for x in tf.nest.flatten(layer.cell.get_initial_state(batch_size=1, dtype=tf.float32))):
+                raise ValueError(f'stateful training requires real states, {layer.cell.name} of {model.name} has complex ones (use real_arithmetic)')
+        config = model.get_config()
+        for layer in config['layers']:
+            if layer['class_name'] == 'InputLayer':
+                layer['config']['batch_input_shape'] = (self.args.batch_size, self.args.chunk_length) + tuple(layer['config']['batch_input_shape'][2:])
+            elif layer['config']['name'] in rnn_layer_names:
+                layer['config'].update(stateful=True, return_sequences=True)
+        stateful_model = tf.keras.Model.from_config(config)
+        stateful_model.set_weights(model.get_weights())
+        self.compile_model(stateful_model)
+        return stateful_model
+
+    def create_stateful_data(self):
+        """Pad the trajectories to whole chunks with steps of zero weight, concatenate them and split them into batch_size
+        contiguous streams, batch k holds chunk k of every stream. Every step is a training target once per epoch, except
+        for the padding and the last steps of the validation and test windows.
+
+        Returns:
+            Tuple: input chunks, output chunks, the sample weights of their steps and whether a chunk starts a trajectory
+        """
+        chunk_length = self.args.chunk_length
+        weights = [np.ones(len(outputs[0])) for _, outputs in self.trajectories]
+        for trajectory_index, end_index in self.window_ends[:self.test_samples + self.validation_samples]:
+            weights[trajectory_index][end_index] = 0
+        # no chunk spans two trajectories, so that the states can be reset at the start of a trajectory
+        padded_trajectories = []
+        for (inputs, outputs), trajectory_weights in zip(self.trajectories, weights):
+            padding = -len(trajectory_weights) % chunk_length
+            padded_trajectories.append([np.concatenate((x, np.zeros((padding,) + x.shape[1:], x.dtype))) for x in inputs + outputs + (trajectory_weights,)])
+        streams = [np.concatenate(x) for x in zip(*padded_trajectories)]
+        trajectory_starts = np.zeros(len(streams[-1]) // chunk_length, bool)
+        trajectory_starts[np.cumsum([0] + [len(x[-1]) // chunk_length for x in padded_trajectories[:-1]])] = True
+        chunks = len(trajectory_starts) // self.args.batch_size
+        assert chunks > 0
+        stream_length = chunks * chunk_length
+        chunk_data = [x[:self.args.batch_size * stream_length].reshape((self.args.batch_size, chunks, chunk_length) + x.shape[1:])
+                      .swapaxes(0, 1).reshape((-1, chunk_length) + x.shape[1:]) for x in streams]
+        chunk_starts = trajectory_starts[:self.args.batch_size * chunks].reshape((self.args.batch_size, chunks)).swapaxes(0, 1).reshape(-1)
+        input_amount = len(self.input_data)
+        return tuple(chunk_data[:input_amount]), tuple(chunk_data[input_amount:-1]), chunk_data[-1], chunk_starts
+
+    def fit_stateful(self, model):
+        """Train a stateful copy of the model with truncated backpropagation through time on the chunks of
+        create_stateful_data and validate it on the validation windows, the model gets the trained weights.
+        """
+        import tensorflow as tf
+        import experiments.benchmarks.callbacks as callbacks
+        import experiments.benchmarks.distribution as distribution
+        if self.trajectories is None or self.args.distribution != 'none' or self.args.dynamic_batch_size:
+            raise ValueError('stateful training requires a benchmark of trajectories without distribution and dynamic batch size')
+        model_save_location, best_weights_location, tensorboard_save_location = self.get_model_locations(self.args.model)
+        stateful_model = self.create_stateful_model(model)
+        input_chunks, output_chunks, chunk_weights, chunk_starts = self.create_stateful_data()
+        validation_dataset = distribution.create_dataset(self.validation_input_data, self.validation_output_data, self.global_batch_size)
+        best_weights_checkpoint = callbacks.BestWeightsCheckpoint(best_weights_location)
+        early_stopping = tf.keras.callbacks.EarlyStopping(patience=self.args.no_improvement_abort_patience, min_delta=self.args.min_delta)
+        reduce_lr_on_plateau = tf.keras.callbacks.ReduceLROnPlateau(patience=self.args.no_improvement_lr_patience, min_delta=self.args.min_delta)
+        training_state_checkpoint = callbacks.TrainingStateCheckpoint(self.get_training_state_dir(self.args.model), self.initial_random_state,
+                                                                      (best_weights_checkpoint, early_stopping, reduce_lr_on_plateau),
+                                                                      self.training_state, self.args.training_state_interval)
+        # the chunks are fed in order, consecutive batches continue the streams of the previous batch
+        stateful_model.fit(
+            input_chunks,
+            output_chunks,
+            sample_weight=chunk_weights,
             batch_size=self.args.batch_size,
+            shuffle=False,
+            epochs=self.args.epochs,
+            initial_epoch=0 if self.training_state is None else self.training_state['epoch'],
+            callbacks=(callbacks.TrajectoryStateReset(chunk_starts.reshape((-1, self.args.batch_size))),
+                       callbacks.WindowedValidation(model, validation_dataset),
+                       best_weights_checkpoint,
+                       early_stopping,
+                       tf.keras.callbacks.TerminateOnNaN(),
+                       reduce_lr_on_plateau,
+                       tf.keras.callbacks.TensorBoard(log_dir=tensorboard_save_location),
+                       training_state_checkpoint))
+        model.set_weights(stateful_model.get_weights())
+        model.save(model_save_location)
+        self.save_model_config(self.args.model, model_save_location)
+        return training_state_checkpoint.history, training_state_checkpoint.training_duration
+
+    def evaluate(self, model):
+        import tensorflow as tf
+        import experiments.benchmarks.distribution as distribution
+        _, _, tensorboard_save_location = self.get_model_locations(self.args.model)
+        test_dataset = distribution.create_dataset(self.test_input_data, self.test_output_data, self.global_batch_size, drop_remainder=not self.args.dynamic_batch_size)
+        return model.evaluate(
+            test_dataset,
             callbacks=(tf.keras.callbacks.TensorBoard(log_dir=tensorboard_save_location)),
             return_dict=True)
-        fit_table, evaluate_table = self.create_and_save_tables(model, fit_result, evaluate_result, training_duration)
-        self.create_visualization(fit_table, evaluate_table)
-        self.accumulate_data()
+
+    def report(self, model, history, evaluate_result, training_duration):
+        # the figures are rendered from the result store by aggregate_results.py --render_plots True
+        return self.create_and_save_tables(model, history, evaluate_result, training_duration)
+
+    def train_and_test(self):
+        import experiments.benchmarks.distribution as distribution
+        model = self.build_model()
+        history, training_duration = self.fit(model)
+        evaluate_result = self.evaluate(model)
+        if not distribution.is_chief(self.strategy):
+            shutil.rmtree(self.get_model_locations(self.args.model)[0], ignore_errors=True)
+            return
+        self.report(model, history, evaluate_result, training_duration)
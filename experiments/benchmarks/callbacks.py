@@ -0,0 +1,187 @@
+import concurrent.futures
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import experiments.models.streaming as streaming
+
+
+def save_weights(weights_path, weights):
+    temporary_weights_path = f'{weights_path[:-len(".npz")]}_tmp.npz'
+    os.makedirs(os.path.dirname(weights_path), exist_ok=True)
+    np.savez(temporary_weights_path, *weights)
+    os.replace(temporary_weights_path, weights_path)
+
+
+def load_weights(weights_path):
+    with np.load(weights_path) as weights_file:
+        return [weights_file[f'arr_{index}'] for index in range(len(weights_file.files))]
+
+
+class BestWeightsCheckpoint(tf.keras.callbacks.Callback):
+    def __init__(self, weights_path, monitor='val_loss'):
+        super().__init__()
+        assert weights_path.endswith('.npz')
+        self.weights_path = weights_path
+        self.monitor = monitor
+        self.best = np.inf
+        self.best_weights = None
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.pending_write = None
+
+    def wait_for_pending_write(self):
+        if self.pending_write is not None:
+            self.pending_write.result()
+            self.pending_write = None
+
+    def on_epoch_end(self, epoch, logs=None):
+        current = (logs or {}).get(self.monitor)
+        if current is None or not current < self.best:
+            return
+        self.best = current
+        self.best_weights = self.model.get_weights()
+        self.wait_for_pending_write()
+        self.pending_write = self.executor.submit(save_weights, self.weights_path, self.best_weights)
+
+    def on_train_end(self, logs=None):
+        self.wait_for_pending_write()
+        if self.best_weights is not None:
+            self.model.set_weights(self.best_weights)
+
+
+class WindowedValidation(tf.keras.callbacks.Callback):
+    # validates a stateful model on windows with a model of the same weights that does not keep its states,
+    # it has to come before the callbacks that monitor the validation results
+    def __init__(self, windowed_model, validation_dataset):
+        super().__init__()
+        self.windowed_model = windowed_model
+        self.validation_dataset = validation_dataset
+
+    def on_epoch_begin(self, epoch, logs=None):
+        # reset_states would zero the states, the cells start from their initial states like in the windowed model
+        for layer in streaming.get_recurrent_layers(self.model):
+            batch_size = tf.nest.flatten(layer.states)[0].shape[0]
+            layer.reset_states(layer.cell.get_initial_state(inputs=None, batch_size=batch_size, dtype=tf.float32))
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.windowed_model.set_weights(self.model.get_weights())
+        validation_results = self.windowed_model.evaluate(self.validation_dataset, verbose=0, return_dict=True)
+        if logs is not None:
+            logs.update({f'val_{key}': value for key, value in validation_results.items()})
+
+
+class TrajectoryStateReset(tf.keras.callbacks.Callback):
+    # resets the states of the streams whose chunk in the next batch starts a trajectory to the initial states of the cells,
+    # so that no state is carried from the end of one trajectory into the next one
+    def __init__(self, batch_starts):
+        super().__init__()
+        self.batch_starts = batch_starts
+
+    def on_train_batch_begin(self, batch, logs=None):
+        starts = self.batch_starts[batch]
+        if not starts.any():
+            return
+        for layer in streaming.get_recurrent_layers(self.model):
+            initial_states = tf.nest.flatten(layer.cell.get_initial_state(inputs=None, batch_size=len(starts), dtype=tf.float32))
+            for state, initial_state in zip(tf.nest.flatten(layer.states), initial_states):
+                mask = np.reshape(starts, (-1,) + (1,) * (len(state.shape) - 1))
+                state.assign(tf.where(mask, tf.cast(initial_state, state.dtype), state))
+
+
+RESUMABLE_CALLBACK_ATTRIBUTES = {
+    'BestWeightsCheckpoint': ('best',),
+    'EarlyStopping': ('wait', 'stopped_epoch', 'best'),
+    'ReduceLROnPlateau': ('wait', 'best', 'cooldown_counter'),
+}
+
+
+def serialize_random_state(random_state):
+    name, keys, position, has_gauss, cached_gaussian = random_state
+    return [name, keys.tolist(), position, has_gauss, cached_gaussian]
+
+
+def deserialize_random_state(random_state):
+    name, keys, position, has_gauss, cached_gaussian = random_state
+    return name, np.array(keys, dtype=np.uint32), position, has_gauss, cached_gaussian
+
+
+def load_training_state(state_directory):
+    state_path = os.path.join(state_directory, 'training_state.json')
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path) as state_file:
+        return json.load(state_file)
+
+
+class TrainingStateCheckpoint(tf.keras.callbacks.Callback):
+    def __init__(self, state_directory, initial_random_state, resumable_callbacks, training_state=None, interval=1):
+        super().__init__()
+        self.state_directory = state_directory
+        self.initial_random_state = initial_random_state
+        self.resumable_callbacks = resumable_callbacks
+        self.training_state = training_state
+        self.interval = interval
+        self.history = {} if training_state is None else training_state['history']
+        self.previous_training_duration = 0 if training_state is None else training_state['training_duration']
+        self.epoch = 0 if training_state is None else training_state['epoch']
+        self.training_start = None
+        self.checkpoint = None
+
+    @property
+    def training_duration(self):
+        return self.previous_training_duration + time.time() - self.training_start
+
+    def on_train_begin(self, logs=None):
+        self.training_start = time.time()
+        self.checkpoint = tf.train.Checkpoint(model=self.model, optimizer=self.model.optimizer, generator=tf.random.get_global_generator())
+        if self.training_state is None:
+            return
+        self.checkpoint.read(os.path.join(self.state_directory, 'training_state')).expect_partial()
+        tf.keras.backend.set_value(self.model.optimizer.lr, self.training_state['learning_rate'])
+        np.random.set_state(deserialize_random_state(self.training_state['random_state']))
+        for callback in self.resumable_callbacks:
+            for attribute, value in self.training_state['callbacks'][type(callback).__name__].items():
+                setattr(callback, attribute, value)
+            if isinstance(callback, BestWeightsCheckpoint) and os.path.exists(callback.weights_path):
+                callback.best_weights = load_weights(callback.weights_path)
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.epoch = epoch + 1
+        for key, value in (logs or {}).items():
+            self.history.setdefault(key, []).append(float(value))
+        if self.epoch % self.interval == 0:
+            self.checkpoint.write(os.path.join(self.state_directory, 'training_state'))
+            self.save_training_state()
+
+    def on_train_end(self, logs=None):
+        training_state = load_training_state(self.state_directory)
+        if training_state is not None:
+            training_state['stopped'] = self.model.stop_training
+            self.write_training_state(training_state)
+
+    def save_training_state(self):
+        callback_states = {}
+        for callback in self.resumable_callbacks:
+            if isinstance(callback, BestWeightsCheckpoint):
+                callback.wait_for_pending_write()
+            callback_states[type(callback).__name__] = {x: float(getattr(callback, x)) for x in RESUMABLE_CALLBACK_ATTRIBUTES[type(callback).__name__]}
+        self.write_training_state({
+            'epoch': self.epoch,
+            'stopped': False,
+            'history': self.history,
+            'training_duration': self.training_duration,
+            'learning_rate': float(tf.keras.backend.get_value(self.model.optimizer.lr)),
+            'callbacks': callback_states,
+            'random_state': serialize_random_state(np.random.get_state()),
+            'initial_random_state': serialize_random_state(self.initial_random_state),
+        })
+
+    def write_training_state(self, training_state):
+        os.makedirs(self.state_directory, exist_ok=True)
+        state_path = os.path.join(self.state_directory, 'training_state.json')
+        with open(f'{state_path}.tmp', 'w') as state_file:
+            json.dump(training_state, state_file)
+        os.replace(f'{state_path}.tmp', state_path)
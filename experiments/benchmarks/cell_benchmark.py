@@ -4,7 +4,7 @@ import experiments.benchmarks.benchmark as benchmark
 
 
 class CellBenchmark(benchmark.Benchmark):
-    def __init__(self):
+    def __init__(self, config=None):
         super().__init__('cell',
                          (('--memory_high_symbol', 1, int),
                           ('--memory_low_symbol', 0, int),
@@ -13,7 +13,8 @@ class CellBenchmark(benchmark.Benchmark):
                           ('--samples', 40_000, int),
                           ('--loss_name', 'MeanSquaredError', str),
                           ('--loss_config', {}, dict),
-                          ('--metric_name', '', str)))
+                          ('--metric_name', '', str)),
+                         config)
 
     def get_data_and_output_size(self):
         memory_high_symbol = self.args.memory_high_symbol
@@ -38,4 +39,5 @@ class CellBenchmark(benchmark.Benchmark):
         return (model_input, time_input), (model_output,), 2
 
 
-CellBenchmark()
+if __name__ == '__main__':
+    CellBenchmark().run()
@@ -0,0 +1,45 @@
+import json
+import os
+
+import tensorflow as tf
+
+DISTRIBUTION_NAMES = ['none', 'mirrored_cpu', 'multi_worker']
+
+
+def create_strategy(args):
+    assert args.distribution in DISTRIBUTION_NAMES
+    if args.distribution == 'mirrored_cpu':
+        physical_cpu = tf.config.list_physical_devices('CPU')[0]
+        tf.config.set_logical_device_configuration(physical_cpu, [tf.config.LogicalDeviceConfiguration() for _ in range(args.replicas)])
+        return tf.distribute.MirroredStrategy([x.name for x in tf.config.list_logical_devices('CPU')],
+                                              cross_device_ops=tf.distribute.ReductionToOneDevice())
+    if args.distribution == 'multi_worker':
+        # all workers have to generate and partition the same data
+        assert args.seed >= 0
+        if args.worker_addresses != '':
+            os.environ['TF_CONFIG'] = json.dumps({'cluster': {'worker': args.worker_addresses.split(',')},
+                                                  'task': {'type': 'worker', 'index': args.worker_index}})
+        return tf.distribute.MultiWorkerMirroredStrategy()
+    return tf.distribute.get_strategy()
+
+
+def is_chief(strategy):
+    cluster_resolver = getattr(strategy, 'cluster_resolver', None)
+    if cluster_resolver is None or cluster_resolver.task_type is None:
+        return True
+    return cluster_resolver.task_type == 'chief' or (cluster_resolver.task_type == 'worker' and cluster_resolver.task_id == 0)
+
+
+def get_worker_directory(strategy, directory):
+    if is_chief(strategy):
+        return directory
+    return os.path.join(directory, f'worker_{strategy.cluster_resolver.task_id}')
+
+
+def create_dataset(inputs, outputs, global_batch_size, shuffle_seed=None, drop_remainder=True):
+    dataset = tf.data.Dataset.from_tensor_slices((inputs, outputs))
+    if shuffle_seed is not None:
+        dataset = dataset.shuffle(len(outputs[0]), seed=shuffle_seed, reshuffle_each_iteration=True)
+    options = tf.data.Options()
+    options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.DATA
+    return dataset.batch(global_batch_size, drop_remainder=drop_remainder).with_options(options)
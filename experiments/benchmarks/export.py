@@ -0,0 +1,114 @@
+import os
+import shutil
+import time
+
+import pandas as pd
+import tensorflow as tf
+from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+
+import experiments.benchmarks.inference as inference
+import experiments.models.model_factory as model_factory
+
+
+def get_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(directory, file)) for directory, _, files in os.walk(path) for file in files)
+
+
+def get_load_duration(load_function, path):
+    load_start = time.perf_counter()
+    load_function(path)
+    return time.perf_counter() - load_start
+
+
+def load_frozen_graph(path):
+    graph_def = tf.compat.v1.GraphDef()
+    with open(path, 'rb') as file:
+        graph_def.ParseFromString(file.read())
+    return tf.compat.v1.wrap_function(lambda: tf.compat.v1.import_graph_def(graph_def, name=''), [])
+
+
+def load_tflite_model(path):
+    interpreter = tf.lite.Interpreter(model_path=path)
+    interpreter.allocate_tensors()
+    return interpreter
+
+
+def load_benchmark_model(benchmark, model_name, batch_size):
+    model_factory.import_model_modules(model_name)
+    saved_model = tf.keras.models.load_model(os.path.join(benchmark.saved_model_dir, model_name))
+    model = benchmark.create_model(model_name, batch_size, benchmark.load_saved_model_config(model_name))
+    model.set_weights(saved_model.get_weights())
+    return model
+
+
+def get_serving_function(model):
+    input_signature = [tf.TensorSpec(x.shape, tf.float32, name=f'input_{index}') for index, x in enumerate(model.inputs)]
+    return tf.function(lambda *inputs: {'outputs': model(inputs, training=False)}, input_signature=input_signature)
+
+
+def create_serving_module(model):
+    serving_module = tf.Module()
+    serving_module.model_variables = list(model.variables)
+    serving_module.serve = get_serving_function(model)
+    return serving_module
+
+
+def convert_to_tflite(serving_module, optimizations=(), representative_dataset=None, supported_ops=(tf.lite.OpsSet.TFLITE_BUILTINS,)):
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([serving_module.serve.get_concrete_function()], serving_module)
+    converter.optimizations = list(optimizations)
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = list(supported_ops)
+    return converter.convert()
+
+
+def export_tflite_model(serving_module, tflite_path):
+    for supported_ops in ((tf.lite.OpsSet.TFLITE_BUILTINS,), (tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS)):
+        try:
+            tflite_model = convert_to_tflite(serving_module, supported_ops=supported_ops)
+        except Exception as exception:
+            print(f'tflite conversion with {supported_ops} failed: {exception}')
+            continue
+        with open(tflite_path, 'wb') as file:
+            file.write(tflite_model)
+        return 'builtin ops' if len(supported_ops) == 1 else 'select tf ops'
+    return 'unsupported'
+
+
+def export_serving_artifacts(benchmark):
+    results = []
+    for model_name in inference.get_saved_model_names(benchmark):
+        saved_model_path = os.path.join(benchmark.saved_model_dir, model_name)
+        export_path = os.path.join(benchmark.export_dir, model_name)
+        shutil.rmtree(export_path, ignore_errors=True)
+        os.makedirs(export_path)
+        model = load_benchmark_model(benchmark, model_name, benchmark.get_model_batch_size(benchmark.args.export_batch_size))
+        serving_module = create_serving_module(model)
+        serving_path = os.path.join(export_path, 'serving_model')
+        tf.saved_model.save(serving_module, serving_path, signatures={'serving_default': serving_module.serve.get_concrete_function()})
+        frozen_function = convert_variables_to_constants_v2(serving_module.serve.get_concrete_function())
+        tf.io.write_graph(frozen_function.graph.as_graph_def(), export_path, 'frozen_graph.pb', as_text=False)
+        frozen_graph_path = os.path.join(export_path, 'frozen_graph.pb')
+        tflite_path = os.path.join(export_path, 'model.tflite')
+        tflite_status = export_tflite_model(serving_module, tflite_path)
+        artifacts = [('keras saved model', saved_model_path, tf.keras.models.load_model, 'training checkpoint'),
+                     ('serving saved model', serving_path, tf.saved_model.load, 'exported'),
+                     ('frozen graph', frozen_graph_path, load_frozen_graph, 'exported')]
+        if tflite_status != 'unsupported':
+            # the python interpreter has no flex delegate, models with select tf ops (e.g. rnns with a dynamic batch size) are not loaded
+            artifacts.append(('tflite model', tflite_path, load_tflite_model if tflite_status == 'builtin ops' else None, tflite_status))
+        for artifact_name, artifact_path, load_function, status in artifacts:
+            results.append({'model': model_name,
+                            'artifact': artifact_name,
+                            'status': status,
+                            'size [MB]': get_size(artifact_path) / 2 ** 20,
+                            'load duration [s]': None if load_function is None else get_load_duration(load_function, artifact_path)})
+        if tflite_status == 'unsupported':
+            results.append({'model': model_name, 'artifact': 'tflite model', 'status': tflite_status})
+        tf.keras.backend.clear_session()
+    os.makedirs(benchmark.result_dir, exist_ok=True)
+    result_table = pd.DataFrame(results)
+    result_table.to_csv(os.path.join(benchmark.result_dir, 'export_results.csv'), index=False)
+    print(result_table.to_string())
+    return result_table
@@ -0,0 +1,98 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+import experiments.models.model_factory as model_factory
+import experiments.models.recurrent_layer as recurrent_layer
+import experiments.models.streaming as streaming
+
+LATENCY_PERCENTILES = [50, 90, 99]
+
+
+def get_inference_batch_sizes(max_batch_size):
+    return [2 ** x for x in range(int(np.log2(max_batch_size)) + 1)]
+
+
+def get_saved_model_names(benchmark):
+    saved_model_names = []
+    for model_name in model_factory.MODEL_ARGUMENTS:
+        if os.path.exists(os.path.join(benchmark.saved_model_dir, model_name, 'saved_model.pb')):
+            saved_model_names.append(model_name)
+    return saved_model_names
+
+
+def get_batch(data, batch_size):
+    return tuple((x[np.arange(batch_size) % len(x)] for x in data))
+
+
+def get_predict_function(model, dynamic_batch_size=False):
+    jit_compile = recurrent_layer.requires_jit_compile(model)
+    if not dynamic_batch_size:
+        return tf.function(lambda x: model(x, training=False), jit_compile=jit_compile)
+    # the signature has no batch size, so all batch sizes run the same trace
+    input_signature = [tuple(tf.TensorSpec(x.shape, x.dtype) for x in model.inputs)]
+    return tf.function(lambda x: model(x, training=False), input_signature=input_signature, jit_compile=jit_compile)
+
+
+def measure_latencies(function, arguments, warmup_runs, runs):
+    for _ in range(warmup_runs):
+        function(*arguments)
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        tf.nest.map_structure(lambda x: x.numpy(), function(*arguments))
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies)
+
+
+def summarize_latencies(model_name, mode, batch_size, latencies):
+    latencies_ms = 1E3 * latencies
+    summary = {'model': model_name, 'mode': mode, 'batch size': batch_size, 'mean latency [ms]': np.mean(latencies_ms)}
+    for percentile in LATENCY_PERCENTILES:
+        summary[f'p{percentile} latency [ms]'] = np.percentile(latencies_ms, percentile)
+    summary['throughput [samples/s]'] = batch_size / np.mean(latencies)
+    return summary
+
+
+def measure_streaming_latencies(model_name, model, warmup_runs, runs):
+    results = []
+    for layer in streaming.get_recurrent_layers(model):
+        streaming_cell = streaming.StreamingCell(layer)
+        frame = tf.nest.map_structure(lambda x: tf.zeros(x.shape, x.dtype), streaming_cell.frame_spec)
+        latencies = measure_latencies(streaming_cell.step, (frame,), warmup_runs, runs)
+        results.append(summarize_latencies(model_name, f'streaming ({layer.name})', streaming_cell.batch_size, latencies))
+    return results
+
+
+def measure_inference_latencies(benchmark):
+    args = benchmark.args
+    results = []
+    for model_name in get_saved_model_names(benchmark):
+        model_factory.import_model_modules(model_name)
+        weights = tf.keras.models.load_model(os.path.join(benchmark.saved_model_dir, model_name)).get_weights()
+        model_config = benchmark.load_saved_model_config(model_name)
+        if args.dynamic_batch_size:
+            model = benchmark.create_model(model_name, None, model_config)
+            model.set_weights(weights)
+            predict = get_predict_function(model, True)
+        for batch_size in get_inference_batch_sizes(args.inference_max_batch_size):
+            if not args.dynamic_batch_size:
+                model = benchmark.create_model(model_name, batch_size, model_config)
+                model.set_weights(weights)
+                predict = get_predict_function(model)
+            latencies = measure_latencies(predict, (get_batch(benchmark.test_input_data, batch_size),), args.inference_warmup_runs, args.inference_runs)
+            results.append(summarize_latencies(model_name, 'batched', batch_size, latencies))
+            results[-1]['traces'] = predict.experimental_get_tracing_count()
+            if batch_size == 1:
+                results += measure_streaming_latencies(model_name, model, args.inference_warmup_runs, args.inference_runs)
+        tf.keras.backend.clear_session()
+    os.makedirs(benchmark.result_dir, exist_ok=True)
+    result_table = pd.DataFrame(results)
+    result_table.to_csv(os.path.join(benchmark.result_dir, 'inference_results.csv'), index=False)
+    comparison_table = result_table.pivot_table(index='model', columns=['mode', 'batch size'], values='p50 latency [ms]')
+    comparison_table.to_csv(os.path.join(benchmark.result_dir, 'inference_comparison.csv'))
+    print(comparison_table.to_string())
+    return result_table
@@ -4,7 +4,7 @@ import experiments.benchmarks.benchmark as benchmark
 
 
 class MemoryBenchmark(benchmark.Benchmark):
-    def __init__(self):
+    def __init__(self, config=None):
         super().__init__('memory',
                          (('--memory_length', 100, int),
                           ('--sequence_length', 1, int),
@@ -12,7 +12,8 @@ class MemoryBenchmark(benchmark.Benchmark):
                           ('--samples', 40_000, int),
                           ('--loss_name', 'SparseCategoricalCrossentropy', str),
                           ('--loss_config', {'from_logits': True}, dict),
-                          ('--metric_name', 'SparseCategoricalAccuracy', str)))
+                          ('--metric_name', 'SparseCategoricalAccuracy', str)),
+                         config)
 
     def get_data_and_output_size(self):
         memory_length = self.args.memory_length
@@ -28,4 +29,5 @@ class MemoryBenchmark(benchmark.Benchmark):
         return (input_sequence, time_sequence), (output_sequence,), self.args.category_amount
 
 
-MemoryBenchmark()
+if __name__ == '__main__':
+    MemoryBenchmark().run()
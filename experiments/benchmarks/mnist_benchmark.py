@@ -1,18 +1,19 @@
 import numpy as np
-import tensorflow as tf
 
 import experiments.benchmarks.benchmark as benchmark
 
 
 class MnistBenchmark(benchmark.Benchmark):
-    def __init__(self):
+    def __init__(self, config=None):
         super().__init__('mnist',
                          (('--max_samples', 40_000, int),
                           ('--loss_name', 'SparseCategoricalCrossentropy', str),
                           ('--loss_config', {'from_logits': True}, dict),
-                          ('--metric_name', 'SparseCategoricalAccuracy', str)))
+                          ('--metric_name', 'SparseCategoricalAccuracy', str)),
+                         config)
 
     def get_data_and_output_size(self):
+        import tensorflow as tf
         max_samples = self.args.max_samples
         data = tf.keras.datasets.mnist.load_data()
         input_data = np.reshape(np.concatenate((data[0][0], data[1][0])), (-1, 98, 8))
@@ -21,4 +22,5 @@ class MnistBenchmark(benchmark.Benchmark):
         return (input_data[:max_samples], time_data[:max_samples]), (output_data[:max_samples],), 10
 
 
-MnistBenchmark()
+if __name__ == '__main__':
+    MnistBenchmark().run()
@@ -0,0 +1,100 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+import experiments.benchmarks.export as export
+import experiments.benchmarks.inference as inference
+
+
+def get_quantization_variants(benchmark):
+    def representative_dataset():
+        for index in range(min(benchmark.args.calibration_samples, benchmark.validation_samples)):
+            yield [x[index:index + 1].astype(np.float32) for x in benchmark.validation_input_data]
+
+    return (('float32', {}),
+            ('dynamic range', {'optimizations': (tf.lite.Optimize.DEFAULT,)}),
+            ('int8', {'optimizations': (tf.lite.Optimize.DEFAULT,),
+                      'representative_dataset': representative_dataset,
+                      'supported_ops': (tf.lite.OpsSet.TFLITE_BUILTINS_INT8,)}))
+
+
+def get_input_indices(interpreter, input_amount):
+    input_details = interpreter.get_input_details()
+    input_indices = []
+    for input_index in range(input_amount):
+        matching_indices = [x['index'] for x in input_details if f'input_{input_index}' in x['name']]
+        input_indices.append(matching_indices[0] if matching_indices else None)
+    return input_indices
+
+
+def evaluate_tflite_model(benchmark, tflite_model):
+    interpreter = tf.lite.Interpreter(model_content=tflite_model)
+    interpreter.allocate_tensors()
+    input_indices = get_input_indices(interpreter, len(benchmark.test_input_data))
+    output_index = interpreter.get_output_details()[0]['index']
+    samples = min(benchmark.args.quantization_samples, benchmark.test_samples)
+    outputs, latencies = [], []
+    for sample_index in range(samples):
+        for input_index, x in zip(input_indices, benchmark.test_input_data):
+            if input_index is not None:
+                interpreter.set_tensor(input_index, x[sample_index:sample_index + 1].astype(np.float32))
+        invoke_start = time.perf_counter()
+        interpreter.invoke()
+        latencies.append(time.perf_counter() - invoke_start)
+        outputs.append(interpreter.get_tensor(output_index))
+    predictions = np.concatenate(outputs)
+    targets = benchmark.test_output_data[0][:samples]
+    loss = tf.keras.losses.get({'class_name': benchmark.args.loss_name, 'config': benchmark.args.loss_config})
+    results = {'test loss': float(loss(targets, predictions).numpy())}
+    if benchmark.args.metric_name != '':
+        metric = tf.keras.metrics.get(benchmark.args.metric_name)
+        if isinstance(metric, tf.keras.metrics.Metric):
+            metric.update_state(targets, predictions)
+            results['test metric'] = float(metric.result().numpy())
+        else:
+            results['test metric'] = float(np.mean(metric(targets, predictions)))
+    results['mean latency [ms]'] = 1E3 * np.mean(latencies)
+    results['p50 latency [ms]'] = 1E3 * np.percentile(latencies, 50)
+    results['size [MB]'] = len(tflite_model) / 2 ** 20
+    return results
+
+
+def quantize_models(benchmark):
+    results = []
+    for model_name in inference.get_saved_model_names(benchmark):
+        model = export.load_benchmark_model(benchmark, model_name, 1)
+        serving_module = export.create_serving_module(model)
+        float_results = None
+        for variant_name, converter_config in get_quantization_variants(benchmark):
+            try:
+                tflite_model = export.convert_to_tflite(serving_module, **converter_config)
+            except Exception as exception:
+                print(f'{variant_name} conversion of {model_name} failed: {exception}')
+                results.append({'model': model_name, 'variant': variant_name, 'status': 'unsupported'})
+                continue
+            # a converted model can still fail to allocate its tensors or to run in the interpreter
+            try:
+                evaluate_results = evaluate_tflite_model(benchmark, tflite_model)
+            except Exception as exception:
+                print(f'{variant_name} evaluation of {model_name} failed: {exception}')
+                results.append({'model': model_name, 'variant': variant_name, 'status': 'failed'})
+                continue
+            variant_results = {'model': model_name, 'variant': variant_name, 'status': 'converted'}
+            variant_results.update(evaluate_results)
+            if variant_name == 'float32':
+                float_results = variant_results
+            if float_results is not None:
+                variant_results['test loss delta'] = variant_results['test loss'] - float_results['test loss']
+                if 'test metric' in variant_results:
+                    variant_results['test metric delta'] = variant_results['test metric'] - float_results['test metric']
+                variant_results['latency speedup'] = float_results['mean latency [ms]'] / variant_results['mean latency [ms]']
+            results.append(variant_results)
+        tf.keras.backend.clear_session()
+    os.makedirs(benchmark.result_dir, exist_ok=True)
+    result_table = pd.DataFrame(results)
+    result_table.to_csv(os.path.join(benchmark.result_dir, 'quantization_results.csv'), index=False)
+    print(result_table.to_string())
+    return result_table
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+
+RESULT_STORE_FILE_NAME = 'results.sqlite'
+
+# one row per value, training values are keyed by their epoch and testing values use epoch -1
+SCHEMA = '''CREATE TABLE IF NOT EXISTS results (
+    run TEXT NOT NULL,
+    benchmark TEXT NOT NULL,
+    model TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    epoch INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (run, benchmark, model, kind, epoch, metric))'''
+
+# files that were copied into a store, so that unchanged sources are not ingested twice
+SOURCES_SCHEMA = '''CREATE TABLE IF NOT EXISTS sources (
+    source TEXT PRIMARY KEY,
+    modified REAL NOT NULL)'''
+
+
+def get_result_store_path(result_folder_name):
+    return os.path.join(os.getcwd(), result_folder_name, RESULT_STORE_FILE_NAME)
+
+
+class ResultStore:
+    def __init__(self, database_path):
+        os.makedirs(os.path.dirname(database_path), exist_ok=True)
+        # parallel benchmark processes may write to the same store, so wait for locks instead of failing
+        self.connection = sqlite3.connect(database_path, timeout=600)
+        with self.connection:
+            self.connection.execute(SCHEMA)
+            self.connection.execute(SOURCES_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def insert_results(self, run, benchmark_name, model_name, training_results, testing_results):
+        rows = []
+        for position, (metric, values) in enumerate(training_results.items()):
+            rows += [(run, benchmark_name, model_name, 'training', epoch, position, metric, float(value)) for epoch, value in enumerate(values)]
+        for position, (metric, value) in enumerate(testing_results.items()):
+            rows.append((run, benchmark_name, model_name, 'testing', -1, position, metric, float(value)))
+        with self.connection:
+            self.connection.execute('DELETE FROM results WHERE run = ? AND benchmark = ? AND model = ?', (run, benchmark_name, model_name))
+            self.connection.executemany('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def is_ingested(self, source, modified):
+        row = self.connection.execute('SELECT modified FROM sources WHERE source = ?', (source,)).fetchone()
+        return row is not None and row[0] == modified
+
+    def set_ingested(self, source, modified):
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO sources VALUES (?, ?)', (source, modified))
+
+    def ingest_result_store(self, run_prefix, database_path):
+        # runs of the other store are prefixed to keep them apart from runs with the same name in other stores
+        self.connection.execute('ATTACH DATABASE ? AS source', (database_path,))
+        try:
+            with self.connection:
+                self.connection.execute('DELETE FROM results WHERE run LIKE ?', (f'{run_prefix}:%',))
+                self.connection.execute("INSERT INTO results SELECT ? || ':' || run, benchmark, model, kind, epoch, position, metric, value FROM source.results",
+                                        (run_prefix,))
+        finally:
+            self.connection.execute('DETACH DATABASE source')
+
+    def get_testing_statistics(self, benchmark_name):
+        # the squared deviations are summed around the mean of a first pass, a sum of squares minus the squared mean cancels
+        # catastrophically for values with a small spread
+        return self.connection.execute(
+            'SELECT model, metric, MIN(position), COUNT(value), means.mean, SUM((value - means.mean) * (value - means.mean)) FROM results '
+            'JOIN (SELECT model, metric, AVG(value) AS mean FROM results WHERE benchmark = ? AND kind = ? GROUP BY model, metric) AS means '
+            'USING (model, metric) WHERE benchmark = ? AND kind = ? GROUP BY model, metric ORDER BY model, MIN(position)',
+            (benchmark_name, 'testing') * 2).fetchall()
+
+    def get_runs(self):
+        return [x[0] for x in self.connection.execute('SELECT DISTINCT run FROM results ORDER BY run')]
+
+    def get_metrics(self, run, benchmark_name, kind):
+        return [x[0] for x in self.connection.execute(
+            'SELECT metric FROM results WHERE run = ? AND benchmark = ? AND kind = ? GROUP BY metric ORDER BY MIN(position)',
+            (run, benchmark_name, kind))]
+
+    def get_testing_table(self, run, benchmark_name):
+        import pandas as pd
+        rows = self.connection.execute(
+            'SELECT model, metric, value FROM results WHERE run = ? AND benchmark = ? AND kind = ?', (run, benchmark_name, 'testing')).fetchall()
+        if not rows:
+            return pd.DataFrame()
+        testing_table = pd.DataFrame(rows, columns=['model', 'metric', 'value']).pivot(index='model', columns='metric', values='value')
+        return testing_table[self.get_metrics(run, benchmark_name, 'testing')].reset_index().rename_axis(columns=None)
+
+    def get_training_values(self, run, benchmark_name, metric):
+        training_values = {}
+        for model_name, value in self.connection.execute(
+                'SELECT model, value FROM results WHERE run = ? AND benchmark = ? AND kind = ? AND metric = ? ORDER BY model, epoch',
+                (run, benchmark_name, 'training', metric)):
+            training_values.setdefault(model_name, []).append(value)
+        return training_values
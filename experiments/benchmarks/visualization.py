@@ -0,0 +1,64 @@
+import math
+import os
+
+import numpy as np
+
+
+def render_model_visualization(visualization_path, title, training_values, testing_values):
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
+    x_data = np.array(range(1, len(next(iter(training_values.values()))) + 1))
+    figure, first_axis = plt.subplots()
+    first_axis.set_xlabel('epochs')
+    testing_columns = list(testing_values)
+    first_axis.set_ylabel(' '.join(testing_columns[0].split()[1:]))
+    first_axis.xaxis.set_major_locator(ticker.MaxNLocator(integer=True))
+    first_axis.yaxis.set_major_locator(ticker.AutoLocator())
+    first_axis.set_title(title)
+    first_axis.set_prop_cycle(color=['red', 'green'])
+    if len(testing_columns) == 1:
+        axes = [first_axis]
+    else:
+        second_axis = first_axis.twinx()
+        second_axis.set_prop_cycle(color=['blue', 'orange'])
+        second_axis.yaxis.set_major_locator(ticker.AutoLocator())
+        second_axis.set_ylabel(' '.join(testing_columns[1].split()[1:]))
+        axes = [first_axis, second_axis]
+    hline_colors = ['black', 'grey']
+    legend_positions = ['center left', 'center right']
+    for index, (column, values) in enumerate(training_values.items()):
+        axes[index % len(axes)].plot(x_data, values, label=column)
+    for index, (column, value) in enumerate(testing_values.items()):
+        axes[index % len(axes)].hlines([value], x_data[0], x_data[-1], label=column, linestyles='dashed', colors=hline_colors[index % len(hline_colors)])
+    for index, axis in enumerate(axes):
+        legend = axis.legend(loc=legend_positions[index % len(legend_positions)], prop={'size': 6})
+        legend.remove()
+        axes[-1].add_artist(legend)
+    plt.tight_layout()
+    os.makedirs(os.path.dirname(visualization_path), exist_ok=True)
+    plt.savefig(visualization_path)
+    plt.close()
+
+
+def render_merged_visualization(visualization_path, title, val_loss_column, val_loss_data):
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
+    max_len = max([len(x[1]) for x in val_loss_data])
+    x_data = np.array(range(1, max_len + 1))
+    fig, axis = plt.subplots()
+    axis.set_title(title)
+    axis.set_xlabel('epochs')
+    axis.set_ylabel(' '.join(val_loss_column.split()[1:]))
+    axis.xaxis.set_major_locator(ticker.MaxNLocator(integer=True))
+    color_cycle = plt.rcParams['axes.prop_cycle'].by_key()['color']
+    axis.set_prop_cycle(color=color_cycle * 2, linestyle=['solid'] * len(color_cycle) + ['dashed'] * len(color_cycle))
+    axis.set_yscale('log')
+    axis.yaxis.set_major_locator(ticker.LogLocator(subs=(1, 2, 5)))
+    axis.yaxis.set_major_formatter(ticker.LogFormatterSciNotation(minor_thresholds=(math.inf, math.inf)))
+    for model_name, val_losses in val_loss_data:
+        axis.plot(x_data[:len(val_losses)], val_losses, label=model_name)
+    axis.legend(loc='upper right', prop={'size': 6})
+    plt.tight_layout()
+    os.makedirs(os.path.dirname(visualization_path), exist_ok=True)
+    plt.savefig(visualization_path)
+    plt.close()
@@ -6,7 +6,7 @@ import experiments.benchmarks.benchmark as benchmark
 
 
 class WalkerBenchmark(benchmark.Benchmark):
-    def __init__(self):
+    def __init__(self, config=None):
         super().__init__('walker',
                          (('--skip_percentage', 0.1, float),
                           ('--frame_skip', False, bool),
@@ -15,7 +15,8 @@ class WalkerBenchmark(benchmark.Benchmark):
                           ('--sample_distance', 4, int),
                           ('--loss_name', 'MeanSquaredError', str),
                           ('--loss_config', {}, dict),
-                          ('--metric_name', '', str)))
+                          ('--metric_name', '', str)),
+                         config)
 
     def get_data_and_output_size(self):
         max_samples = self.args.max_samples
@@ -35,16 +36,11 @@ class WalkerBenchmark(benchmark.Benchmark):
                     lossy_output_dataset.append(output_dataset[index])
                     interval = 0
             lossy_data.append([lossy_input_dataset, lossy_time_dataset, lossy_output_dataset])
-        input_sequences = []
-        time_sequences = []
-        output_sequences = []
-        for input_dataset, time_dataset, output_dataset in lossy_data:
-            for start_index in range(0, len(input_dataset) - self.args.sequence_length + 1, self.args.sample_distance):
-                end_index = start_index + self.args.sequence_length
-                input_sequences.append(input_dataset[start_index:end_index])
-                time_sequences.append(time_dataset[start_index:end_index])
-                output_sequences.append(output_dataset[end_index - 1])
-        return (np.array(input_sequences[:max_samples]), np.array(time_sequences[:max_samples])), (np.array(output_sequences[:max_samples]),), 17
+        trajectories = [((np.array(input_dataset), np.array(time_dataset)), (np.array(output_dataset),))
+                        for input_dataset, time_dataset, output_dataset in lossy_data]
+        input_data, output_data = self.cut_trajectories(trajectories, self.args.sequence_length, self.args.sample_distance, max_samples)
+        return input_data, output_data, 17
 
 
-WalkerBenchmark()
+if __name__ == '__main__':
+    WalkerBenchmark().run()
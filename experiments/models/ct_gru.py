@@ -5,13 +5,16 @@ code taken from https://github.com/mlech26l/ode-lstms/blob/master/node_cell.py (
 import numpy as np
 import tensorflow as tf
 
+import experiments.models.recurrent_layer as recurrent_layer
+
 
 @tf.keras.utils.register_keras_serializable()
 class CTGRU(tf.keras.layers.AbstractRNNCell):
-    def __init__(self, units, M=8, **kwargs):
+    def __init__(self, units, M=8, precompute_inputs=False, **kwargs):
         super(CTGRU, self).__init__(**kwargs)
         self.units = units
         self.M = M
+        self.precompute_inputs = precompute_inputs
         self.state_size_value = units * self.M
         self.ln_tau_table = np.empty(self.M)
         self.tau_table = np.empty(self.M)
@@ -28,31 +31,48 @@ class CTGRU(tf.keras.layers.AbstractRNNCell):
         )
         self.detect_layer = tf.keras.layers.Dense(self.units, activation="tanh")
         self.update_layer = tf.keras.layers.Dense(self.units * self.M, activation=None)
+        # the layers see the inputs concatenated with a state, they are built here because their input parts are applied outside of call
+        input_dim = input_shape[-1]
+        if isinstance(input_shape[0], tuple):
+            input_dim = input_shape[0][-1]
+        for layer in (self.retrieval_layer, self.detect_layer, self.update_layer):
+            layer.build((None, input_dim + self.units))
         self.built = True
 
+    def input_projection(self, inputs):
+        # the input rows of the kernels of the three layers, the state rows are applied in call
+        layers = (self.retrieval_layer, self.detect_layer, self.update_layer)
+        kernel = tf.concat([layer.kernel[:-self.units] for layer in layers], -1)
+        bias = tf.concat([layer.bias for layer in layers], -1)
+        return recurrent_layer.dense_projection(inputs, kernel) + bias
+
+    def project_inputs(self, inputs):
+        return recurrent_layer.project_main_input(inputs, self.input_projection)
+
     def call(self, inputs, states):
         elapsed = 1.0
         if (isinstance(inputs, tuple) or isinstance(inputs, list)) and len(inputs) > 1:
             elapsed = inputs[1]
             inputs = inputs[0]
+        if not self.precompute_inputs:
+            inputs = self.input_projection(inputs)
+        retrieval_inputs, detect_inputs, update_inputs = tf.split(inputs, [self.units * self.M, self.units, self.units * self.M], -1)
 
         batch_dim = tf.shape(inputs)[0]
 
         h_hat = tf.reshape(states[0], [batch_dim, self.units, self.M])
         h = tf.reduce_sum(h_hat, axis=2)
 
-        fused_input = tf.concat([inputs, h], axis=-1)
-        ln_tau_r = self.retrieval_layer(fused_input)
+        ln_tau_r = retrieval_inputs + tf.matmul(h, self.retrieval_layer.kernel[-self.units:])
         ln_tau_r = tf.reshape(ln_tau_r, shape=[batch_dim, self.units, self.M])
         sf_input_r = -tf.square(ln_tau_r - self.ln_tau_table)
         rki = tf.nn.softmax(logits=sf_input_r, axis=2)
 
         q_input = tf.reduce_sum(rki * h_hat, axis=2)
-        reset_value = tf.concat([inputs, q_input], axis=1)
-        qk = self.detect_layer(reset_value)
+        qk = tf.nn.tanh(detect_inputs + tf.matmul(q_input, self.detect_layer.kernel[-self.units:]))
         qk = tf.reshape(qk, [batch_dim, self.units, 1])
 
-        ln_tau_s = self.update_layer(fused_input)
+        ln_tau_s = update_inputs + tf.matmul(h, self.update_layer.kernel[-self.units:])
         ln_tau_s = tf.reshape(ln_tau_s, shape=[batch_dim, self.units, self.M])
         sf_input_s = -tf.square(ln_tau_s - self.ln_tau_table)
         ski = tf.nn.softmax(logits=sf_input_s, axis=2)
@@ -78,6 +98,7 @@ class CTGRU(tf.keras.layers.AbstractRNNCell):
         config = super().get_config().copy()
         config.update({
             'units': self.units,
-            'M': self.M
+            'M': self.M,
+            'precompute_inputs': self.precompute_inputs
         })
         return config
@@ -3,12 +3,13 @@ code taken from https://github.com/mlech26l/ode-lstms/blob/master/node_cell.py (
 """
 
 import tensorflow as tf
-import tensorflow_probability as tfp
+
+import experiments.models.recurrent_layer as recurrent_layer
 
 
 @tf.keras.utils.register_keras_serializable()
 class CTRNNCell(tf.keras.layers.AbstractRNNCell):
-    def __init__(self, units, method, num_unfolds=None, tau=1, **kwargs):
+    def __init__(self, units, method, num_unfolds=None, tau=1, precompute_inputs=False, **kwargs):
         super().__init__(**kwargs)
         self.fixed_step_methods = {
             "euler": self.euler,
@@ -31,6 +32,7 @@ class CTRNNCell(tf.keras.layers.AbstractRNNCell):
         self.num_unfolds = num_unfolds
         self.method = method
         self.tau = tau
+        self.precompute_inputs = precompute_inputs
         self.kernel, self.recurrent_kernel, self.bias, self.scale, self.solver = (None,) * 5
 
     def build(self, input_shape):
@@ -55,6 +57,7 @@ class CTRNNCell(tf.keras.layers.AbstractRNNCell):
             name="scale",
         )
         if self.method == "dopri5":
+            import tensorflow_probability as tfp
             self.solver = tfp.math.ode.DormandPrince(
                 rtol=0.01,
                 atol=1e-04,
@@ -69,12 +72,21 @@ class CTRNNCell(tf.keras.layers.AbstractRNNCell):
             )
         self.built = True
 
+    def input_projection(self, inputs):
+        return recurrent_layer.dense_projection(inputs, self.kernel)
+
+    def project_inputs(self, inputs):
+        return recurrent_layer.project_main_input(inputs, self.input_projection)
+
     def call(self, inputs, states):
         hidden_state = states[0]
         elapsed = 1.0
         if (isinstance(inputs, tuple) or isinstance(inputs, list)) and len(inputs) > 1:
             elapsed = inputs[1]
             inputs = inputs[0]
+        # the input projection does not change between the unfolds, so it is computed once per step or once per sequence
+        if not self.precompute_inputs:
+            inputs = self.input_projection(inputs)
 
         if self.method == "dopri5":
             idx = None
@@ -113,8 +125,7 @@ class CTRNNCell(tf.keras.layers.AbstractRNNCell):
         hidden_state = y
         return self.dfdt(inputs, hidden_state)
 
-    def dfdt(self, inputs, hidden_state):
-        h_in = tf.matmul(inputs, self.kernel)
+    def dfdt(self, h_in, hidden_state):
         h_rec = tf.matmul(hidden_state, self.recurrent_kernel)
         dh_in = self.scale * tf.nn.tanh(h_in + h_rec + self.bias)
         if self.tau > 0:
@@ -153,6 +164,7 @@ class CTRNNCell(tf.keras.layers.AbstractRNNCell):
             'units': self.units,
             'method': self.method,
             'num_unfolds': self.num_unfolds,
-            'tau': self.tau
+            'tau': self.tau,
+            'precompute_inputs': self.precompute_inputs
         })
         return config
@@ -105,11 +105,6 @@ class TemporalLinkAddressing:
         Returns:
             Tensor [B, N, N]: temporal link matrix to use at next time step
         """
-        batch_size = prev_link_matrix.shape[0]
-        if batch_size is None:
-            return prev_link_matrix
-        words_num = prev_link_matrix.shape[1]
-
         write_weighting_i = tf.expand_dims(write_weighting, 2)  # [b x N x 1 ] duplicate columns
         write_weighting_j = tf.expand_dims(write_weighting, 1)  # [b x 1 X N ] duplicate rows
         prev_precedence_vector_j = tf.expand_dims(prev_precedence_vector, 1)  # [b x 1 X N]
@@ -118,7 +113,7 @@ class TemporalLinkAddressing:
                 (1 - write_weighting_i - write_weighting_j) * prev_link_matrix
                 + (write_weighting_i * prev_precedence_vector_j)
         )
-        zero_diagonal = tf.zeros([batch_size, words_num], dtype=link_matrix.dtype)
+        zero_diagonal = tf.zeros_like(write_weighting)
 
         return tf.linalg.set_diag(link_matrix, zero_diagonal)
 
@@ -190,15 +185,9 @@ class AllocationAddressing:
         """Permute each batch in a batch first tensor according to tensor
         of indices.
         """
-        if indices.shape[0] is None:
-            return tensor
-        unpacked = tf.unstack(indices)
-        indices_inverted = tf.stack(
-            [tf.math.invert_permutation(permutation) for permutation in unpacked]
-        )
-
-        unpacked = zip(tf.unstack(tensor), tf.unstack(indices_inverted))
-        return tf.stack([tf.gather(value, index) for value, index in unpacked])
+        # the argsort of a permutation is its inverse, a batched gather works for any batch size
+        indices_inverted = tf.argsort(indices, axis=-1)
+        return tf.gather(tensor, indices_inverted, batch_dims=1)
 
     @staticmethod
     def weighting(usage_vector):
@@ -557,3 +546,482 @@ class DNC(tf.keras.layers.AbstractRNNCell):
             'num_read_heads': self._R
         })
         return config
+
+
+def content_weighting(memory_matrix, inverse_row_norms, keys, strengths):
+    """Same as ContentAddressing.weighting, but the memory rows are not
+    normalised, the similarities are scaled by the inverse row norms instead.
+
+    Args:
+        memory_matrix (Tensor [B, N, W]): the memory matrix to query
+        inverse_row_norms (Tensor [B, N]): inverse l2 norms of the memory rows
+        keys (Tensor [B, W, R]): the keys to query the memory
+        strengths (Tensor [B, R]): strengths for each lookup key
+
+    Returns:
+        Tensor [B, N, R]: lookup weightings for each key
+    """
+    keys_normalised = tf.math.l2_normalize(keys, 1, epsilon=EPSILON)
+    similarity = tf.matmul(memory_matrix, keys_normalised) * tf.expand_dims(inverse_row_norms, 2)
+    return tf.math.softmax(similarity * tf.expand_dims(tf.math.softplus(strengths), 1), 1)
+
+
+def get_inverse_row_norms(memory_matrix):
+    # the same clipping as tf.math.l2_normalize
+    return tf.math.rsqrt(tf.maximum(tf.reduce_sum(tf.square(memory_matrix), 2), EPSILON))
+
+
+@tf.keras.utils.register_keras_serializable()
+class FusedDNC(DNC):
+    """DNC with a fused step, it has the same weights and computes the same
+    outputs as DNC.
+
+    The interface vector is parsed with a single split, the inverse row norms of
+    the memory are computed once per step after the write and carried in the
+    state for the write lookup of the next step, the read addressing modes are
+    blended without stacking them and the flat state is unpacked by position.
+    The memory update only uses ops XLA can compile and is compiled if
+    jit_compile is set.
+    """
+
+    def __init__(self, output_size, controller_units=256, memory_size=256,
+                 word_size=64, num_read_heads=4, jit_compile=False, **kwargs):
+        super().__init__(output_size, controller_units, memory_size, word_size, num_read_heads, **kwargs)
+        self._jit_compile = jit_compile
+        self.compiled_update_memory = tf.function(self.update_memory, jit_compile=True) if jit_compile else self.update_memory
+
+    def parse_interface_vector(self, interface_vector):
+        r, w = self._R, self._W
+        read_keys, read_strengths, write_key, write_strength, erase_vector, write_vector, free_gates, allocation_gate, write_gate, read_modes = \
+            tf.split(interface_vector, [r * w, r, w, 1, w, w, r, 1, 1, 3 * r], 1)
+        return DNC.interface(
+            read_keys=tf.reshape(read_keys, (-1, w, r)),
+            read_strengths=1 + tf.nn.softplus(read_strengths),
+            write_key=tf.expand_dims(write_key, 2),
+            write_strength=1 + tf.nn.softplus(write_strength),
+            erase_vector=tf.nn.sigmoid(erase_vector),
+            write_vector=write_vector,
+            free_gates=tf.nn.sigmoid(free_gates),
+            allocation_gate=tf.nn.sigmoid(allocation_gate),
+            write_gate=tf.nn.sigmoid(write_gate),
+            read_modes=tf.nn.softmax(tf.reshape(read_modes, (-1, 3, r)), axis=1),
+        )
+
+    def update_memory(self, interface, memory_state, inverse_row_norms):
+        """Write and read like Memory.__call__.
+
+        Returns:
+            Tuple:
+                read vectors (Tensor [B, W, R])
+                next memory state (Memory.state)
+                inverse row norms of the next memory matrix (Tensor [B, N])
+        """
+        i, m = interface, memory_state
+        usage_vector = AllocationAddressing.update_usage_vector(i.free_gates, m.read_weightings, m.write_weighting, m.usage_vector)
+        emptiness_sorted, free_list = tf.nn.top_k(1 - ((1 - EPSILON) * usage_vector + EPSILON), k=self._N)
+        allocation_sorted = emptiness_sorted * tf.math.cumprod(1 - emptiness_sorted, axis=1, exclusive=True)
+        # argsort inverts the permutations of the whole batch at once
+        allocation_weighting = tf.gather(allocation_sorted, tf.argsort(free_list, axis=1), batch_dims=1)
+        write_lookup_weighting = content_weighting(m.memory_matrix, inverse_row_norms, i.write_key, i.write_strength)[..., 0]
+        write_weighting = i.write_gate * (i.allocation_gate * allocation_weighting + (1 - i.allocation_gate) * write_lookup_weighting)
+
+        write_weighting_i = tf.expand_dims(write_weighting, 2)
+        memory_matrix = m.memory_matrix * (1 - write_weighting_i * tf.expand_dims(i.erase_vector, 1)) + \
+            write_weighting_i * tf.expand_dims(i.write_vector, 1)
+        inverse_row_norms = get_inverse_row_norms(memory_matrix)
+        link_matrix = (1 - write_weighting_i - tf.expand_dims(write_weighting, 1)) * m.link_matrix + \
+            write_weighting_i * tf.expand_dims(m.precedence_vector, 1)
+        link_matrix = tf.linalg.set_diag(link_matrix, tf.zeros_like(write_weighting))
+        precedence_vector = TemporalLinkAddressing.update_precedence_vector(m.precedence_vector, write_weighting)
+
+        lookup_weighting = content_weighting(memory_matrix, inverse_row_norms, i.read_keys, i.read_strengths)
+        forward_weighting, backward_weighting = TemporalLinkAddressing.weightings(link_matrix, m.read_weightings)
+        read_weightings = i.read_modes[:, 0:1] * backward_weighting + i.read_modes[:, 1:2] * lookup_weighting + \
+            i.read_modes[:, 2:3] * forward_weighting
+        read_vectors = tf.matmul(memory_matrix, read_weightings, adjoint_a=True)
+
+        return read_vectors, Memory.state(
+            memory_matrix=memory_matrix,
+            usage_vector=usage_vector,
+            link_matrix=link_matrix,
+            precedence_vector=precedence_vector,
+            write_weighting=write_weighting,
+            read_weightings=read_weightings,
+        ), inverse_row_norms
+
+    def call(self, inputs, prev_dnc_state):
+        inputs = model_factory.get_concat_inputs(inputs)
+        # the flat state is the flat DNC state followed by the inverse row norms of the memory
+        memory_fields = len(Memory.state._fields)
+        memory_state = Memory.state(*prev_dnc_state[:memory_fields])
+        controller_state = list(prev_dnc_state[memory_fields:-2])
+        prev_read_vectors, inverse_row_norms = prev_dnc_state[-2:]
+
+        input_augmented = tf.concat([inputs, self._flatten_read_vectors(prev_read_vectors)], 1)
+        controller_output, controller_state = self._controller(input_augmented, controller_state)
+        controller_output = tf.clip_by_value(controller_output, -self._clip, self._clip)
+        interface = self.parse_interface_vector(self._controller_to_interface_dense(controller_output))
+        read_vectors, memory_state, inverse_row_norms = self.compiled_update_memory(interface, memory_state, inverse_row_norms)
+
+        final_output = self._final_output_dense(tf.concat([controller_output, self._flatten_read_vectors(read_vectors)], 1))
+        final_output = tf.clip_by_value(final_output, -self._clip, self._clip)
+        return final_output, list(memory_state) + list(controller_state) + [read_vectors, inverse_row_norms]
+
+    @property
+    def state_size(self):
+        return super().state_size + [tf.TensorShape([self._N])]
+
+    def get_initial_state(self, inputs=None, batch_size=None, dtype=tf.float32):
+        initial_state = super().get_initial_state(inputs, batch_size, dtype)
+        return initial_state + [get_inverse_row_norms(initial_state[0])]
+
+    def get_config(self):
+        config = super().get_config().copy()
+        config.update({
+            'jit_compile': self._jit_compile
+        })
+        return config
+
+
+def get_batch_positions(indices):
+    # [batch, slot] positions for scatters and gathers with slot indices of shape [B, M]
+    batch_indices = tf.broadcast_to(tf.range(tf.shape(indices)[0])[:, tf.newaxis], tf.shape(indices))
+    return tf.stack([batch_indices, indices], -1)
+
+
+@tf.custom_gradient
+def gather_rows(memory_matrix, indices):
+    """Gather memory rows and pass the memory on.
+
+    If every read of the memory goes through gather_rows, the memory has a
+    single consumer and its gradient is the gradient of the passed on memory
+    with the gradients of the rows scattered into it, which XLA updates in
+    place. The gradients of plain gathers are summed with the dense memory
+    gradient instead, which is O(N * W).
+
+    Args:
+        memory_matrix (Tensor [B, N, W])
+        indices (Tensor [B, M]): slot indices
+
+    Returns:
+        Tuple(Tensor [B, M, W], Tensor [B, N, W]): the rows and the memory
+    """
+    rows = tf.gather(memory_matrix, indices, batch_dims=1)
+
+    def grad(rows_grad, memory_matrix_grad):
+        return tf.tensor_scatter_nd_add(memory_matrix_grad, get_batch_positions(indices), rows_grad), None
+
+    return (rows, tf.identity(memory_matrix)), grad
+
+
+class LeastRecentlyUsedList:
+    """
+    Doubly linked list of the memory slots from the least to the most recently
+    accessed one. Slot N is the sentinel before the first and after the last
+    slot, slot N + 1 takes the links of masked updates. Only the links of the
+    accessed slots are read or written and the least recently accessed slot is
+    kept next to the links, so that the links are only read by a single gather
+    before they are updated, which lets XLA update them in place. The links
+    are kept as floats like the rest of the state.
+
+        Used for: writing
+    """
+
+    @staticmethod
+    def initial_state(batch_size, memory_size, dtype=tf.float32):
+        """Links of the slots in the order of their indices.
+
+        Returns:
+            Tuple(Tensor [B, N + 2], Tensor [B, N + 2], Tensor [B, 1]): next and previous slots and the least recently
+                accessed slot
+        """
+        slots = tf.range(memory_size + 2)
+        next_slots = tf.concat([slots[1:memory_size + 1], [0, memory_size + 1]], 0)
+        previous_slots = tf.concat([[memory_size], slots[:memory_size - 1], [memory_size - 1, memory_size + 1]], 0)
+        return tuple(tf.tile(tf.cast(x, dtype)[tf.newaxis], [batch_size, 1]) for x in (next_slots, previous_slots, slots[:1]))
+
+    @staticmethod
+    def move_to_back(next_slots, previous_slots, accessed_slots):
+        """Unlink the accessed slots and append them to the list, the slots
+        accessed in the same step are appended by index.
+
+        The accessed slots can be neighbours in the list, a run of accessed
+        slots is unlinked at once by linking the slots before and after it,
+        which are found by pointer jumping over the accessed slots in
+        O(M * M * log(M)). All links are read before the single scatter into
+        each link tensor, so that XLA updates them in place.
+
+        Args:
+            next_slots (Tensor [B, N + 2])
+            previous_slots (Tensor [B, N + 2])
+            accessed_slots (Tensor [B, M]): slot indices, duplicates are allowed
+
+        Returns:
+            Tuple(Tensor [B, N + 2], Tensor [B, N + 2], Tensor [B, 1]): next and previous slots and the least recently
+                accessed slot
+        """
+        sentinel = tf.shape(next_slots)[1] - 2
+        slots = tf.sort(accessed_slots, -1)
+
+        def get_outer_neighbours(neighbours):
+            for _ in range(slots.shape[1].bit_length()):
+                matches = neighbours[..., tf.newaxis] == slots[:, tf.newaxis, :]
+                neighbours = tf.where(tf.reduce_any(matches, -1),
+                                      tf.gather(neighbours, tf.argmax(matches, -1, output_type=tf.int32), batch_dims=1), neighbours)
+            return neighbours
+
+        # the outer previous neighbour of the sentinel is the last slot that is not accessed
+        sentinels = tf.fill(tf.shape(slots[:, :1]), sentinel)
+        previous_neighbours = get_outer_neighbours(tf.cast(tf.gather(previous_slots, tf.concat([slots, sentinels], 1), batch_dims=1), tf.int32))
+        previous_neighbours, last_slot = previous_neighbours[:, :-1], previous_neighbours[:, -1:]
+        # the outer next neighbour of the sentinel is the first slot that is not accessed, if there is one
+        next_neighbours = get_outer_neighbours(tf.cast(tf.gather(next_slots, tf.concat([slots, sentinels], 1), batch_dims=1), tf.int32))
+        next_neighbours, first_slot = next_neighbours[:, :-1], next_neighbours[:, -1:]
+        first_slot = tf.where(first_slot == sentinel, slots[:, :1], first_slot)
+
+        # a run of accessed slots is unlinked by linking its outer neighbours, unless it ends the list, then the last slot
+        # is linked to the first accessed slot, every accessed slot to the one after it and the last one to the sentinel
+        masked_slot = tf.fill(tf.shape(slots), sentinel + 1)
+        unlinked = next_neighbours != sentinel
+        # the links of a slot accessed several times are written once
+        new_slots = slots[:, 1:] != slots[:, :-1]
+        first_occurrences = tf.concat([tf.ones_like(new_slots[:, :1]), new_slots], 1)
+        last_occurrences = tf.concat([new_slots, tf.ones_like(new_slots[:, :1])], 1)
+        next_slots = tf.tensor_scatter_nd_update(
+            next_slots, get_batch_positions(tf.concat([tf.where(unlinked, previous_neighbours, masked_slot), last_slot,
+                                                       tf.where(last_occurrences, slots, masked_slot)], 1)),
+            tf.cast(tf.concat([next_neighbours, slots, sentinels], 1), next_slots.dtype))
+        previous_slots = tf.tensor_scatter_nd_update(
+            previous_slots, get_batch_positions(tf.concat([tf.where(unlinked, next_neighbours, masked_slot), sentinels,
+                                                           tf.where(first_occurrences, slots, masked_slot)], 1)),
+            tf.cast(tf.concat([previous_neighbours, slots[:, -1:], last_slot, slots[:, :-1]], 1), previous_slots.dtype))
+        return next_slots, previous_slots, first_slot
+
+
+@tf.keras.utils.register_keras_serializable()
+class SparseDNC(tf.keras.layers.AbstractRNNCell):
+    """DNC controller with a sparse access memory in the style of Sparse Access
+    Memory (Rae et al., https://arxiv.org/abs/1610.09027).
+
+    Every read head reads the K memory slots most similar to its key. The write
+    goes to the slots read in the previous step and to the least recently used
+    slot, which is erased first. There is no temporal link matrix. The slots of
+    a read are found with an exact search over all slots or, if lsh_tables is
+    set, with locality sensitive hashing: every table hashes the memory rows
+    with lsh_bits random hyperplanes into buckets that keep the last
+    lsh_bucket_size slots written with that hash, and a read only scores the
+    slots in the buckets of its key.
+
+    The least recently used slot is the head of a LeastRecentlyUsedList and the
+    memory is only read through gather_rows, so that with lsh_tables set a step
+    and its gradient only touch O(R * (K + lsh_tables * lsh_bucket_size)) rows
+    of the memory and O(R * K) links. The state is functional though, XLA only
+    scatters into it in place if it compiles the whole recurrence together
+    with its gradient. With jit_compile set the benchmarks compile models with
+    this cell as a whole (recurrent_layer.requires_jit_compile) and the cost of
+    a step does not grow with N, apart from filling the initial state once per
+    sequence. Otherwise, and for single steps like in streaming inference,
+    every step copies the [B, N, W] memory. The exact search is O(N * W) in
+    any case.
+
+    Args:
+        output_size (int): size of final output dimension for the whole DNC cell at each time step
+        controller_units (int): size of hidden state in controller
+        memory_size (int): number of slots in external memory
+        word_size (int): the width of each memory slot
+        num_read_heads (int): number of memory read heads
+        sparse_reads (int): number of slots K every read head reads
+        lsh_tables (int): number of hash tables, 0 for the exact search
+        lsh_bits (int): number of hyperplanes of each hash table
+        lsh_bucket_size (int): number of slots a bucket keeps
+        jit_compile (bool): compile the recurrence of a RecurrentLayer with XLA
+    """
+
+    def __init__(self, output_size, controller_units=256, memory_size=256, word_size=64, num_read_heads=4,
+                 sparse_reads=4, lsh_tables=0, lsh_bits=4, lsh_bucket_size=16, jit_compile=False, **kwargs):
+        super().__init__(**kwargs)
+        if sparse_reads > memory_size:
+            raise ValueError(f'a read head can not read {sparse_reads} of {memory_size} memory slots')
+        if lsh_tables and sparse_reads > lsh_tables * lsh_bucket_size:
+            raise ValueError(f'the {lsh_tables} buckets of a key hold less than {sparse_reads} slots')
+        self._output_size = output_size
+        self._N = memory_size
+        self._W = word_size
+        self._R = num_read_heads
+        self._K = sparse_reads
+        self._lsh_tables = lsh_tables
+        self._lsh_bits = lsh_bits
+        self._lsh_bucket_size = lsh_bucket_size
+        self.compile_recurrence = jit_compile
+        self._clip = 20.0
+
+        self._controller = tf.keras.layers.LSTMCell(units=controller_units)
+        self._controller_to_interface_dense = tf.keras.layers.Dense(
+            self._R * self._W + self._R + self._W + 2,
+            name='controller_to_interface'
+        )
+        self._final_output_dense = tf.keras.layers.Dense(self._output_size)
+        self.hyperplanes = None
+
+    def build(self, input_shape):
+        if self._lsh_tables:
+            self.hyperplanes = self.add_weight('hyperplanes', (self._W, self._lsh_tables * self._lsh_bits),
+                                               initializer=tf.keras.initializers.RandomNormal(), trainable=False)
+        self.built = True
+
+    def hash(self, vectors):
+        """Bucket of each vector in each hash table.
+
+        Args:
+            vectors (Tensor [..., W])
+
+        Returns:
+            Tensor [..., lsh_tables]: bucket indices
+        """
+        bits = tf.cast(tf.tensordot(vectors, self.hyperplanes, 1) > 0, tf.int32)
+        bits = tf.reshape(bits, tf.concat([tf.shape(vectors)[:-1], [self._lsh_tables, self._lsh_bits]], 0))
+        return tf.reduce_sum(bits * 2 ** tf.range(self._lsh_bits), -1)
+
+    def get_bucket_indices(self, buckets):
+        # [batch, table, bucket] indices into the bucket state for buckets of shape [B, M, lsh_tables]
+        shape = tf.shape(buckets)
+        batch_indices = tf.broadcast_to(tf.reshape(tf.range(shape[0]), [-1, 1, 1]), shape)
+        table_indices = tf.broadcast_to(tf.range(self._lsh_tables), shape)
+        return tf.stack([batch_indices, table_indices, buckets], -1)
+
+    def update_index(self, written_rows, written_indices, buckets, bucket_positions):
+        """Insert the written slots into the buckets of their new contents, the
+        oldest slot of a bucket is replaced. Stale entries of a slot in other
+        buckets are kept, reads score their candidates on the current memory.
+        """
+        bucket_indices = self.get_bucket_indices(self.hash(written_rows))
+        positions = tf.cast(tf.gather_nd(bucket_positions, bucket_indices), tf.int32)
+        entry_indices = tf.concat([bucket_indices, positions[..., tf.newaxis]], -1)
+        slots = tf.cast(tf.broadcast_to(written_indices[..., tf.newaxis], tf.shape(positions)), buckets.dtype)
+        buckets = tf.tensor_scatter_nd_update(buckets, entry_indices, slots)
+        bucket_positions = tf.tensor_scatter_nd_update(bucket_positions, bucket_indices,
+                                                       tf.cast((positions + 1) % self._lsh_bucket_size, bucket_positions.dtype))
+        return buckets, bucket_positions
+
+    def search(self, memory_matrix, read_keys, buckets=None):
+        """Find and read the K slots most similar to each key.
+
+        Args:
+            memory_matrix (Tensor [B, N, W])
+            read_keys (Tensor [B, R, W])
+            buckets (Tensor [B, lsh_tables, 2 ** lsh_bits, lsh_bucket_size]): the hash tables, None for the exact search
+
+        Returns:
+            Tuple(Tensor [B, R, K], Tensor [B, R, K], Tensor [B, R, K, W], Tensor [B, N, W]):
+                cosine similarities, slot indices, the rows of the slots and the memory passed on by gather_rows
+        """
+        keys_normalised = tf.math.l2_normalize(read_keys, -1, epsilon=EPSILON)
+        if buckets is None:
+            similarity = tf.matmul(keys_normalised, tf.math.l2_normalize(memory_matrix, -1, epsilon=EPSILON), transpose_b=True)
+            similarity, indices = tf.math.top_k(similarity, self._K)
+            rows, memory_matrix = gather_rows(memory_matrix, tf.reshape(indices, (-1, self._R * self._K)))
+            return similarity, indices, tf.reshape(rows, (-1, self._R, self._K, self._W)), memory_matrix
+        candidates = tf.gather_nd(buckets, self.get_bucket_indices(self.hash(read_keys)))
+        # a slot can be in the buckets of several tables, duplicates get a similarity below any cosine similarity
+        candidates = tf.sort(tf.reshape(tf.cast(candidates, tf.int32), [-1, self._R, self._lsh_tables * self._lsh_bucket_size]), -1)
+        duplicates = tf.concat([tf.zeros_like(candidates[..., :1], tf.bool), candidates[..., 1:] == candidates[..., :-1]], -1)
+        rows, memory_matrix = gather_rows(memory_matrix, tf.reshape(candidates, (-1, self._R * self._lsh_tables * self._lsh_bucket_size)))
+        rows = tf.reshape(rows, (-1, self._R, self._lsh_tables * self._lsh_bucket_size, self._W))
+        rows_normalised = tf.math.l2_normalize(rows, -1, epsilon=EPSILON)
+        similarity = tf.where(duplicates, -2.0, tf.einsum('brcw,brw->brc', rows_normalised, keys_normalised))
+        similarity, positions = tf.math.top_k(similarity, self._K)
+        return similarity, tf.gather(candidates, positions, batch_dims=2), tf.gather(rows, positions, batch_dims=2), memory_matrix
+
+    def call(self, inputs, prev_state):
+        inputs = model_factory.get_concat_inputs(inputs)
+        memory_matrix, next_slots, previous_slots, least_recently_used, prev_read_indices, prev_read_values, prev_read_vectors = prev_state[:7]
+        controller_state = list(prev_state[7:9])
+        # stateful layers pass their state variables to the first step and XLA can not gather_nd from variables
+        index_state = [tf.convert_to_tensor(x) for x in prev_state[9:]]
+
+        input_augmented = tf.concat([inputs, tf.reshape(prev_read_vectors, (-1, self._W * self._R))], 1)
+        controller_output, controller_state = self._controller(input_augmented, controller_state)
+        controller_output = tf.clip_by_value(controller_output, -self._clip, self._clip)
+        read_keys, read_strengths, write_vector, write_gate, interpolation_gate = tf.split(
+            self._controller_to_interface_dense(controller_output), [self._R * self._W, self._R, self._W, 1, 1], 1)
+        read_keys = tf.reshape(read_keys, (-1, self._R, self._W))
+        read_strengths = 1 + tf.nn.softplus(read_strengths)
+        write_gate = tf.nn.sigmoid(write_gate)
+        interpolation_gate = tf.nn.sigmoid(interpolation_gate)
+
+        with tf.name_scope("write"):
+            written_indices = tf.concat([tf.reshape(tf.cast(prev_read_indices, tf.int32), (-1, self._R * self._K)),
+                                         tf.cast(least_recently_used, tf.int32)], 1)
+            write_weighting = write_gate * tf.concat([interpolation_gate * tf.reshape(prev_read_values, (-1, self._R * self._K)) / self._R,
+                                                      1 - interpolation_gate], 1)
+            # the least recently used slot is erased by adding its negated contents in the same scatter as the write
+            erased_row, memory_matrix = gather_rows(memory_matrix, written_indices[:, -1:])
+            memory_matrix = tf.tensor_scatter_nd_add(
+                memory_matrix, get_batch_positions(tf.concat([written_indices[:, -1:], written_indices], 1)),
+                tf.concat([-erased_row, write_weighting[..., tf.newaxis] * write_vector[:, tf.newaxis, :]], 1))
+            if self._lsh_tables:
+                written_rows, memory_matrix = gather_rows(memory_matrix, written_indices)
+                index_state = self.update_index(written_rows, written_indices, *index_state)
+
+        with tf.name_scope("read"):
+            similarity, read_indices, read_rows, memory_matrix = self.search(memory_matrix, read_keys,
+                                                                             index_state[0] if self._lsh_tables else None)
+            read_values = tf.math.softmax(similarity * tf.math.softplus(read_strengths)[..., tf.newaxis], -1)
+            read_vectors = tf.einsum('brk,brkw->bwr', read_values, read_rows)
+
+        next_slots, previous_slots, next_least_recently_used = LeastRecentlyUsedList.move_to_back(
+            next_slots, previous_slots, tf.concat([written_indices, tf.reshape(read_indices, (-1, self._R * self._K))], 1))
+
+        final_output = self._final_output_dense(tf.concat([controller_output, tf.reshape(read_vectors, (-1, self._W * self._R))], 1))
+        final_output = tf.clip_by_value(final_output, -self._clip, self._clip)
+        return final_output, [memory_matrix, next_slots, previous_slots, tf.cast(next_least_recently_used, least_recently_used.dtype),
+                              tf.cast(read_indices, prev_read_indices.dtype), read_values, read_vectors] + list(controller_state) + list(index_state)
+
+    @property
+    def state_size(self):
+        # the slot indices are kept as floats like the rest of the state
+        state_size = [tf.TensorShape([self._N, self._W]), tf.TensorShape([self._N + 2]), tf.TensorShape([self._N + 2]), tf.TensorShape([1]),
+                      tf.TensorShape([self._R, self._K]), tf.TensorShape([self._R, self._K]), tf.TensorShape([self._W, self._R])]
+        state_size += list(self._controller.state_size)
+        if self._lsh_tables:
+            state_size += [tf.TensorShape([self._lsh_tables, 2 ** self._lsh_bits, self._lsh_bucket_size]),
+                           tf.TensorShape([self._lsh_tables, 2 ** self._lsh_bits])]
+        return state_size
+
+    def get_initial_state(self, inputs=None, batch_size=None, dtype=tf.float32):
+        del inputs
+        initial_state = [tf.fill([batch_size, self._N, self._W], EPSILON)]
+        initial_state += list(LeastRecentlyUsedList.initial_state(batch_size, self._N, dtype))
+        initial_state += [
+            tf.tile(tf.range(self._K, dtype=dtype)[tf.newaxis, tf.newaxis], [batch_size, self._R, 1]),
+            tf.fill([batch_size, self._R, self._K], EPSILON),
+            tf.fill([batch_size, self._W, self._R], EPSILON),
+        ]
+        initial_state += list(self._controller.get_initial_state(batch_size=batch_size, dtype=dtype))
+        if self._lsh_tables:
+            # the buckets start with all slots spread over them, so that every key has candidates
+            bucket_shape = [self._lsh_tables, 2 ** self._lsh_bits, self._lsh_bucket_size]
+            initial_buckets = tf.reshape(tf.range(self._lsh_tables * 2 ** self._lsh_bits * self._lsh_bucket_size) % self._N, bucket_shape)
+            initial_state += [tf.tile(tf.cast(initial_buckets, dtype)[tf.newaxis], [batch_size, 1, 1, 1]),
+                              tf.zeros([batch_size] + bucket_shape[:2], dtype=dtype)]
+        return initial_state
+
+    @property
+    def output_size(self):
+        return self._output_size
+
+    def get_config(self):
+        config = super().get_config().copy()
+        config.update({
+            'output_size': self.output_size,
+            'controller_units': self._controller.units,
+            'memory_size': self._N,
+            'word_size': self._W,
+            'num_read_heads': self._R,
+            'sparse_reads': self._K,
+            'lsh_tables': self._lsh_tables,
+            'lsh_bits': self._lsh_bits,
+            'lsh_bucket_size': self._lsh_bucket_size,
+            'jit_compile': self.compile_recurrence
+        })
+        return config
@@ -1,77 +1,135 @@
+import numpy as np
 import tensorflow as tf
-import tensorflow_probability as tfp
 
 import experiments.models.model_factory as model_factory
+import experiments.models.recurrent_layer as recurrent_layer
 import experiments.models.unitary_rnn as urnn
 
 
 def get_unitary_matrix(vector):
+    import tensorflow_probability as tfp
     triangular_matrix = tfp.math.fill_triangular(vector)
     skew_hermitian_matrix = triangular_matrix - tf.linalg.adjoint(triangular_matrix)
     unitary_matrix = tf.linalg.expm(skew_hermitian_matrix)
     return unitary_matrix
 
 
+def get_real_unitary_matrix(real_vector, imag_vector):
+    # realification [[A, -B], [B, A]] of the unitary matrix A + iB, it commutes with the matrix exponential
+    import tensorflow_probability as tfp
+    real_triangular_matrix = tfp.math.fill_triangular(real_vector)
+    imag_triangular_matrix = tfp.math.fill_triangular(imag_vector)
+    real_skew_hermitian_matrix = real_triangular_matrix - tf.transpose(real_triangular_matrix)
+    imag_skew_hermitian_matrix = imag_triangular_matrix + tf.transpose(imag_triangular_matrix)
+    return tf.linalg.expm(tf.concat((tf.concat((real_skew_hermitian_matrix, -imag_skew_hermitian_matrix), 1),
+                                     tf.concat((imag_skew_hermitian_matrix, real_skew_hermitian_matrix), 1)), 0))
+
+
+def get_dft_matrices(size):
+    frequencies = 2 * np.pi * np.outer(np.arange(size), np.arange(size)) / size
+    return tf.constant(np.cos(frequencies), tf.float32), tf.constant(-np.sin(frequencies), tf.float32)
+
+
 @tf.keras.utils.register_keras_serializable()
 class MatrixExponentialUnitaryRNN(tf.keras.layers.AbstractRNNCell):
-    def __init__(self, state_size, output_size, capacity_measure=1, use_fft=False, trainable_initial_state=False, **kwargs):
+    def __init__(self, state_size, output_size, capacity_measure=1, use_fft=False, trainable_initial_state=False, real_arithmetic=False,
+                 precompute_inputs=False, **kwargs):
         super().__init__(**kwargs)
         self.state_size_value = state_size
         self.output_size_value = output_size
         assert 0 <= capacity_measure <= 1
-        self.full_capacity = self.state_size * (self.state_size + 1) // 2
+        self.full_capacity = self.state_size_value * (self.state_size_value + 1) // 2
         self.capacity = int(capacity_measure * self.full_capacity)
         self.remaining_capacity = self.full_capacity - self.capacity
         self.use_fft = use_fft
         self.trainable_initial_state = trainable_initial_state
+        # complex values are kept as real and imaginary float32 parts, the state is their concatenation
+        self.real_arithmetic = real_arithmetic
+        self.precompute_inputs = precompute_inputs
         self.real_state_vector = self.add_weight('real_state_vector', (self.capacity,), tf.float32, tf.keras.initializers.Constant())
         self.imag_state_vector = self.add_weight('imag_state_vector', (self.capacity,), tf.float32, tf.keras.initializers.Constant())
-        self.real_initial_state = self.add_weight('real_initial_state', (self.state_size,), tf.float32, tf.keras.initializers.Constant(), trainable=self.trainable_initial_state)
-        self.imag_initial_state = self.add_weight('imag_initial_state', (self.state_size,), tf.float32, tf.keras.initializers.Constant(), trainable=self.trainable_initial_state)
-        self.bias = self.add_weight('bias', (self.state_size,), tf.float32, tf.keras.initializers.Constant())
+        self.real_initial_state = self.add_weight('real_initial_state', (self.state_size_value,), tf.float32, tf.keras.initializers.Constant(), trainable=self.trainable_initial_state)
+        self.imag_initial_state = self.add_weight('imag_initial_state', (self.state_size_value,), tf.float32, tf.keras.initializers.Constant(), trainable=self.trainable_initial_state)
+        self.bias = self.add_weight('bias', (self.state_size_value,), tf.float32, tf.keras.initializers.Constant())
         self.output_layer = tf.keras.layers.Dense(self.output_size)
         self.real_input_matrix = None
         self.imag_input_matrix = None
+        self.precomputed_weights = None
 
     @property
     def state_size(self):
-        return self.state_size_value
+        return 2 * self.state_size_value if self.real_arithmetic else self.state_size_value
 
     @property
     def output_size(self):
         return self.output_size_value
 
     def get_initial_state(self, inputs=None, batch_size=None, dtype=None):
+        if self.real_arithmetic:
+            return tf.repeat(tf.concat((self.real_initial_state, self.imag_initial_state), 0)[tf.newaxis, ...], batch_size, 0)
         return tf.repeat(tf.complex(self.real_initial_state, self.imag_initial_state)[tf.newaxis, ...], batch_size, 0)
 
     def build(self, input_shape):
         inputs_size = model_factory.get_concat_input_shape(input_shape)
         factor = 2 if self.use_fft else 1
-        self.real_input_matrix = self.add_weight('real_input_matrix', (self.state_size, factor * inputs_size), tf.float32, tf.keras.initializers.GlorotUniform())
-        self.imag_input_matrix = self.add_weight('imag_input_matrix', (self.state_size, factor * inputs_size), tf.float32, tf.keras.initializers.GlorotUniform())
+        self.real_input_matrix = self.add_weight('real_input_matrix', (self.state_size_value, factor * inputs_size), tf.float32, tf.keras.initializers.GlorotUniform())
+        self.imag_input_matrix = self.add_weight('imag_input_matrix', (self.state_size_value, factor * inputs_size), tf.float32, tf.keras.initializers.GlorotUniform())
 
-    def call(self, inputs, states):
-        inputs = model_factory.get_concat_inputs(inputs)
-        state_matrix = get_unitary_matrix(tf.concat((tf.complex(self.real_state_vector, self.imag_state_vector), tf.zeros((self.remaining_capacity,), tf.complex64)), -1))
-        input_matrix = tf.complex(self.real_input_matrix, self.imag_input_matrix)
-        time_domain_inputs = tf.cast(inputs, tf.complex64)
+    def get_input_kernel(self, inputs_size):
+        # the [in, 2 * state_size] kernel that maps the real inputs to the real and imaginary parts of input_matrix @ augmented_inputs,
+        # the fft features x @ (C + iS) with the dft matrices C and S are folded into the kernel
         if self.use_fft:
-            frequency_domain_inputs = tf.signal.fft(time_domain_inputs)
-            augmented_inputs = tf.concat((time_domain_inputs, frequency_domain_inputs), -1)
+            real_dft_matrix, imag_dft_matrix = get_dft_matrices(inputs_size)
+            real_time_matrix, real_frequency_matrix = tf.split(tf.transpose(self.real_input_matrix), 2, 0)
+            imag_time_matrix, imag_frequency_matrix = tf.split(tf.transpose(self.imag_input_matrix), 2, 0)
+            real_kernel = real_time_matrix + tf.matmul(real_dft_matrix, real_frequency_matrix) - tf.matmul(imag_dft_matrix, imag_frequency_matrix)
+            imag_kernel = imag_time_matrix + tf.matmul(real_dft_matrix, imag_frequency_matrix) + tf.matmul(imag_dft_matrix, real_frequency_matrix)
         else:
-            augmented_inputs = time_domain_inputs
-        input_parts = tf.matmul(input_matrix, augmented_inputs[..., tf.newaxis])
-        state_parts = tf.matmul(state_matrix, states[0][..., tf.newaxis])
-        next_states = tf.squeeze(urnn.modrelu(state_parts + input_parts, self.bias[..., tf.newaxis]), -1)
+            real_kernel, imag_kernel = tf.transpose(self.real_input_matrix), tf.transpose(self.imag_input_matrix)
+        return tf.concat((real_kernel, imag_kernel), -1)
+
+    def project_inputs(self, inputs):
+        inputs = model_factory.get_concat_inputs(inputs)
+        return recurrent_layer.dense_projection(inputs, self.get_input_kernel(inputs.shape[-1]))
+
+    def get_state_matrix(self):
+        if self.real_arithmetic:
+            remaining_vector = tf.zeros((self.remaining_capacity,), tf.float32)
+            return get_real_unitary_matrix(tf.concat((self.real_state_vector, remaining_vector), -1),
+                                           tf.concat((self.imag_state_vector, remaining_vector), -1))
+        return get_unitary_matrix(tf.concat((tf.complex(self.real_state_vector, self.imag_state_vector), tf.zeros((self.remaining_capacity,), tf.complex64)), -1))
+
+    def precompute_weights(self):
+        # the matrix exponential depends only on the weights, the recurrent layer computes it once per sequence
+        return (self.get_state_matrix(),)
+
+    def real_call(self, input_parts, state_matrix, states):
+        input_parts = tf.split(input_parts, 2, 1)
+        state_parts = tf.split(tf.matmul(states[0], state_matrix, transpose_b=True), 2, 1)
+        next_states = tf.concat(urnn.modrelu_real((state_parts[0] + input_parts[0], state_parts[1] + input_parts[1]), self.bias), -1)
+        outputs = self.output_layer(next_states)
+        return outputs, (next_states,)
+
+    def call(self, inputs, states):
+        # the inputs are already projected if the recurrent layer precomputed them for the whole sequence
+        input_parts = inputs if self.precompute_inputs else self.project_inputs(inputs)
+        state_matrix = self.get_state_matrix() if self.precomputed_weights is None else self.precomputed_weights[0]
+        if self.real_arithmetic:
+            return self.real_call(input_parts, state_matrix, states)
+        input_parts = tf.complex(*tf.split(input_parts, 2, 1))
+        state_parts = tf.matmul(states[0], state_matrix, transpose_b=True)
+        next_states = urnn.modrelu(state_parts + input_parts, self.bias)
         outputs = self.output_layer(tf.concat((tf.math.real(next_states), tf.math.imag(next_states)), -1))
         return outputs, (next_states,)
 
     def get_config(self):
         config = super().get_config().copy()
         config.update({
-            'state_size': self.state_size,
+            'state_size': self.state_size_value,
             'output_size': self.output_size,
             'use_fft': self.use_fft,
-            'trainable_initial_state': self.trainable_initial_state
+            'trainable_initial_state': self.trainable_initial_state,
+            'real_arithmetic': self.real_arithmetic,
+            'precompute_inputs': self.precompute_inputs
         })
         return config
@@ -7,7 +7,7 @@ import experiments.models.transformer as transformer
 @tf.keras.utils.register_keras_serializable()
 class MemoryAugmentedTransformerCell(tf.keras.layers.AbstractRNNCell):
     def __init__(self, memory_rows=16, memory_columns=16, output_size=1,
-                 embedding_size=32, heads=2, feed_forward_size=128, dropout_rate=0, **kwargs):
+                 embedding_size=32, heads=2, feed_forward_size=128, dropout_rate=0, precompute_inputs=False, **kwargs):
         super().__init__(**kwargs)
         self.memory_rows = memory_rows
         self.memory_columns = memory_columns
@@ -22,10 +22,11 @@ class MemoryAugmentedTransformerCell(tf.keras.layers.AbstractRNNCell):
         self.feed_forward_size = feed_forward_size
         self.feed_forward_layer = transformer.feed_forward_network(self.embedding_size, self.feed_forward_size)
         self.layer_normalization = tf.keras.layers.LayerNormalization(epsilon=1E-6)
-        self.state_size_value = ((self.memory_rows, self.memory_columns),)
+        self.state_size_value = (tf.TensorShape((self.memory_rows, self.memory_columns)),)
         self.dropout_rate = dropout_rate
         self.dropout_layer = tf.keras.layers.Dropout(self.dropout_rate)
         self.positional_encoding = transformer.positional_encoding(tf.range(1 + self.memory_rows)[tf.newaxis, ..., tf.newaxis], self.embedding_size)
+        self.precompute_inputs = precompute_inputs
 
     @property
     def state_size(self):
@@ -38,11 +39,15 @@ class MemoryAugmentedTransformerCell(tf.keras.layers.AbstractRNNCell):
     def get_initial_state(self, inputs=None, batch_size=None, dtype=None):
         return tf.fill((batch_size, self.memory_rows, self.memory_columns), 1E-6)
 
+    def project_inputs(self, inputs):
+        return self.input_embedding(model_factory.get_concat_inputs(inputs))
+
     def call(self, inputs, states):
-        inputs = model_factory.get_concat_inputs(inputs)
+        if not self.precompute_inputs:
+            inputs = self.project_inputs(inputs)
         memory_state = states[0]
         embedded_memory_contents = self.memory_embedding(memory_state)
-        embedded_inputs = self.input_embedding(tf.expand_dims(inputs, -2))
+        embedded_inputs = tf.expand_dims(inputs, -2)
         augmented_inputs = tf.concat((embedded_inputs, embedded_memory_contents), -2) + self.positional_encoding
         augmented_inputs = self.dropout_layer(augmented_inputs)
         attention_output = self.dropout_layer(self.attention((augmented_inputs, augmented_inputs, augmented_inputs, None))[0]) + augmented_inputs
@@ -65,6 +70,7 @@ class MemoryAugmentedTransformerCell(tf.keras.layers.AbstractRNNCell):
             'embedding_size': self.embedding_size,
             'heads': self.heads,
             'feed_forward_size': self.feed_forward_size,
-            'dropout_rate': self.dropout_rate
+            'dropout_rate': self.dropout_rate,
+            'precompute_inputs': self.precompute_inputs
         })
         return config
@@ -1,25 +1,57 @@
-import tensorflow as tf
-
-import experiments.models.ct_gru as ct_gru
-import experiments.models.ct_rnn as ct_rnn
-import experiments.models.differentiable_neural_computer as dnc
-import experiments.models.matrix_exponential_unitary_rnn as meurnn
-import experiments.models.memory_augmented_transformer as mat
-import experiments.models.memory_cell as memory_cell
-import experiments.models.neural_circuit_policies as ncp
-import experiments.models.ode_lstm as ode_lstm
-import experiments.models.transformer as transformer
-import experiments.models.unitary_ncp as uncp
-import experiments.models.unitary_rnn as urnn
-
-MODEL_ARGUMENTS = ['memory_cell', 'memory_augmented_transformer', 'lstm',
-                   'differentiable_neural_computer', 'unitary_rnn', 'matrix_exponential_unitary_rnn',
-                   'transformer', 'recurrent_network_attention_transformer', 'recurrent_network_augmented_transformer',
-                   'gru', 'neural_circuit_policies', 'ct_rnn',
-                   'ct_gru', 'ode_lstm', 'unitary_ncp']
+import collections
+import dataclasses
+import importlib
+import json
+import os
+
+ModelEntry = collections.namedtuple('ModelEntry', ['builder', 'config_class', 'search_space', 'module_names'])
+
+MODEL_REGISTRY = {}
+
+
+def register_model(model_name, config_class, search_space=None, module_names=()):
+    def decorator(builder):
+        assert model_name not in MODEL_REGISTRY
+        MODEL_REGISTRY[model_name] = ModelEntry(builder, config_class, search_space or {}, module_names)
+        return builder
+
+    return decorator
+
+
+def get_model_entry(model_name):
+    if model_name not in MODEL_REGISTRY:
+        raise ValueError(f'unknown model {model_name}, registered models are {list(MODEL_REGISTRY)}')
+    return MODEL_REGISTRY[model_name]
+
+
+def has_config_field(model_name, field_name):
+    return field_name in {x.name for x in dataclasses.fields(get_model_entry(model_name).config_class)}
+
+
+def import_model_modules(model_name):
+    # the model modules register their custom keras objects, which is needed before a saved model is loaded
+    return [importlib.import_module(x) for x in get_model_entry(model_name).module_names]
+
+
+def load_model_config(value):
+    if os.path.isfile(value):
+        with open(value) as config_file:
+            return json.load(config_file)
+    return json.loads(value)
+
+
+def create_model_config(model_name, overrides=None):
+    config_class = get_model_entry(model_name).config_class
+    fields = {x.name: x for x in dataclasses.fields(config_class)}
+    overrides = overrides or {}
+    unknown_keys = sorted(set(overrides) - set(fields))
+    if unknown_keys:
+        raise ValueError(f'unknown config keys {unknown_keys} for model {model_name}, valid keys are {list(fields)}')
+    return config_class(**{name: fields[name].type(value) for name, value in overrides.items()})
 
 
 def get_concat_inputs(inputs):
+    import tensorflow as tf
     if isinstance(inputs, tuple):
         return tf.concat(inputs, -1)
     else:
@@ -33,75 +65,280 @@ def get_concat_input_shape(input_shape):
         return input_shape[-1]
 
 
-def get_ct_gru_output(output_size, input_tensor):
-    return tf.keras.layers.Dense(output_size)(
-        tf.keras.layers.RNN(ct_gru.CTGRU(32))(input_tensor))
+@dataclasses.dataclass(frozen=True)
+class MemoryCellConfig:
+    discretization_steps: int = 2
+    remat_segment_length: int = 0
 
 
-def get_ct_rnn_output(output_size, input_tensor):
+@register_model('memory_cell', MemoryCellConfig, {'discretization_steps': [1, 2, 4]},
+                ('experiments.models.memory_cell', 'experiments.models.recurrent_layer'))
+def get_memory_cell_output(output_size, input_tensor, config):
+    import experiments.models.memory_cell as memory_cell
+    import experiments.models.recurrent_layer as recurrent_layer
+    assert output_size == 2
+    return recurrent_layer.RecurrentLayer(memory_cell.MemoryCell(config.discretization_steps), config.remat_segment_length,
+                                          return_sequences=True)(input_tensor)
+
+
+@dataclasses.dataclass(frozen=True)
+class MemoryAugmentedTransformerConfig:
+    memory_rows: int = 16
+    memory_columns: int = 16
+    embedding_size: int = 32
+    heads: int = 2
+    feed_forward_size: int = 128
+    dropout_rate: float = 0
+    precompute_inputs: bool = True
+    remat_segment_length: int = 0
+
+
+@register_model('memory_augmented_transformer', MemoryAugmentedTransformerConfig,
+                {'memory_rows': [8, 16, 32], 'memory_columns': [8, 16, 32], 'embedding_size': [16, 32, 64],
+                 'heads': [1, 2, 4], 'feed_forward_size': [64, 128, 256]},
+                ('experiments.models.memory_augmented_transformer', 'experiments.models.recurrent_layer'))
+def get_memory_augmented_transformer_output(output_size, input_tensor, config):
+    import experiments.models.memory_augmented_transformer as mat
+    import experiments.models.recurrent_layer as recurrent_layer
+    return recurrent_layer.RecurrentLayer(mat.MemoryAugmentedTransformerCell(
+        config.memory_rows, config.memory_columns, output_size, config.embedding_size, config.heads,
+        config.feed_forward_size, config.dropout_rate, config.precompute_inputs), config.remat_segment_length)(input_tensor)
+
+
+@dataclasses.dataclass(frozen=True)
+class LSTMConfig:
+    units: int = 64
+
+
+@register_model('lstm', LSTMConfig, {'units': [32, 64, 128]})
+def get_lstm_output(output_size, input_tensor, config):
+    import tensorflow as tf
     return tf.keras.layers.Dense(output_size)(
-        tf.keras.layers.RNN(ct_rnn.CTRNNCell(128, 'rk4', 3))(input_tensor))
+        tf.keras.layers.LSTM(config.units)(get_concat_inputs(input_tensor)))
+
+
+@dataclasses.dataclass(frozen=True)
+class DifferentiableNeuralComputerConfig:
+    controller_units: int = 64
+    memory_size: int = 16
+    word_size: int = 8
+    num_read_heads: int = 2
+    fused: bool = True
+    jit_compile: bool = False
+    sparse_reads: int = 0
+    lsh_tables: int = 0
+    lsh_bits: int = 4
+    lsh_bucket_size: int = 16
+    remat_segment_length: int = 0
+
+
+@register_model('differentiable_neural_computer', DifferentiableNeuralComputerConfig,
+                {'controller_units': [32, 64, 128], 'memory_size': [16, 32, 64], 'word_size': [8, 16], 'num_read_heads': [1, 2, 4]},
+                ('experiments.models.differentiable_neural_computer', 'experiments.models.recurrent_layer'))
+def get_differentiable_neural_computer_output(output_size, input_tensor, config):
+    import experiments.models.differentiable_neural_computer as dnc
+    import experiments.models.recurrent_layer as recurrent_layer
+    if config.sparse_reads:
+        cell = dnc.SparseDNC(output_size, config.controller_units, config.memory_size, config.word_size, config.num_read_heads,
+                             config.sparse_reads, config.lsh_tables, config.lsh_bits, config.lsh_bucket_size, config.jit_compile)
+    elif config.fused:
+        cell = dnc.FusedDNC(output_size, config.controller_units, config.memory_size, config.word_size, config.num_read_heads,
+                            jit_compile=config.jit_compile)
+    else:
+        cell = dnc.DNC(output_size, config.controller_units, config.memory_size, config.word_size, config.num_read_heads)
+    return recurrent_layer.RecurrentLayer(cell, config.remat_segment_length)(input_tensor)
+
+
+@dataclasses.dataclass(frozen=True)
+class UnitaryRNNConfig:
+    num_units: int = 128
+    capacity: int = 16
+    real_arithmetic: bool = False
+    structured_permutations: bool = True
+    jit_compile: bool = False
+    precompute_inputs: bool = True
+    remat_segment_length: int = 0
+
+
+@register_model('unitary_rnn', UnitaryRNNConfig, {'num_units': [64, 128, 256], 'capacity': [4, 8, 16, 32]},
+                ('experiments.models.unitary_rnn', 'experiments.models.recurrent_layer'))
+def get_unitary_rnn_output(output_size, input_tensor, config):
+    import tensorflow as tf
+    import experiments.models.recurrent_layer as recurrent_layer
+    import experiments.models.unitary_rnn as urnn
+    return tf.keras.layers.Dense(output_size)(
+        tf.math.real(recurrent_layer.RecurrentLayer(urnn.EUNNCell(config.num_units, config.capacity, real_arithmetic=config.real_arithmetic,
+                                                                  structured_permutations=config.structured_permutations,
+                                                                  jit_compile=config.jit_compile,
+                                                                  precompute_inputs=config.precompute_inputs),
+                                                    config.remat_segment_length)(input_tensor)))
 
 
-def get_ode_lstm_output(output_size, input_tensor):
-    return tf.keras.layers.Dense(output_size)(
-        tf.keras.layers.RNN(ode_lstm.ODELSTM(64))(input_tensor))
+@dataclasses.dataclass(frozen=True)
+class MatrixExponentialUnitaryRNNConfig:
+    state_size: int = 128
+    real_arithmetic: bool = False
+    precompute_inputs: bool = True
+    remat_segment_length: int = 0
 
 
-def get_differentiable_neural_computer_output(output_size, input_tensor):
-    return tf.keras.layers.RNN(dnc.DNC(output_size, 64, 16, 8, 2))(input_tensor)
+@register_model('matrix_exponential_unitary_rnn', MatrixExponentialUnitaryRNNConfig, {'state_size': [32, 64, 128, 256]},
+                ('experiments.models.matrix_exponential_unitary_rnn', 'experiments.models.recurrent_layer'))
+def get_matrix_exponential_unitary_rnn_output(output_size, input_tensor, config):
+    import experiments.models.matrix_exponential_unitary_rnn as meurnn
+    import experiments.models.recurrent_layer as recurrent_layer
+    return recurrent_layer.RecurrentLayer(meurnn.MatrixExponentialUnitaryRNN(config.state_size, output_size, real_arithmetic=config.real_arithmetic,
+                                                                             precompute_inputs=config.precompute_inputs),
+                                          config.remat_segment_length)(input_tensor)
 
 
-def get_unitary_rnn_output(output_size, input_tensor):
-    return tf.keras.layers.Dense(output_size)(
-        tf.math.real(tf.keras.layers.RNN(urnn.EUNNCell(128, 16))(input_tensor)))
+@dataclasses.dataclass(frozen=True)
+class TransformerConfig:
+    d_model: int = 16
+    num_heads: int = 2
+    d_ff: int = 64
+    num_layers: int = 2
+    dropout_rate: float = 0
+
+
+@dataclasses.dataclass(frozen=True)
+class RecurrentTransformerConfig:
+    d_model: int = 8
+    num_heads: int = 1
+    d_ff: int = 32
+    num_layers: int = 1
+    dropout_rate: float = 0
+
+
+def get_transformer_output_by_attention(output_size, input_tensor, config, attention):
+    import experiments.models.transformer as transformer
+    return transformer.Transformer(token_amount=1, token_size=output_size, d_model=config.d_model, num_heads=config.num_heads,
+                                   d_ff=config.d_ff, num_layers=config.num_layers, dropout_rate=config.dropout_rate,
+                                   attention=attention)(input_tensor)
 
 
-def get_unitary_ncp_output(output_size, input_tensor):
-    return uncp.UnitaryNCP(32, 8, output_size)(input_tensor)
+@register_model('transformer', TransformerConfig,
+                {'d_model': [8, 16, 32], 'num_heads': [1, 2, 4], 'd_ff': [32, 64, 128], 'num_layers': [1, 2, 3]},
+                ('experiments.models.transformer',))
+def get_transformer_output(output_size, input_tensor, config):
+    return get_transformer_output_by_attention(output_size, input_tensor, config, 'mha')
 
 
-def get_matrix_exponential_unitary_rnn_output(output_size, input_tensor):
-    return tf.keras.layers.RNN(meurnn.MatrixExponentialUnitaryRNN(128, output_size))(input_tensor)
+@register_model('recurrent_network_attention_transformer', RecurrentTransformerConfig,
+                {'d_model': [8, 16], 'num_heads': [1, 2], 'd_ff': [16, 32, 64]},
+                ('experiments.models.transformer',))
+def get_recurrent_network_attention_transformer_output(output_size, input_tensor, config):
+    return get_transformer_output_by_attention(output_size, input_tensor, config, 'rna')
 
 
-def get_lstm_output(output_size, input_tensor):
+@register_model('recurrent_network_augmented_transformer', RecurrentTransformerConfig,
+                {'d_model': [8, 16], 'num_heads': [1, 2], 'd_ff': [16, 32, 64]},
+                ('experiments.models.transformer',))
+def get_recurrent_network_augmented_transformer_output(output_size, input_tensor, config):
+    return get_transformer_output_by_attention(output_size, input_tensor, config, 'rnat')
+
+
+@dataclasses.dataclass(frozen=True)
+class GRUConfig:
+    units: int = 80
+
+
+@register_model('gru', GRUConfig, {'units': [40, 80, 160]})
+def get_gru_output(output_size, input_tensor, config):
+    import tensorflow as tf
     return tf.keras.layers.Dense(output_size)(
-        tf.keras.layers.LSTM(64)(get_concat_inputs(input_tensor)))
+        tf.keras.layers.GRU(config.units)(get_concat_inputs(input_tensor)))
+
 
+@dataclasses.dataclass(frozen=True)
+class NeuralCircuitPoliciesConfig:
+    units: int = 16
+    sparse_wiring: bool = True
+    ode_unfolds: int = 6
 
-def get_gru_output(output_size, input_tensor):
+
+@register_model('neural_circuit_policies', NeuralCircuitPoliciesConfig, {'units': [8, 16, 32]},
+                ('experiments.models.neural_circuit_policies',))
+def get_neural_circuit_policies_output(output_size, input_tensor, config):
+    import experiments.models.neural_circuit_policies as ncp
+    return ncp.NeuralCircuitPolicies(config.units, output_size, sparse_wiring=config.sparse_wiring, ode_unfolds=config.ode_unfolds)(input_tensor)
+
+
+@dataclasses.dataclass(frozen=True)
+class CTRNNConfig:
+    units: int = 128
+    method: str = 'rk4'
+    num_unfolds: int = 3
+    precompute_inputs: bool = True
+    remat_segment_length: int = 0
+
+
+@register_model('ct_rnn', CTRNNConfig,
+                {'units': [32, 64, 128, 256], 'method': ['euler', 'heun', 'rk4'], 'num_unfolds': [1, 3, 6]},
+                ('experiments.models.ct_rnn', 'experiments.models.recurrent_layer'))
+def get_ct_rnn_output(output_size, input_tensor, config):
+    import tensorflow as tf
+    import experiments.models.ct_rnn as ct_rnn
+    import experiments.models.recurrent_layer as recurrent_layer
     return tf.keras.layers.Dense(output_size)(
-        tf.keras.layers.GRU(80)(get_concat_inputs(input_tensor)))
+        recurrent_layer.RecurrentLayer(ct_rnn.CTRNNCell(config.units, config.method, config.num_unfolds,
+                                                        precompute_inputs=config.precompute_inputs),
+                                       config.remat_segment_length)(input_tensor))
 
 
-def get_transformer_output(output_size, input_tensor):
-    return transformer.Transformer(token_amount=1, token_size=output_size, d_model=16, num_heads=2, d_ff=64,
-                                   num_layers=2, dropout_rate=0, attention='mha')(input_tensor)
+@dataclasses.dataclass(frozen=True)
+class CTGRUConfig:
+    units: int = 32
+    precompute_inputs: bool = True
+    remat_segment_length: int = 0
 
 
-def get_recurrent_network_attention_transformer_output(output_size, input_tensor):
-    return transformer.Transformer(token_amount=1, token_size=output_size, d_model=8, num_heads=1, d_ff=32,
-                                   num_layers=1, dropout_rate=0, attention='rna')(input_tensor)
+@register_model('ct_gru', CTGRUConfig, {'units': [16, 32, 64]}, ('experiments.models.ct_gru', 'experiments.models.recurrent_layer'))
+def get_ct_gru_output(output_size, input_tensor, config):
+    import tensorflow as tf
+    import experiments.models.ct_gru as ct_gru
+    import experiments.models.recurrent_layer as recurrent_layer
+    return tf.keras.layers.Dense(output_size)(
+        recurrent_layer.RecurrentLayer(ct_gru.CTGRU(config.units, precompute_inputs=config.precompute_inputs),
+                                       config.remat_segment_length)(input_tensor))
 
 
-def get_recurrent_network_augmented_transformer_output(output_size, input_tensor):
-    return transformer.Transformer(token_amount=1, token_size=output_size, d_model=8, num_heads=1, d_ff=32,
-                                   num_layers=1, dropout_rate=0, attention='rnat')(input_tensor)
+@dataclasses.dataclass(frozen=True)
+class ODELSTMConfig:
+    units: int = 64
+    precompute_inputs: bool = True
+    remat_segment_length: int = 0
 
 
-def get_neural_circuit_policies_output(output_size, input_tensor):
-    return ncp.NeuralCircuitPolicies(16, output_size)(input_tensor)
+@register_model('ode_lstm', ODELSTMConfig, {'units': [32, 64, 128]}, ('experiments.models.ode_lstm', 'experiments.models.recurrent_layer'))
+def get_ode_lstm_output(output_size, input_tensor, config):
+    import tensorflow as tf
+    import experiments.models.ode_lstm as ode_lstm
+    import experiments.models.recurrent_layer as recurrent_layer
+    return tf.keras.layers.Dense(output_size)(
+        recurrent_layer.RecurrentLayer(ode_lstm.ODELSTM(config.units, precompute_inputs=config.precompute_inputs),
+                                       config.remat_segment_length)(input_tensor))
 
 
-def get_memory_augmented_transformer_output(output_size, input_tensor):
-    return tf.keras.layers.RNN(mat.MemoryAugmentedTransformerCell(output_size=output_size))(input_tensor)
+@dataclasses.dataclass(frozen=True)
+class UnitaryNCPConfig:
+    units_urnn: int = 32
+    units_ncp: int = 8
+    sparse_wiring: bool = True
+    ode_unfolds: int = 6
 
 
-def get_memory_cell_output(output_size, input_tensor):
-    assert output_size == 2
-    return tf.keras.layers.RNN(memory_cell.MemoryCell(), return_sequences=True)(input_tensor)
+@register_model('unitary_ncp', UnitaryNCPConfig, {'units_urnn': [16, 32, 64], 'units_ncp': [8, 16]},
+                ('experiments.models.unitary_ncp',))
+def get_unitary_ncp_output(output_size, input_tensor, config):
+    import experiments.models.unitary_ncp as uncp
+    return uncp.UnitaryNCP(config.units_urnn, config.units_ncp, output_size, sparse_wiring=config.sparse_wiring,
+                           ode_unfolds=config.ode_unfolds)(input_tensor)
+
+
+MODEL_ARGUMENTS = list(MODEL_REGISTRY)
 
 
-def get_model_output_by_name(model_name, output_size, input_tensor):
-    return eval(f'get_{model_name}_output')(output_size, input_tensor if len(input_tensor) > 1 else input_tensor[0])
+def get_model_output_by_name(model_name, output_size, input_tensor, model_config=None):
+    config = create_model_config(model_name, model_config)
+    return get_model_entry(model_name).builder(output_size, input_tensor if len(input_tensor) > 1 else input_tensor[0], config)
@@ -1,11 +1,117 @@
+import inspect
+
 import kerasncp as ncp
+import numpy as np
 import tensorflow as tf
 
+try:
+    from kerasncp import LTCCell
+except ImportError:
+    # kerasncp 2 keeps the keras cells in kerasncp.tf
+    from kerasncp.tf import LTCCell
+
+# kerasncp 2 builds the wirings from the input dimension, kerasncp 1 from the input shape
+WIRING_BUILDS_FROM_INPUT_DIM = 'input_dim' in inspect.signature(ncp.wirings.Wiring.build).parameters
+
+# the parameters of kerasncp.LTCCell in the order they are created, with their initialization ranges and whether they are non negative
+LTC_PARAMETERS = (('gleak', (0.001, 1.0), True), ('vleak', (-0.2, 0.2), False), ('cm', (0.4, 0.6), True),
+                  ('sigma', (3, 8), False), ('mu', (0.3, 0.8), False), ('w', (0.001, 1.0), True), ('erev', None, False),
+                  ('sensory_sigma', (3, 8), False), ('sensory_mu', (0.3, 0.8), False), ('sensory_w', (0.001, 1.0), True), ('sensory_erev', None, False),
+                  ('input_w', 1, False), ('input_b', 0, False), ('output_w', 1, False), ('output_b', 0, False))
+
+
+@tf.keras.utils.register_keras_serializable()
+class SparseLTCCell(tf.keras.layers.AbstractRNNCell):
+    # computes the same as kerasncp.LTCCell with affine input and output mappings and has the same weights,
+    # but only the synapses of the wiring are evaluated on an edge list instead of masking dense units x units tensors
+    def __init__(self, wiring, ode_unfolds=6, epsilon=1e-8, **kwargs):
+        super().__init__(**kwargs)
+        self.wiring = wiring
+        self.ode_unfolds = ode_unfolds
+        self.epsilon = epsilon
+        self.params = {}
+        self.edges, self.sensory_edges = None, None
+
+    @property
+    def state_size(self):
+        return self.wiring.units
+
+    @property
+    def output_size(self):
+        return self.wiring.output_dim
+
+    def build(self, input_shape):
+        # like in LTCCell.build, the features are the last dimension of the first input of (inputs, elapsed time)
+        if isinstance(input_shape[0], (tuple, list, tf.TensorShape)):
+            input_shape = input_shape[0]
+        input_dim = int(input_shape[-1])
+        self.wiring.build(input_dim if WIRING_BUILDS_FROM_INPUT_DIM else (None, input_dim))
+        units, output_dim = self.wiring.units, self.wiring.output_dim
+        shapes = {'gleak': (units,), 'vleak': (units,), 'cm': (units,),
+                  'input_w': (input_dim,), 'input_b': (input_dim,), 'output_w': (output_dim,), 'output_b': (output_dim,)}
+        initializers = {'erev': self.wiring.erev_initializer, 'sensory_erev': self.wiring.sensory_erev_initializer}
+        for name, initialization_range, non_negative in LTC_PARAMETERS:
+            if name not in initializers:
+                initializers[name] = tf.keras.initializers.RandomUniform(*initialization_range) if isinstance(initialization_range, tuple) \
+                    else tf.keras.initializers.Constant(initialization_range)
+            shape = shapes.get(name, (input_dim if name.startswith('sensory') else units, units))
+            self.params[name] = self.add_weight(name=name, shape=shape, dtype=tf.float32, initializer=initializers[name],
+                                                constraint=tf.keras.constraints.NonNeg() if non_negative else None)
+        # (source, target) pairs of the existing synapses
+        self.edges = tf.constant(np.argwhere(self.wiring.adjacency_matrix), tf.int32)
+        self.sensory_edges = tf.constant(np.argwhere(self.wiring.sensory_adjacency_matrix), tf.int32)
+        self.built = True
+
+    def get_synapses(self, edges, prefix=''):
+        return (edges[:, 0], edges[:, 1]) + tuple(tf.gather_nd(self.params[prefix + x], edges) for x in ('mu', 'sigma', 'w', 'erev'))
+
+    def get_synapse_sums(self, v_pre, synapses):
+        sources, targets, mu, sigma, w, erev = synapses
+        w_activation = w * tf.nn.sigmoid(sigma * (tf.gather(v_pre, sources, axis=1) - mu))
+        # sum over the incoming synapses of every neuron, the segments have to be on the first axis
+        sums = tf.math.unsorted_segment_sum(tf.transpose(tf.stack([w_activation * erev, w_activation], 1), [2, 0, 1]), targets, self.state_size)
+        return tf.unstack(tf.transpose(sums, [1, 2, 0]), axis=1)
+
+    def call(self, inputs, states):
+        if isinstance(inputs, (tuple, list)):
+            inputs, elapsed_time = inputs
+        else:
+            elapsed_time = 1.0
+        inputs = inputs * self.params['input_w'] + self.params['input_b']
+        v_pre = states[0]
+        w_numerator_sensory, w_denominator_sensory = self.get_synapse_sums(inputs, self.get_synapses(self.sensory_edges, 'sensory_'))
+        synapses = self.get_synapses(self.edges)
+        cm_t = self.params['cm'] / tf.cast(elapsed_time / self.ode_unfolds, dtype=tf.float32)
+        for _ in range(self.ode_unfolds):
+            w_numerator, w_denominator = self.get_synapse_sums(v_pre, synapses)
+            numerator = cm_t * v_pre + self.params['gleak'] * self.params['vleak'] + w_numerator + w_numerator_sensory
+            denominator = cm_t + self.params['gleak'] + w_denominator + w_denominator_sensory
+            v_pre = numerator / (denominator + self.epsilon)
+        outputs = v_pre[:, :self.output_size] * self.params['output_w'] + self.params['output_b']
+        return outputs, [v_pre]
+
+    def get_config(self):
+        config = super().get_config().copy()
+        config.update({
+            'wiring': self.wiring.get_config(),
+            'ode_unfolds': self.ode_unfolds,
+            'epsilon': self.epsilon
+        })
+        return config
+
+    @classmethod
+    def from_config(cls, config):
+        wiring_config = dict(config.pop('wiring'))
+        for key in ('adjacency_matrix', 'sensory_adjacency_matrix'):
+            if wiring_config[key] is not None:
+                wiring_config[key] = np.array(wiring_config[key], np.int32)
+        return cls(ncp.wirings.Wiring.from_config(wiring_config), **config)
+
 
 @tf.keras.utils.register_keras_serializable()
 class NeuralCircuitPolicies(tf.keras.layers.Layer):
     def __init__(self, units, output_size, inter_neuron_percentage=0.6, sensory_fanout=2, inter_fanout=2,
-                 recurrent_command_synapses=None, motor_fanin=2, return_sequences=False, **kwargs):
+                 recurrent_command_synapses=None, motor_fanin=2, return_sequences=False, sparse_wiring=False, ode_unfolds=6, **kwargs):
         super().__init__(**kwargs)
         self.units = units
         self.inter_neuron_percentage = inter_neuron_percentage
@@ -17,9 +123,11 @@ class NeuralCircuitPolicies(tf.keras.layers.Layer):
         self.recurrent_command_synapses = 2 * self.command_neurons if recurrent_command_synapses is None else recurrent_command_synapses
         self.motor_fanin = motor_fanin
         self.return_sequences = return_sequences
+        self.sparse_wiring = sparse_wiring
+        self.ode_unfolds = ode_unfolds
+        wiring = ncp.wirings.NCP(self.inter_neurons, self.command_neurons, self.motor_neurons, self.sensory_fanout, self.inter_fanout, self.recurrent_command_synapses, self.motor_fanin)
         self.rnn = tf.keras.layers.RNN(
-            ncp.LTCCell(
-                ncp.wirings.NCP(self.inter_neurons, self.command_neurons, self.motor_neurons, self.sensory_fanout, self.inter_fanout, self.recurrent_command_synapses, self.motor_fanin)),
+            SparseLTCCell(wiring, self.ode_unfolds) if self.sparse_wiring else LTCCell(wiring, ode_unfolds=self.ode_unfolds),
             return_sequences=self.return_sequences)
 
     def call(self, inputs, **kwargs):
@@ -35,6 +143,8 @@ class NeuralCircuitPolicies(tf.keras.layers.Layer):
             'inter_fanout': self.inter_fanout,
             'recurrent_command_synapses': self.recurrent_command_synapses,
             'motor_fanin': self.motor_fanin,
-            'return_sequences': self.return_sequences
+            'return_sequences': self.return_sequences,
+            'sparse_wiring': self.sparse_wiring,
+            'ode_unfolds': self.ode_unfolds
         })
         return config
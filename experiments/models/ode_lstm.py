@@ -5,13 +5,15 @@ code taken from https://github.com/mlech26l/ode-lstms/blob/master/node_cell.py (
 import tensorflow as tf
 
 import experiments.models.ct_rnn as ct_rnn
+import experiments.models.recurrent_layer as recurrent_layer
 
 
 @tf.keras.utils.register_keras_serializable()
 class ODELSTM(tf.keras.layers.AbstractRNNCell):
-    def __init__(self, units, **kwargs):
+    def __init__(self, units, precompute_inputs=False, **kwargs):
         super().__init__(**kwargs)
         self.units = units
+        self.precompute_inputs = precompute_inputs
         self.state_size_value = (units, units)
         self.initializer = "glorot_uniform"
         self.recurrent_initializer = "orthogonal"
@@ -46,14 +48,22 @@ class ODELSTM(tf.keras.layers.AbstractRNNCell):
         )
         self.built = True
 
+    def input_projection(self, inputs):
+        return recurrent_layer.dense_projection(inputs, self.input_kernel)
+
+    def project_inputs(self, inputs):
+        return recurrent_layer.project_main_input(inputs, self.input_projection)
+
     def call(self, inputs, states):
         cell_state, ode_state = states
         elapsed = 1.0
         if (isinstance(inputs, tuple) or isinstance(inputs, list)) and len(inputs) > 1:
             elapsed = inputs[1]
             inputs = inputs[0]
+        if not self.precompute_inputs:
+            inputs = self.input_projection(inputs)
         z = (
-                tf.matmul(inputs, self.input_kernel)
+                inputs
                 + tf.matmul(ode_state, self.recurrent_kernel)
                 + self.bias
         )
@@ -78,6 +88,7 @@ class ODELSTM(tf.keras.layers.AbstractRNNCell):
     def get_config(self):
         config = super().get_config().copy()
         config.update({
-            'units': self.units
+            'units': self.units,
+            'precompute_inputs': self.precompute_inputs
         })
         return config
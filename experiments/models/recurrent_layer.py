@@ -0,0 +1,123 @@
+import contextlib
+import inspect
+
+import tensorflow as tf
+
+
+def dense_projection(inputs, kernel):
+    # tensordot reshapes inputs of any rank to a single [batch * time, in] x [in, out] matrix multiplication and keeps the static shape
+    return tf.tensordot(inputs, kernel, 1)
+
+
+def project_main_input(inputs, projection):
+    # cells with a time input receive (inputs, elapsed), only the inputs are projected
+    if isinstance(inputs, (tuple, list)) and len(inputs) > 1:
+        return (projection(inputs[0]),) + tuple(inputs[1:])
+    return projection(inputs)
+
+
+def precomputes_inputs(cell):
+    return getattr(cell, 'precompute_inputs', False)
+
+
+def precomputes_weights(cell):
+    return precomputes_inputs(cell) and hasattr(cell, 'precompute_weights')
+
+
+def compiles_recurrence(cell):
+    return getattr(cell, 'compile_recurrence', False)
+
+
+def requires_jit_compile(model):
+    return any(compiles_recurrence(layer.cell) for layer in model.submodules if isinstance(layer, tf.keras.layers.RNN))
+
+
+@contextlib.contextmanager
+def use_precomputed_weights(cell, weights):
+    outer_weights = cell.precomputed_weights
+    cell.precomputed_weights = weights
+    try:
+        yield
+    finally:
+        cell.precomputed_weights = outer_weights
+
+
+def as_real(tensor):
+    return tf.stack([tf.math.real(tensor), tf.math.imag(tensor)], -1) if tensor.dtype.is_complex else tensor
+
+
+def from_real(tensor, dtype):
+    return tf.complex(tensor[..., 0], tensor[..., 1]) if dtype.is_complex else tensor
+
+
+# cells with precompute_inputs set project the whole input sequence with project_inputs before the recurrence
+# and receive the projected inputs of a timestep in call, the cell is still built with the unprojected input shape
+# such cells can also compute the recurrent weights that depend only on their variables once per sequence with
+# precompute_weights, the cell reads them from precomputed_weights while the layer runs and computes them itself otherwise
+# with remat_segment_length set the sequence is run in segments of that many steps, only the states at the segment
+# boundaries are kept for the backward pass and the steps of a segment are recomputed from them
+# cells with compile_recurrence set scatter into large states, XLA updates those in place if it compiles the whole
+# recurrence, which only works together with its gradient, so models with such cells are compiled by XLA as a whole
+@tf.keras.utils.register_keras_serializable()
+class RecurrentLayer(tf.keras.layers.RNN):
+    def __init__(self, cell, remat_segment_length=0, **kwargs):
+        super().__init__(cell, **kwargs)
+        self.remat_segment_length = remat_segment_length
+
+    def call(self, inputs, mask=None, training=None, initial_state=None, constants=None):
+        if self.remat_segment_length and isinstance(inputs, list):
+            # keras passes initial states given as keras tensors together with the inputs (time inputs come as tuples)
+            inputs, initial_state = inputs[0], inputs[1:] or initial_state
+        if precomputes_inputs(self.cell):
+            inputs = self.cell.project_inputs(inputs)
+        if precomputes_weights(self.cell):
+            with use_precomputed_weights(self.cell, self.cell.precompute_weights()):
+                return self.run(inputs, mask, training, initial_state, constants)
+        return self.run(inputs, mask, training, initial_state, constants)
+
+    def run(self, inputs, mask, training, initial_state, constants):
+        if not self.remat_segment_length:
+            return super().call(inputs, mask=mask, training=training, initial_state=initial_state, constants=constants)
+        if mask is not None or constants is not None or self.stateful or self.go_backwards or self.time_major:
+            raise ValueError(f'{self.name} can not rematerialise segments with masks, constants, states kept between batches, reversed or time major inputs')
+        if initial_state is None:
+            first_inputs = tf.nest.flatten(inputs)[0]
+            initial_state = self.cell.get_initial_state(inputs=None, batch_size=tf.shape(first_inputs)[0], dtype=first_inputs.dtype)
+        states = tf.nest.flatten(initial_state)
+        time_steps = tf.nest.flatten(inputs)[0].shape[1]
+        if time_steps is None:
+            raise ValueError(f'{self.name} needs a static sequence length to rematerialise segments')
+        # the precomputed weights are arguments of the segments, so that the recomputed segments pass their gradients back
+        weights = self.cell.precomputed_weights if precomputes_weights(self.cell) else ()
+        state_dtypes = [x.dtype for x in states]
+        states = [as_real(x) for x in states]
+        structure = (inputs, states, weights)
+        run_segment = tf.recompute_grad(lambda *x: self.run_segment(*tf.nest.pack_sequence_as(structure, x), state_dtypes, training))
+        segment_outputs = []
+        for start in range(0, time_steps, self.remat_segment_length):
+            segment_inputs = tf.nest.map_structure(lambda x: x[:, start:start + self.remat_segment_length], inputs)
+            *states, last_output, outputs = run_segment(*tf.nest.flatten((segment_inputs, states, weights)))
+            segment_outputs.append(outputs)
+        output = tf.concat(segment_outputs, 1) if self.return_sequences else last_output
+        states = [from_real(x, dtype) for x, dtype in zip(states, state_dtypes)]
+        return [output] + states if self.return_state else output
+
+    def run_segment(self, inputs, states, weights, state_dtypes, training):
+        kwargs = {'training': training} if 'training' in inspect.signature(self.cell.call).parameters else {}
+
+        def step(step_inputs, step_states):
+            output, next_states = self.cell(step_inputs, step_states, **kwargs)
+            return output, tf.nest.flatten(next_states)
+
+        states = [from_real(x, dtype) for x, dtype in zip(states, state_dtypes)]
+        with use_precomputed_weights(self.cell, tuple(weights)) if weights else contextlib.nullcontext():
+            last_output, outputs, states = tf.keras.backend.rnn(step, inputs, states)
+        # the segments pass the states as real tensors and return them first, in graph mode recompute_grad starts the
+        # recomputation once the gradient of the first output is there and reads it with reduce_max, which needs a real
+        # tensor, that is the gradient of the first state of the next segment, which comes after its backward pass
+        return [as_real(x) for x in states] + [last_output, outputs]
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({'remat_segment_length': self.remat_segment_length})
+        return config
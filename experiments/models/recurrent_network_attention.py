@@ -10,7 +10,7 @@ class RecurrentNetworkAttention(tf.keras.layers.Layer):
         self.dim = dim
         self.heads = heads
         # create the rnn layers
-        self.rnn_layers = [tf.keras.layers.RNN(urnn.EUNNCell(self.dim)) for _ in range(self.heads)]
+        self.rnn_layers = [tf.keras.layers.RNN(urnn.EUNNCell(self.dim, structured_permutations=True)) for _ in range(self.heads)]
         self.dense_layer = tf.keras.layers.Dense(self.dim)
 
     def call(self, inputs, **kwargs):
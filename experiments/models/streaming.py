@@ -0,0 +1,92 @@
+import tensorflow as tf
+
+import experiments.models.recurrent_layer as recurrent_layer
+
+
+def get_recurrent_layers(model):
+    return [layer for layer in model.submodules if isinstance(layer, tf.keras.layers.RNN)]
+
+
+def get_frame_spec(sequence_specs, batch_size):
+    frame_specs = [tf.TensorSpec([batch_size] + list(spec.shape[2:]), spec.dtype or tf.float32) for spec in sequence_specs]
+    return frame_specs[0] if len(frame_specs) == 1 else tuple(frame_specs)
+
+
+def as_state_list(states):
+    return list(states) if tf.nest.is_nested(states) else [states]
+
+
+class StreamingCell(tf.Module):
+    def __init__(self, rnn_layer, batch_size=1, **kwargs):
+        super().__init__(**kwargs)
+        self.cell = rnn_layer.cell
+        self.batch_size = batch_size
+        self.frame_spec = get_frame_spec(rnn_layer.input_spec, batch_size)
+        self.get_initial_state = tf.function(self._get_initial_state, input_signature=[])
+        self.states = tf.nest.map_structure(lambda x: tf.Variable(x, trainable=False), self.get_initial_state())
+        self.state_spec = tf.nest.map_structure(lambda x: tf.TensorSpec(x.shape, x.dtype), self.states)
+        self.call = tf.function(self._call, input_signature=[self.frame_spec, self.state_spec])
+        self.step = tf.function(self._step, input_signature=[self.frame_spec])
+        self.reset = tf.function(self._reset, input_signature=[])
+
+    def _get_initial_state(self):
+        return as_state_list(self.cell.get_initial_state(inputs=None, batch_size=self.batch_size, dtype=tf.float32))
+
+    def _call(self, frame, states):
+        # cells that precompute their inputs for a whole sequence project each frame on its own here
+        if recurrent_layer.precomputes_inputs(self.cell):
+            frame = self.cell.project_inputs(frame)
+        outputs, next_states = self.cell(frame, states)
+        return outputs, as_state_list(next_states)
+
+    def _step(self, frame):
+        outputs, next_states = self._call(frame, tf.nest.map_structure(lambda x: x.read_value(), self.states))
+        for state, next_state in zip(self.states, next_states):
+            state.assign(next_state)
+        return outputs
+
+    def _reset(self):
+        for state, initial_state in zip(self.states, self._get_initial_state()):
+            state.assign(initial_state)
+
+
+def as_frame_model(model):
+    # the functional model checks the sequence length of its inputs otherwise
+    model.input_spec = [tf.keras.layers.InputSpec(shape=(None, None) + tuple(x.shape[2:])) for x in model.inputs]
+    return model
+
+
+def call_on_frame(model, frame):
+    sequence = model(tf.nest.map_structure(lambda x: x[:, tf.newaxis], frame), training=False)
+    return tf.nest.map_structure(lambda x: x[:, 0], sequence)
+
+
+# the layers before the recurrent layer, and the layers after it if it returns sequences, run on each frame as a sequence
+# of length one, so they have to process the time steps independently of each other (like dense layers or concatenations)
+class StreamingModel(tf.Module):
+    def __init__(self, model, batch_size=1, **kwargs):
+        super().__init__(**kwargs)
+        rnn_layers = [layer for layer in model.layers if isinstance(layer, tf.keras.layers.RNN)]
+        if len(rnn_layers) != 1:
+            raise ValueError(f'streaming requires exactly one top level recurrent layer, {model.name} has {len(rnn_layers)}')
+        rnn_layer = rnn_layers[0]
+        self.streaming_cell = StreamingCell(rnn_layer, batch_size)
+        model_inputs = {id(x) for x in model.inputs}
+        if all(id(x) in model_inputs for x in tf.nest.flatten(rnn_layer.input)):
+            self.body = None
+            self.frame_spec = self.streaming_cell.frame_spec
+        else:
+            self.body = as_frame_model(tf.keras.Model(inputs=model.inputs, outputs=rnn_layer.input))
+            self.frame_spec = get_frame_spec(model.inputs, batch_size)
+        self.head = tf.keras.Model(inputs=rnn_layer.output, outputs=model.output)
+        self.returns_sequences = rnn_layer.return_sequences
+        if self.returns_sequences:
+            self.head = as_frame_model(self.head)
+        self.step = tf.function(self._step, input_signature=[self.frame_spec])
+        self.reset = self.streaming_cell.reset
+
+    def _step(self, frame):
+        if self.body is not None:
+            frame = call_on_frame(self.body, frame)
+        outputs = self.streaming_cell.step(frame)
+        return call_on_frame(self.head, outputs) if self.returns_sequences else self.head(outputs, training=False)
@@ -6,14 +6,17 @@ import experiments.models.unitary_rnn as urnn
 
 @tf.keras.utils.register_keras_serializable()
 class UnitaryNCP(tf.keras.layers.Layer):
-    def __init__(self, units_urnn, units_ncp, output_size, return_sequences=False, **kwargs):
+    def __init__(self, units_urnn, units_ncp, output_size, return_sequences=False, sparse_wiring=False, ode_unfolds=6, **kwargs):
         super().__init__(**kwargs)
         self.units_urnn = units_urnn
         self.units_ncp = units_ncp
         self.output_size = output_size
         self.return_sequences = return_sequences
+        self.sparse_wiring = sparse_wiring
+        self.ode_unfolds = ode_unfolds
         self.urnn = tf.keras.layers.RNN(urnn.EUNNCell(units_urnn), return_sequences=True)
-        self.ncp = ncp.NeuralCircuitPolicies(units_ncp, self.output_size, recurrent_command_synapses=0, return_sequences=self.return_sequences)
+        self.ncp = ncp.NeuralCircuitPolicies(units_ncp, self.output_size, recurrent_command_synapses=0, return_sequences=self.return_sequences,
+                                             sparse_wiring=self.sparse_wiring, ode_unfolds=self.ode_unfolds)
 
     def call(self, inputs, **kwargs):
         urnn_output = self.urnn(inputs)
@@ -27,5 +30,7 @@ class UnitaryNCP(tf.keras.layers.Layer):
             'units_ncp': self.units_ncp,
             'output_size': self.output_size,
             'return_sequences': self.return_sequences,
+            'sparse_wiring': self.sparse_wiring,
+            'ode_unfolds': self.ode_unfolds,
         })
         return config
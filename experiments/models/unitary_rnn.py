@@ -8,6 +8,7 @@ import numpy as np
 import tensorflow as tf
 
 import experiments.models.model_factory as model_factory
+import experiments.models.recurrent_layer as recurrent_layer
 
 
 def modrelu(inputs, bias, cplex=True):
@@ -24,6 +25,28 @@ def modrelu(inputs, bias, cplex=True):
     return phase * magnitude
 
 
+@tf.custom_gradient
+def complex_abs(real, imag):
+    norm = tf.sqrt(tf.square(real) + tf.square(imag))
+
+    def grad(upstream):
+        # same gradient as tf.abs of a complex tensor, which is zero at the origin
+        return tf.math.divide_no_nan(upstream * real, norm), tf.math.divide_no_nan(upstream * imag, norm)
+
+    return norm, grad
+
+
+def complex_multiply(a, b):
+    return a[0] * b[0] - a[1] * b[1], a[0] * b[1] + a[1] * b[0]
+
+
+def modrelu_real(inputs, bias):
+    # modrelu of a complex tensor given as a pair of real and imaginary float32 tensors
+    norm = complex_abs(*inputs) + 0.01
+    magnitude = tf.nn.relu(norm + bias)
+    return inputs[0] / norm * magnitude, inputs[1] / norm * magnitude
+
+
 def generate_index_tunable(s, L):
     ind1 = list(range(s))
     ind2 = list(range(s))
@@ -81,6 +104,26 @@ def generate_index_fft(s):
     return ind_exe, ind_param
 
 
+def swap_pairs(inputs):
+    return tf.reshape(tf.reverse(tf.reshape(inputs, [-1, inputs.shape[1] // 2, 2]), [2]), [-1, inputs.shape[1]])
+
+
+def permute_tunable(inputs, layer_index):
+    # the same permutations as the index lists of generate_index_tunable, the second one keeps the first and the last unit in place
+    if layer_index % 2 == 0:
+        return swap_pairs(inputs)
+    if inputs.shape[1] == 2:
+        return inputs
+    return tf.concat([inputs[:, :1], swap_pairs(inputs[:, 1:-1]), inputs[:, -1:]], axis=1)
+
+
+def permute_fft(inputs, layer_index):
+    # the same permutations as the index lists of generate_index_fft, unit j is swapped with unit j xor (num_units / 2 ** (layer_index + 1))
+    num_units = inputs.shape[1]
+    distance = num_units // 2 ** (layer_index + 1)
+    return tf.reshape(tf.reverse(tf.reshape(inputs, [-1, 2 ** layer_index, 2, distance]), [2]), [-1, num_units])
+
+
 @tf.keras.utils.register_keras_serializable()
 class EUNNCell(tf.keras.layers.AbstractRNNCell):
     def __init__(self,
@@ -88,6 +131,10 @@ class EUNNCell(tf.keras.layers.AbstractRNNCell):
                  capacity=4,
                  fft=False,
                  cplex=True,
+                 real_arithmetic=False,
+                 structured_permutations=False,
+                 jit_compile=False,
+                 precompute_inputs=False,
                  **kwargs):
         super().__init__(**kwargs)
         self._num_units = num_units
@@ -95,6 +142,15 @@ class EUNNCell(tf.keras.layers.AbstractRNNCell):
         self._capacity = capacity
         self._fft = fft
         self._cplex = cplex
+        # complex values are kept as real and imaginary float32 parts, the state is their concatenation and the output the real part
+        self._real_arithmetic = real_arithmetic and cplex
+        # the fixed permutations of the rotation layers are applied with reshapes and reverses instead of gathers
+        self._structured_permutations = structured_permutations
+        self._jit_compile = jit_compile
+        # the rotation loops are compiled once per cell, not once per call
+        self.compiled_loop = tf.function(self.loop, jit_compile=True) if jit_compile else self.loop
+        self.compiled_real_loop = tf.function(self.real_loop, jit_compile=True) if jit_compile else self.real_loop
+        self.precompute_inputs = precompute_inputs
         if self._capacity > self._num_units:
             raise ValueError("Do not set capacity larger than hidden size, it is redundant")
         if self._fft:
@@ -128,19 +184,26 @@ class EUNNCell(tf.keras.layers.AbstractRNNCell):
 
     @property
     def state_size(self):
-        return self._num_units
+        return 2 * self._num_units if self._real_arithmetic else self._num_units
 
     @property
     def output_size(self):
         return self._num_units
 
     def get_initial_state(self, inputs=None, batch_size=None, dtype=None):
-        if self._cplex:
+        if self._cplex and not self._real_arithmetic:
             dtype = tf.complex64
         else:
             dtype = tf.float32
         return tf.zeros((batch_size, self.state_size), dtype)
 
+    def combine_parts(self, real, imag):
+        if not self._cplex:
+            return real
+        if self._real_arithmetic:
+            return real, imag
+        return tf.complex(real, imag)
+
     def create_fft_weights(self):
         theta = self.add_weight("theta", [self._capacity, self._num_units // 2], initializer=self.phase_init)
         if self._cplex:
@@ -156,20 +219,18 @@ class EUNNCell(tf.keras.layers.AbstractRNNCell):
         if self._cplex:
             cos_phi = tf.cos(self.phi)
             sin_phi = tf.sin(self.phi)
-            cos_list_re = tf.concat([cos_theta, cos_theta * cos_phi], axis=1)
-            cos_list_im = tf.concat([tf.zeros_like(self.theta), cos_theta * sin_phi], axis=1)
-            sin_list_re = tf.concat([sin_theta, - sin_theta * cos_phi], axis=1)
-            sin_list_im = tf.concat([tf.zeros_like(self.theta), - sin_theta * sin_phi], axis=1)
-            cos_list = tf.complex(cos_list_re, cos_list_im)
-            sin_list = tf.complex(sin_list_re, sin_list_im)
+            cos_list = [tf.concat([cos_theta, cos_theta * cos_phi], axis=1),
+                        tf.concat([tf.zeros_like(self.theta), cos_theta * sin_phi], axis=1)]
+            sin_list = [tf.concat([sin_theta, - sin_theta * cos_phi], axis=1),
+                        tf.concat([tf.zeros_like(self.theta), - sin_theta * sin_phi], axis=1)]
         else:
-            cos_list = tf.concat([cos_theta, cos_theta], axis=1)
-            sin_list = tf.concat([sin_theta, -sin_theta], axis=1)
+            cos_list = [tf.concat([cos_theta, cos_theta], axis=1), None]
+            sin_list = [tf.concat([sin_theta, -sin_theta], axis=1), None]
         ind_exe, index_fft = generate_index_fft(self._num_units)
-        v1 = tf.stack([tf.gather(cos_list[i, :], index_fft[i]) for i in range(self._capacity)])
-        v2 = tf.stack([tf.gather(sin_list[i, :], index_fft[i]) for i in range(self._capacity)])
+        v1 = self.combine_parts(*[None if x is None else tf.stack([tf.gather(x[i, :], index_fft[i]) for i in range(self._capacity)]) for x in cos_list])
+        v2 = self.combine_parts(*[None if x is None else tf.stack([tf.gather(x[i, :], index_fft[i]) for i in range(self._capacity)]) for x in sin_list])
         if self._cplex:
-            D = tf.complex(tf.cos(self.omega), tf.sin(self.omega))
+            D = self.combine_parts(tf.cos(self.omega), tf.sin(self.omega))
         else:
             D = None
         diag = D
@@ -194,65 +255,93 @@ class EUNNCell(tf.keras.layers.AbstractRNNCell):
         if self._cplex:
             cos_phi_A = tf.cos(self.phi_A)
             sin_phi_A = tf.sin(self.phi_A)
-            cos_list_A_re = tf.concat([cos_theta_A, cos_theta_A * cos_phi_A], axis=1)
-            cos_list_A_im = tf.concat([tf.zeros_like(self.theta_A), cos_theta_A * sin_phi_A], axis=1)
-            sin_list_A_re = tf.concat([sin_theta_A, - sin_theta_A * cos_phi_A], axis=1)
-            sin_list_A_im = tf.concat([tf.zeros_like(self.theta_A), - sin_theta_A * sin_phi_A], axis=1)
-            cos_list_A = tf.complex(cos_list_A_re, cos_list_A_im)
-            sin_list_A = tf.complex(sin_list_A_re, sin_list_A_im)
+            cos_list_A = [tf.concat([cos_theta_A, cos_theta_A * cos_phi_A], axis=1),
+                          tf.concat([tf.zeros_like(self.theta_A), cos_theta_A * sin_phi_A], axis=1)]
+            sin_list_A = [tf.concat([sin_theta_A, - sin_theta_A * cos_phi_A], axis=1),
+                          tf.concat([tf.zeros_like(self.theta_A), - sin_theta_A * sin_phi_A], axis=1)]
         else:
-            cos_list_A = tf.concat([cos_theta_A, cos_theta_A], axis=1)
-            sin_list_A = tf.concat([sin_theta_A, -sin_theta_A], axis=1)
+            cos_list_A = [tf.concat([cos_theta_A, cos_theta_A], axis=1), None]
+            sin_list_A = [tf.concat([sin_theta_A, -sin_theta_A], axis=1), None]
         cos_theta_B = tf.cos(self.theta_B)
         sin_theta_B = tf.sin(self.theta_B)
         if self._cplex:
             cos_phi_B = tf.cos(self.phi_B)
             sin_phi_B = tf.sin(self.phi_B)
-            cos_list_B_re = tf.concat([tf.ones([self.capacity_B, 1]), cos_theta_B, cos_theta_B * cos_phi_B, tf.ones([self.capacity_B, 1])], axis=1)
-            cos_list_B_im = tf.concat([tf.zeros([self.capacity_B, 1]), tf.zeros_like(self.theta_B), cos_theta_B * sin_phi_B, tf.zeros([self.capacity_B, 1])], axis=1)
-            sin_list_B_re = tf.concat([tf.zeros([self.capacity_B, 1]), sin_theta_B, -sin_theta_B * cos_phi_B, tf.zeros([self.capacity_B, 1])], axis=1)
-            sin_list_B_im = tf.concat([tf.zeros([self.capacity_B, 1]), tf.zeros_like(self.theta_B), -sin_theta_B * sin_phi_B, tf.zeros([self.capacity_B, 1])], axis=1)
-            cos_list_B = tf.complex(cos_list_B_re, cos_list_B_im)
-            sin_list_B = tf.complex(sin_list_B_re, sin_list_B_im)
+            cos_list_B = [tf.concat([tf.ones([self.capacity_B, 1]), cos_theta_B, cos_theta_B * cos_phi_B, tf.ones([self.capacity_B, 1])], axis=1),
+                          tf.concat([tf.zeros([self.capacity_B, 1]), tf.zeros_like(self.theta_B), cos_theta_B * sin_phi_B, tf.zeros([self.capacity_B, 1])], axis=1)]
+            sin_list_B = [tf.concat([tf.zeros([self.capacity_B, 1]), sin_theta_B, -sin_theta_B * cos_phi_B, tf.zeros([self.capacity_B, 1])], axis=1),
+                          tf.concat([tf.zeros([self.capacity_B, 1]), tf.zeros_like(self.theta_B), -sin_theta_B * sin_phi_B, tf.zeros([self.capacity_B, 1])], axis=1)]
         else:
-            cos_list_B = tf.concat([tf.ones([self.capacity_B, 1]), cos_theta_B, cos_theta_B, tf.ones([self.capacity_B, 1])], axis=1)
-            sin_list_B = tf.concat([tf.zeros([self.capacity_B, 1]), sin_theta_B, -sin_theta_B, tf.zeros([self.capacity_B, 1])], axis=1)
+            cos_list_B = [tf.concat([tf.ones([self.capacity_B, 1]), cos_theta_B, cos_theta_B, tf.ones([self.capacity_B, 1])], axis=1), None]
+            sin_list_B = [tf.concat([tf.zeros([self.capacity_B, 1]), sin_theta_B, -sin_theta_B, tf.zeros([self.capacity_B, 1])], axis=1), None]
         ind_exe, [index_A, index_B] = generate_index_tunable(self._num_units, self._capacity)
-        diag_list_A = tf.gather(cos_list_A, index_A, axis=1)
-        off_list_A = tf.gather(sin_list_A, index_A, axis=1)
-        diag_list_B = tf.gather(cos_list_B, index_B, axis=1)
-        off_list_B = tf.gather(sin_list_B, index_B, axis=1)
-        v1 = tf.reshape(tf.concat([diag_list_A, diag_list_B], axis=1), [self._capacity, self._num_units])
-        v2 = tf.reshape(tf.concat([off_list_A, off_list_B], axis=1), [self._capacity, self._num_units])
+        v1_parts, v2_parts = [None, None], [None, None]
+        for part in range(2 if self._cplex else 1):
+            diag_list_A = tf.gather(cos_list_A[part], index_A, axis=1)
+            off_list_A = tf.gather(sin_list_A[part], index_A, axis=1)
+            diag_list_B = tf.gather(cos_list_B[part], index_B, axis=1)
+            off_list_B = tf.gather(sin_list_B[part], index_B, axis=1)
+            v1_parts[part] = tf.reshape(tf.concat([diag_list_A, diag_list_B], axis=1), [self._capacity, self._num_units])
+            v2_parts[part] = tf.reshape(tf.concat([off_list_A, off_list_B], axis=1), [self._capacity, self._num_units])
+        v1 = self.combine_parts(*v1_parts)
+        v2 = self.combine_parts(*v2_parts)
         if self._cplex:
-            D = tf.complex(tf.cos(self.omega), tf.sin(self.omega))
+            D = self.combine_parts(tf.cos(self.omega), tf.sin(self.omega))
         else:
             D = None
         diag = D
         return v1, v2, ind_exe, diag
 
-    def loop(self, h, v1, v2, ind, _diag):
+    def permute(self, h, ind, layer_index):
+        if not self._structured_permutations:
+            return tf.gather(h, ind[layer_index], axis=1)
+        if self._fft:
+            return permute_fft(h, layer_index)
+        return permute_tunable(h, layer_index)
+
+    def real_loop(self, h, v1, v2, ind, diag_matrix):
+        for i in range(self._capacity):
+            diag = complex_multiply(h, (v1[0][i, :], v1[1][i, :]))
+            off = complex_multiply(h, (v2[0][i, :], v2[1][i, :]))
+            h = diag[0] + self.permute(off[0], ind, i), diag[1] + self.permute(off[1], ind, i)
+        return complex_multiply(h, diag_matrix)
+
+    def loop(self, h, v1, v2, ind, diag_matrix):
         for i in range(self._capacity):
             diag = h * v1[i, :]
             off = h * v2[i, :]
-            h = diag + tf.gather(off, ind[i], axis=1)
-        if _diag is not None:
-            h = h * _diag
+            h = diag + self.permute(off, ind, i)
+        if diag_matrix is not None:
+            h = h * diag_matrix
         return h
 
+    def project_inputs(self, inputs):
+        # the real and imaginary parts are projected together and concatenated
+        kernel = tf.concat([self.U_re, self.U_im], 1) if self._cplex else self.U
+        return recurrent_layer.dense_projection(model_factory.get_concat_inputs(inputs), kernel)
+
+    def real_call(self, inputs, state):
+        inputs = tf.split(inputs, 2, 1)
+        if self._fft:
+            v1, v2, ind, diag = self.create_fft_matrices()
+        else:
+            v1, v2, ind, diag = self.create_tunable_matrices()
+        state = self.compiled_real_loop(tf.split(state[0], 2, 1), v1, v2, ind, diag)
+        output = modrelu_real((inputs[0] + state[0], inputs[1] + state[1]), self.bias)
+        return output[0], (tf.concat(output, 1),)
+
     def call(self, inputs, state):
-        inputs = model_factory.get_concat_inputs(inputs)
+        if not self.precompute_inputs:
+            inputs = self.project_inputs(inputs)
+        if self._real_arithmetic:
+            return self.real_call(inputs, state)
         if self._cplex:
-            inputs_re = tf.matmul(inputs, self.U_re)
-            inputs_im = tf.matmul(inputs, self.U_im)
-            inputs = tf.complex(inputs_re, inputs_im)
-        else:
-            inputs = tf.matmul(inputs, self.U)
+            inputs = tf.complex(*tf.split(inputs, 2, 1))
         if self._fft:
             v1, v2, ind, diag = self.create_fft_matrices()
         else:
             v1, v2, ind, diag = self.create_tunable_matrices()
-        state = self.loop(state[0], v1, v2, ind, diag)
+        state = self.compiled_loop(state[0], v1, v2, ind, diag)
         output = self._activation((inputs + state), self.bias, self._cplex)
         return output, (output,)
 
@@ -262,6 +351,10 @@ class EUNNCell(tf.keras.layers.AbstractRNNCell):
             'num_units': self._num_units,
             'capacity': self._capacity,
             'fft': self._fft,
-            'cplex': self._cplex
+            'cplex': self._cplex,
+            'real_arithmetic': self._real_arithmetic,
+            'structured_permutations': self._structured_permutations,
+            'jit_compile': self._jit_compile,
+            'precompute_inputs': self.precompute_inputs
         })
         return config
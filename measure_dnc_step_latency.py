@@ -0,0 +1,85 @@
+import argparse
+import os
+
+import numpy as np
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--memory_sizes', default='16,64,256', type=str)
+parser.add_argument('--max_dense_memory_size', default=1024, type=int)
+parser.add_argument('--batch_size', default=128, type=int)
+parser.add_argument('--input_size', default=8, type=int)
+parser.add_argument('--output_size', default=4, type=int)
+parser.add_argument('--controller_units', default=64, type=int)
+parser.add_argument('--word_size', default=8, type=int)
+parser.add_argument('--num_read_heads', default=2, type=int)
+parser.add_argument('--sparse_reads', default=4, type=int)
+parser.add_argument('--lsh_tables', default=4, type=int)
+parser.add_argument('--lsh_bits', default=4, type=int)
+parser.add_argument('--lsh_bucket_size', default=8, type=int)
+parser.add_argument('--steps', default=16, type=int)
+parser.add_argument('--warmup_runs', default=5, type=int)
+parser.add_argument('--runs', default=50, type=int)
+parser.add_argument('--result_folder_name', default='results', type=str)
+args = parser.parse_args()
+
+import pandas as pd
+import tensorflow as tf
+
+import experiments.benchmarks.inference as inference
+import experiments.models.differentiable_neural_computer as dnc
+import experiments.models.recurrent_layer as recurrent_layer
+
+
+def create_cells(memory_size):
+    cell_arguments = (args.output_size, args.controller_units, memory_size, args.word_size, args.num_read_heads)
+    cells = {}
+    # the [B, N, N] link matrices of the dense cells do not fit larger memories
+    if memory_size <= args.max_dense_memory_size:
+        cells.update({'dnc': dnc.DNC(*cell_arguments), 'fused dnc': dnc.FusedDNC(*cell_arguments),
+                      'fused dnc (xla)': dnc.FusedDNC(*cell_arguments, jit_compile=True)})
+    inputs = tf.zeros((args.batch_size, args.input_size))
+    for cell in cells.values():
+        cell(inputs, cell.get_initial_state(batch_size=args.batch_size))
+    # all cells get the weights of the unfused cell, so that their outputs can be compared
+    for cell in cells.values():
+        cell.set_weights(cells['dnc'].get_weights())
+    # the sparse access memories have a different interface and are not compared
+    cells['sparse dnc'] = dnc.SparseDNC(*cell_arguments, args.sparse_reads, jit_compile=True)
+    cells['sparse dnc (lsh)'] = dnc.SparseDNC(*cell_arguments, args.sparse_reads, args.lsh_tables, args.lsh_bits, args.lsh_bucket_size,
+                                              jit_compile=True)
+    return cells
+
+
+def run_steps(step, inputs, states):
+    outputs = []
+    for step_inputs in inputs:
+        step_outputs, states = step(step_inputs, states)
+        outputs.append(step_outputs.numpy())
+    return np.stack(outputs), states
+
+
+results = []
+for memory_size in [int(x) for x in args.memory_sizes.split(',')]:
+    inputs = tf.random.normal((args.steps, args.batch_size, args.input_size))
+    outputs = {}
+    for cell_name, cell in create_cells(memory_size).items():
+        step = tf.function(lambda x, y, cell=cell: cell(x, y))
+        outputs[cell_name], states = run_steps(step, inputs, cell.get_initial_state(batch_size=args.batch_size))
+        latencies = inference.measure_latencies(step, (inputs[0], states), args.warmup_runs, args.runs)
+        result = inference.summarize_latencies(cell_name, 'step', args.batch_size, latencies)
+        difference = np.nan if isinstance(cell, dnc.SparseDNC) else float(np.max(np.abs(outputs[cell_name] - outputs['dnc'])))
+        result.update({'memory size': memory_size, 'max abs output difference': difference})
+        results.append(result)
+        if recurrent_layer.compiles_recurrence(cell):
+            # a single step copies the state, a step of a recurrence compiled by XLA scatters into it in place
+            layer = recurrent_layer.RecurrentLayer(cell, return_sequences=True)
+            recurrence = tf.function(lambda x, layer=layer: layer(x), jit_compile=True)
+            latencies = inference.measure_latencies(recurrence, (tf.transpose(inputs, [1, 0, 2]),), args.warmup_runs, args.runs)
+            result = inference.summarize_latencies(cell_name, 'step in recurrence', args.batch_size, latencies / args.steps)
+            result.update({'memory size': memory_size, 'max abs output difference': np.nan})
+            results.append(result)
+
+os.makedirs(args.result_folder_name, exist_ok=True)
+result_table = pd.DataFrame(results)
+result_table.to_csv(os.path.join(args.result_folder_name, 'dnc_step_latency.csv'), index=False)
+print(result_table.to_string())
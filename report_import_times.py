@@ -0,0 +1,63 @@
+import argparse
+import csv
+import os
+import re
+import subprocess
+import sys
+import time
+
+import experiments.benchmarks.benchmark as benchmark
+
+HEAVY_MODULES = ['tensorflow', 'tensorflow_probability', 'kerasncp', 'pandas', 'matplotlib']
+IMPORT_TIME_PATTERN = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--python_executable_name', default='python3.8', type=str)
+parser.add_argument('--result_folder_name', default='results', type=str)
+parser.add_argument('--top_imports', default=10, type=int)
+parser.add_argument('--max_startup_duration', default=-1, type=float)
+args = parser.parse_args()
+
+
+def get_entry_points():
+    entry_points = [(f'{x}_benchmark --h', ['-m', f'experiments.benchmarks.{x}_benchmark', '--h']) for x in benchmark.BENCHMARK_NAMES]
+    entry_points.append(('import model_factory', ['-c', 'import experiments.models.model_factory']))
+    return entry_points
+
+
+def parse_import_times(output):
+    import_times = []
+    for line in output.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        if match:
+            self_time, cumulative_time, indentation, module_name = match.groups()
+            import_times.append((module_name, int(self_time) / 1E6, int(cumulative_time) / 1E6, (len(indentation) - 1) // 2))
+    return import_times
+
+
+results = []
+for entry_point_name, entry_point_arguments in get_entry_points():
+    start = time.perf_counter()
+    completed_process = subprocess.run([args.python_executable_name, '-X', 'importtime'] + entry_point_arguments, capture_output=True, text=True)
+    startup_duration = time.perf_counter() - start
+    import_times = parse_import_times(completed_process.stderr)
+    top_level_imports = sorted([x for x in import_times if x[3] == 0], key=lambda x: x[2], reverse=True)
+    imported_heavy_modules = [x for x in HEAVY_MODULES if any(y[0] == x for y in import_times)]
+    results.append({'entry point': entry_point_name,
+                    'return code': completed_process.returncode,
+                    'startup duration [s]': startup_duration,
+                    'import duration [s]': sum(x[2] for x in top_level_imports),
+                    'heavy modules': ' '.join(imported_heavy_modules),
+                    'top imports': ' '.join(f'{x[0]}={x[2]:.3f}s' for x in top_level_imports[:args.top_imports])})
+    print(f'{entry_point_name}: {startup_duration:.3f}s (heavy modules: {", ".join(imported_heavy_modules) or "none"})')
+    for module_name, _, cumulative_time, _ in top_level_imports[:args.top_imports]:
+        print(f'    {cumulative_time:8.3f}s {module_name}')
+
+os.makedirs(args.result_folder_name, exist_ok=True)
+with open(os.path.join(args.result_folder_name, 'import_times.csv'), 'w', newline='') as result_file:
+    writer = csv.DictWriter(result_file, fieldnames=list(results[0]))
+    writer.writeheader()
+    writer.writerows(results)
+
+if args.max_startup_duration >= 0 and any(x['startup duration [s]'] > args.max_startup_duration for x in results):
+    sys.exit(f'startup duration exceeded {args.max_startup_duration}s')
@@ -8,17 +8,31 @@ import experiments.models.model_factory as model_factory
 parser = argparse.ArgumentParser()
 parser.add_argument('--cuda_visible_devices', default='', type=str)
 parser.add_argument('--result_folder_name', default='results', type=str)
+parser.add_argument('--run_name', default='default', type=str)
 parser.add_argument('--python_executable_name', default='python3.8', type=str)
+parser.add_argument('--single_process', default=False, type=bool)
 args = parser.parse_args()
 
 os.environ['CUDA_VISIBLE_DEVICES'] = args.cuda_visible_devices
 
 for benchmark_name in benchmark.BENCHMARK_NAMES:
+    pending_models = []
     for model_argument in model_factory.MODEL_ARGUMENTS:
         if not os.path.exists(os.path.join(os.path.curdir, args.result_folder_name, benchmark_name, model_argument, 'training.csv')):
             if benchmark_name == 'cell' and model_argument != 'memory_cell':
                 continue
             if benchmark_name != 'cell' and model_argument == 'memory_cell':
                 continue
-            subprocess.run([f'{args.python_executable_name}', '-m', f'experiments.benchmarks.{benchmark_name}_benchmark',
-                            '--model', f'{model_argument}', '--result_folder_name', f'{args.result_folder_name}'], check=True)
+            pending_models.append(model_argument)
+    if args.single_process and pending_models:
+        # one process builds the data of the benchmark once and trains all pending models on the same partition
+        subprocess.run([f'{args.python_executable_name}', '-m', f'experiments.benchmarks.{benchmark_name}_benchmark',
+                        '--models', ','.join(pending_models), '--result_folder_name', f'{args.result_folder_name}', '--run_name', f'{args.run_name}'], check=True)
+        continue
+    for model_argument in pending_models:
+        subprocess.run([f'{args.python_executable_name}', '-m', f'experiments.benchmarks.{benchmark_name}_benchmark',
+                        '--model', f'{model_argument}', '--result_folder_name', f'{args.result_folder_name}', '--run_name', f'{args.run_name}'], check=True)
+
+# the merged tables and plots are materialised once from the result store instead of after every model
+subprocess.run([f'{args.python_executable_name}', 'aggregate_results.py', '--result_folder_name', f'{args.result_folder_name}',
+                '--run_name', f'{args.run_name}', '--render_plots', 'True'], check=True)
@@ -0,0 +1,111 @@
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import random
+import subprocess
+
+import pandas as pd
+
+import experiments.benchmarks.benchmark as benchmark
+import experiments.models.model_factory as model_factory
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--benchmark', default='walker', type=str)
+parser.add_argument('--model', default='ct_rnn', type=str)
+parser.add_argument('--trials', default=27, type=int)
+parser.add_argument('--min_epochs', default=4, type=int)
+parser.add_argument('--max_epochs', default=128, type=int)
+parser.add_argument('--reduction_factor', default=3, type=int)
+parser.add_argument('--workers', default=4, type=int)
+parser.add_argument('--seed', default=0, type=int)
+parser.add_argument('--sweep_folder_name', default='sweeps', type=str)
+parser.add_argument('--cuda_visible_devices', default='', type=str)
+parser.add_argument('--python_executable_name', default='python3.8', type=str)
+args = parser.parse_args()
+
+assert args.benchmark in benchmark.BENCHMARK_NAMES
+assert args.model in model_factory.MODEL_REGISTRY
+assert args.reduction_factor > 1
+
+os.environ['CUDA_VISIBLE_DEVICES'] = args.cuda_visible_devices
+sweep_folder = os.path.join(args.sweep_folder_name, args.benchmark, args.model)
+os.makedirs(sweep_folder, exist_ok=True)
+
+
+def sample_configs(search_space, trials, seed):
+    grid_size = math.prod(len(x) for x in search_space.values())
+    random_generator = random.Random(seed)
+    configs = []
+    while len(configs) < min(trials, grid_size):
+        config = {name: random_generator.choice(values) for name, values in search_space.items()}
+        if config not in configs:
+            configs.append(config)
+    return configs
+
+
+def get_trial_folder(trial):
+    return os.path.join(sweep_folder, f'trial_{trial}')
+
+
+def load_trial_state(trial):
+    # read directly instead of through experiments.benchmarks.callbacks, which would import tensorflow into the sweep process
+    state_path = os.path.join(get_trial_folder(trial), 'checkpoints', args.benchmark, args.model, 'training_state', 'training_state.json')
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path) as state_file:
+        return json.load(state_file)
+
+
+def run_trial(trial, config, epochs):
+    trial_folder = get_trial_folder(trial)
+    completed_process = subprocess.run([f'{args.python_executable_name}', '-m', f'experiments.benchmarks.{args.benchmark}_benchmark',
+                                        '--model', f'{args.model}', '--model_config', json.dumps(config), '--epochs', f'{epochs}', '--seed', f'{args.seed}',
+                                        '--saved_model_folder_name', os.path.join(trial_folder, 'saved_models'),
+                                        '--tensorboard_folder_name', os.path.join(trial_folder, 'tensorboard'),
+                                        '--result_folder_name', os.path.join(trial_folder, 'results'),
+                                        '--visualization_folder_name', os.path.join(trial_folder, 'visualizations'),
+                                        '--export_folder_name', os.path.join(trial_folder, 'exports'),
+                                        '--checkpoint_folder_name', os.path.join(trial_folder, 'checkpoints')])
+    return load_trial_state(trial) if completed_process.returncode == 0 else None
+
+
+def get_trial_result(trial, config, rung, epochs, training_state):
+    if training_state is None:
+        return {'trial': trial, 'rung': rung, 'epoch budget': epochs, 'completed': True, 'best validation loss': math.inf, 'config': json.dumps(config)}
+    return {'trial': trial,
+            'rung': rung,
+            'epoch budget': epochs,
+            'trained epochs': training_state['epoch'],
+            'stopped early': training_state['stopped'],
+            'completed': training_state['stopped'] or epochs >= args.max_epochs,
+            'best validation loss': min(training_state['history']['val_loss']),
+            'training duration': training_state['training_duration'],
+            'config': json.dumps(config)}
+
+
+# synchronous successive halving, trials that stop early keep their last result and are not trained further
+configs = sample_configs(model_factory.MODEL_REGISTRY[args.model].search_space, args.trials, args.seed)
+active_trials = list(range(len(configs)))
+finished_results = {}
+results = []
+rung, epochs = 0, min(args.min_epochs, args.max_epochs)
+with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+    while active_trials:
+        training_states = dict(zip(active_trials, executor.map(lambda x: run_trial(x, configs[x], epochs), active_trials)))
+        rung_results = {x: get_trial_result(x, configs[x], rung, epochs, training_states[x]) for x in active_trials}
+        results.extend(rung_results.values())
+        pd.DataFrame(results).to_csv(os.path.join(sweep_folder, 'sweep_results.csv'), index=False)
+        for trial, trial_result in rung_results.items():
+            if trial_result['completed']:
+                finished_results[trial] = trial_result
+        candidates = sorted([x for x in active_trials if x not in finished_results], key=lambda x: rung_results[x]['best validation loss'])
+        active_trials = candidates[:max(1, len(candidates) // args.reduction_factor)]
+        for trial in candidates[len(active_trials):]:
+            finished_results[trial] = rung_results[trial]
+        rung, epochs = rung + 1, min(epochs * args.reduction_factor, args.max_epochs)
+
+final_table = pd.DataFrame(finished_results.values()).sort_values(['completed', 'epoch budget', 'best validation loss'], ascending=[False, False, True])
+final_table.to_csv(os.path.join(sweep_folder, 'sweep_summary.csv'), index=False)
+print(final_table.to_string(index=False))
@@ -0,0 +1,75 @@
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+import experiments.models.differentiable_neural_computer as dnc
+import experiments.models.recurrent_layer as recurrent_layer
+
+
+def plain_gather_rows(memory_matrix, indices):
+    return tf.gather(memory_matrix, indices, batch_dims=1), memory_matrix
+
+
+class LeastRecentlyUsedListTest(unittest.TestCase):
+    def assert_valid_list(self, next_slots, previous_slots, memory_size):
+        forward, backward = [next_slots[memory_size]], [previous_slots[memory_size]]
+        while len(forward) <= memory_size and forward[-1] != memory_size:
+            forward.append(next_slots[forward[-1]])
+            backward.append(previous_slots[backward[-1]])
+        self.assertEqual(sorted(forward[:-1]), list(range(memory_size)))
+        self.assertEqual(forward[:-1], backward[-2::-1])
+        return forward[:-1]
+
+    def test_least_recently_used_slot(self):
+        rng = np.random.default_rng(0)
+        for memory_size in (1, 2, 5, 40):
+            batch_size = 3
+            next_slots, previous_slots, least_recently_used = dnc.LeastRecentlyUsedList.initial_state(batch_size, memory_size)
+            last_access = np.zeros((batch_size, memory_size))
+            for step in range(1, 40):
+                # accessed slots can repeat and include the least recently used slot like the writes of SparseDNC
+                accessed_slots = np.concatenate([rng.integers(0, memory_size, (batch_size, 6)),
+                                                 least_recently_used.numpy().astype(int)], 1)
+                next_slots, previous_slots, least_recently_used = dnc.LeastRecentlyUsedList.move_to_back(
+                    next_slots, previous_slots, tf.constant(accessed_slots, tf.int32))
+                for batch in range(batch_size):
+                    last_access[batch, accessed_slots[batch]] = step
+                    order = self.assert_valid_list(next_slots.numpy()[batch].astype(int), previous_slots.numpy()[batch].astype(int), memory_size)
+                    self.assertTrue(np.all(np.diff(last_access[batch, order]) >= 0))
+                    self.assertEqual(least_recently_used.numpy()[batch, 0], order[0])
+
+
+class SparseDNCTest(unittest.TestCase):
+    def test_gather_rows_gradients(self):
+        inputs = tf.random.normal((4, 12, 5), seed=0)
+        for lsh_tables in (0, 2):
+            layer = tf.keras.layers.RNN(dnc.SparseDNC(3, 16, 64, 8, 2, 4, lsh_tables, 3, 8), return_sequences=True)
+            layer(inputs)
+
+            def get_gradients():
+                with tf.GradientTape() as tape:
+                    loss = tf.reduce_sum(tf.square(layer(inputs)))
+                return tape.gradient(loss, layer.trainable_variables)
+
+            gradients = get_gradients()
+            gather_rows = dnc.gather_rows
+            dnc.gather_rows = plain_gather_rows
+            try:
+                plain_gradients = get_gradients()
+            finally:
+                dnc.gather_rows = gather_rows
+            for gradient, plain_gradient in zip(gradients, plain_gradients):
+                np.testing.assert_allclose(gradient.numpy(), plain_gradient.numpy(), rtol=1e-4, atol=1e-6)
+
+    def test_same_outputs_with_xla(self):
+        inputs = tf.random.normal((4, 20, 5), seed=0)
+        layer = recurrent_layer.RecurrentLayer(dnc.SparseDNC(3, 16, 64, 8, 2, 4, 2, 3, 8, jit_compile=True), return_sequences=True)
+        inputs_model = tf.keras.Input((20, 5))
+        self.assertTrue(recurrent_layer.requires_jit_compile(tf.keras.Model(inputs_model, layer(inputs_model))))
+        outputs = tf.function(layer)(inputs)
+        np.testing.assert_allclose(tf.function(layer, jit_compile=True)(inputs).numpy(), outputs.numpy(), rtol=1e-4, atol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
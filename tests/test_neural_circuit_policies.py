@@ -0,0 +1,39 @@
+import unittest
+
+import kerasncp as ncp
+import numpy as np
+import tensorflow as tf
+
+import experiments.models.model_factory as model_factory
+import experiments.models.neural_circuit_policies as neural_circuit_policies
+
+
+def create_wiring():
+    # the wiring draws its synapses from a fixed seed, so that both cells get the same wiring
+    return ncp.wirings.NCP(6, 4, 2, 2, 2, 8, 2)
+
+
+class SparseLTCCellTest(unittest.TestCase):
+    def assert_same_outputs(self, inputs):
+        dense_layer = tf.keras.layers.RNN(neural_circuit_policies.LTCCell(create_wiring()), return_sequences=True)
+        sparse_layer = tf.keras.layers.RNN(neural_circuit_policies.SparseLTCCell(create_wiring()), return_sequences=True)
+        dense_outputs = dense_layer(inputs)
+        sparse_layer(inputs)
+        sparse_layer.set_weights(dense_layer.get_weights())
+        np.testing.assert_allclose(sparse_layer(inputs).numpy(), dense_outputs.numpy(), rtol=1e-4, atol=1e-5)
+
+    def test_same_outputs_as_ltc_cell(self):
+        self.assert_same_outputs(tf.random.normal((3, 10, 5), seed=0))
+
+    def test_same_outputs_as_ltc_cell_with_elapsed_time(self):
+        self.assert_same_outputs((tf.random.normal((3, 10, 5), seed=0), tf.random.uniform((3, 10, 1), 0.5, 2.0, seed=1)))
+
+    def test_models_build_with_sparse_wiring(self):
+        inputs = tf.keras.Input((10, 5), batch_size=3)
+        for model_name in ('neural_circuit_policies', 'unitary_ncp'):
+            model = tf.keras.Model(inputs, model_factory.get_model_output_by_name(model_name, 2, (inputs,), {'sparse_wiring': True}))
+            self.assertEqual(model(tf.zeros((3, 10, 5))).shape, (3, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+import experiments.models.ct_gru as ct_gru
+import experiments.models.recurrent_layer as recurrent_layer
+import experiments.models.unitary_rnn as urnn
+
+
+def create_layers(create_cell, **kwargs):
+    layer = recurrent_layer.RecurrentLayer(create_cell(), return_sequences=True, **kwargs)
+    # the segments do not divide the sequence length, so that the last segment is shorter
+    remat_layer = recurrent_layer.RecurrentLayer(create_cell(), remat_segment_length=3, return_sequences=True, **kwargs)
+    return layer, remat_layer
+
+
+def get_outputs_and_gradients(layer, inputs, initial_state=None):
+    initial_states = tf.nest.flatten(initial_state) if initial_state is not None else []
+    with tf.GradientTape() as tape:
+        tape.watch(initial_states)
+        outputs = layer(inputs, initial_state=initial_state)
+        loss = sum(tf.reduce_sum(tf.square(tf.math.abs(x))) for x in tf.nest.flatten(outputs))
+    return outputs, tape.gradient(loss, layer.trainable_variables + initial_states)
+
+
+class RematerialisationTest(unittest.TestCase):
+    def assert_same_outputs_and_gradients(self, layer, remat_layer, inputs, initial_state=None):
+        layer(inputs, initial_state=initial_state)
+        remat_layer(inputs, initial_state=initial_state)
+        remat_layer.set_weights(layer.get_weights())
+        # graph mode runs the recomputation ordered by the gradients of the segment outputs
+        for run in (get_outputs_and_gradients, tf.function(get_outputs_and_gradients)):
+            outputs, gradients = run(layer, inputs, initial_state)
+            remat_outputs, remat_gradients = run(remat_layer, inputs, initial_state)
+            for output, remat_output in zip(tf.nest.flatten(outputs), tf.nest.flatten(remat_outputs)):
+                np.testing.assert_allclose(remat_output.numpy(), output.numpy(), rtol=1e-4, atol=1e-5)
+            self.assertEqual(len(remat_gradients), len(gradients))
+            for gradient, remat_gradient in zip(gradients, remat_gradients):
+                np.testing.assert_allclose(tf.convert_to_tensor(remat_gradient).numpy(), tf.convert_to_tensor(gradient).numpy(), rtol=1e-4, atol=1e-5)
+
+    def test_same_outputs_and_gradients_as_without_segments(self):
+        layer, remat_layer = create_layers(lambda: ct_gru.CTGRU(8, precompute_inputs=True))
+        self.assert_same_outputs_and_gradients(layer, remat_layer, tf.random.normal((2, 10, 3), seed=0))
+
+    def test_same_outputs_and_gradients_with_complex_states(self):
+        layer, remat_layer = create_layers(lambda: urnn.EUNNCell(8, 2, precompute_inputs=True))
+        self.assertTrue(layer.cell.get_initial_state(batch_size=2).dtype.is_complex)
+        self.assert_same_outputs_and_gradients(layer, remat_layer, tf.random.normal((2, 10, 3), seed=0))
+
+    def test_same_outputs_and_gradients_with_initial_state(self):
+        layer, remat_layer = create_layers(lambda: ct_gru.CTGRU(8, precompute_inputs=True), return_state=True)
+        initial_state = tf.nest.map_structure(lambda x: tf.random.normal(x.shape, seed=1), layer.cell.get_initial_state(batch_size=2, dtype=tf.float32))
+        self.assert_same_outputs_and_gradients(layer, remat_layer, tf.random.normal((2, 10, 3), seed=0), initial_state)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+import experiments.models.model_factory as model_factory
+import experiments.models.streaming as streaming
+
+
+def stream(model, frames):
+    streaming_model = streaming.StreamingModel(model, batch_size=frames[0].shape[0])
+    return np.stack([streaming_model.step(tuple(x[:, time_step] for x in frames) if len(frames) > 1 else frames[0][:, time_step]).numpy()
+                     for time_step in range(frames[0].shape[1])], 1)
+
+
+class StreamingModelTest(unittest.TestCase):
+    def test_same_outputs_as_predict_with_layers_before_recurrent_layer(self):
+        inputs = tf.keras.Input((10, 3), batch_size=2)
+        outputs = tf.keras.layers.Dense(2)(tf.keras.layers.LSTM(8, return_sequences=True)(tf.keras.layers.Dense(4, activation='tanh')(inputs)))
+        model = tf.keras.Model(inputs, outputs)
+        sequences = np.random.default_rng(0).normal(size=(2, 10, 3)).astype(np.float32)
+        np.testing.assert_allclose(stream(model, [sequences]), model.predict(sequences, verbose=0), rtol=1e-4, atol=1e-5)
+
+    def test_same_outputs_as_predict_with_time_input(self):
+        # the lstm model concatenates the inputs with the elapsed times before its recurrent layer
+        inputs = (tf.keras.Input((10, 3), batch_size=2), tf.keras.Input((10, 1), batch_size=2))
+        model = tf.keras.Model(inputs, model_factory.get_model_output_by_name('lstm', 2, inputs))
+        rng = np.random.default_rng(0)
+        sequences = [rng.normal(size=(2, 10, 3)).astype(np.float32), rng.uniform(0.5, 2.0, (2, 10, 1)).astype(np.float32)]
+        np.testing.assert_allclose(stream(model, sequences)[:, -1], model.predict(sequences, verbose=0), rtol=1e-4, atol=1e-5)
+
+    def test_same_outputs_as_predict_without_layers_before_recurrent_layer(self):
+        inputs = tf.keras.Input((10, 3), batch_size=2)
+        model = tf.keras.Model(inputs, model_factory.get_model_output_by_name('ct_gru', 2, (inputs,)))
+        sequences = np.random.default_rng(0).normal(size=(2, 10, 3)).astype(np.float32)
+        np.testing.assert_allclose(stream(model, [sequences])[:, -1], model.predict(sequences, verbose=0), rtol=1e-4, atol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()